@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""codegen - construct a document from a generated module
+
+Compares GMLBuilder.add_from_file() with the caches cleared before
+every run, with the parse tree and program cached, and importing the
+module written by gml.codegen from its .pyc and calling build().
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import cache, config
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _on_clicked(button):
+    pass
+
+
+def best_of(repeat, func, setup=None):
+    best = None
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        t = timer()
+        func()
+        t = timer() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(args):
+    parser = optparse.OptionParser(usage="%prog [options] [FILE]")
+    parser.add_option("-d", "--depth", type="int", default=3,
+                      dest="depth", help="Levels of boxes")
+    parser.add_option("-f", "--fanout", type="int", default=12,
+                      dest="fanout", help="Children per box")
+    parser.add_option("-r", "--repeat", type="int", default=10,
+                      dest="repeat", help="Runs, the best one is reported")
+    parser.add_option("-b", "--backend", dest="backend",
+                      help="Bindings used to construct, default fake")
+    options, args = parser.parse_args(args)
+
+    config.backend = (options.backend or os.environ.get('GML_BACKEND') or
+                      'fake')
+    # Only the in-memory caches are measured
+    config.use_cache = False
+    from gml import codegen
+    from gml.builder import GMLBuilder
+
+    path = tempfile.mkdtemp()
+    sys.path.insert(0, path)
+    try:
+        filename = os.path.join(path, 'document.gml')
+        if len(args) > 1:
+            shutil.copy(args[1], filename)
+            n_objects = None
+        else:
+            from synthetic import generate
+            source, n_objects = generate(
+                depth=options.depth, fanout=options.fanout, properties=4,
+                signals=0.3, references=0.2, packing=0.5)
+            with open(filename, 'w') as fp:
+                fp.write(source)
+        # The byte-compiled module is up to date, importing it does
+        # not compile the source again
+        codegen.compile_file(filename)
+        signals = {'on_clicked': _on_clicked}
+
+        def clear_caches():
+            cache.memory_cache.clear()
+            cache.program_cache.clear()
+
+        def add_from_file():
+            builder = GMLBuilder()
+            builder.signals = signals
+            builder.add_from_file(filename)
+
+        def unload():
+            sys.modules.pop('document', None)
+
+        def import_build():
+            import document
+            document.build(signals)
+
+        import document
+
+        def build():
+            document.build(signals)
+
+        results = [
+            ('add_from_file, cold', best_of(options.repeat, add_from_file,
+                                            clear_caches)),
+            ('add_from_file, cached', best_of(options.repeat,
+                                              add_from_file)),
+            ('import and build()', best_of(options.repeat, import_build,
+                                           unload)),
+            ('build()', best_of(options.repeat, build)),
+            ]
+    finally:
+        sys.path.remove(path)
+        shutil.rmtree(path)
+
+    if n_objects is not None:
+        print('%d objects' % (n_objects, ))
+    base = results[0][1]
+    print('%-24s %10s %8s' % ('', 'time', 'speedup'))
+    for name, t in results:
+        print('%-24s %9.2fms %7.2fx' % (name, t * 1000, base / t))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
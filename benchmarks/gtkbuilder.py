@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""gtkbuilder - construct documents through Gtk.Builder
+
+Compares GMLBuilder running the compiled programs with
+GMLBuilder(native=True) loading the translated XML, for the
+scenarios of the suite. The parse trees, programs and translations
+are cached, the first run of each builder fills the caches and is
+reported as cold.
+
+The fake backend loads the XML in Python, the numbers are only
+meaningful with -b gi.
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import cache, config
+from synthetic import generate
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _on_clicked(button):
+    pass
+
+
+def measure(source, native, repeat):
+    # Returns the time of the first run and of the best of the others
+    from gml.builder import GMLBuilder
+    times = []
+    for i in range(repeat + 1):
+        t = timer()
+        builder = GMLBuilder(native=native)
+        builder.signals['on_clicked'] = _on_clicked
+        builder.add_from_string(source)
+        times.append(timer() - t)
+    return times[0], min(times[1:])
+
+
+def main(args):
+    from suite import SCENARIOS
+    parser = optparse.OptionParser()
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      dest="repeat", help="Runs, the best one is reported")
+    parser.add_option("-s", "--scenario", action="append", default=[],
+                      dest="scenarios", help="Only run this scenario")
+    parser.add_option("-b", "--backend", dest="backend",
+                      help="Bindings used to construct, default fake")
+    options, args = parser.parse_args(args)
+
+    config.backend = (options.backend or os.environ.get('GML_BACKEND') or
+                      'fake')
+    config.use_cache = False
+
+    print('%-12s %7s %10s %10s %10s %10s %8s' % (
+        'scenario', 'objects', 'cold', 'native', 'warm', 'native',
+        'speedup'))
+    for name, params in SCENARIOS:
+        if options.scenarios and name not in options.scenarios:
+            continue
+        source, n_objects = generate(**params)
+        cache.memory_cache.clear()
+        cache.program_cache.clear()
+        cache.xml_cache.clear()
+        cold, warm = measure(source, False, options.repeat)
+        native_cold, native_warm = measure(source, True, options.repeat)
+        print('%-12s %7d %8.1fms %8.1fms %8.1fms %8.1fms %7.2fx' % (
+            name, n_objects, cold * 1000, native_cold * 1000,
+            warm * 1000, native_warm * 1000, warm / native_warm))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
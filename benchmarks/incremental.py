@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""incremental - edit a large document, compared to parsing it again"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml.incremental import Document
+from gml.parser import GMLParser
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                       'gtk2-demo.gml')
+
+
+def scale_source(filename, n_lines):
+    source = open(filename).read()
+    copies = max(n_lines // source.count('\n'), 1)
+    return '\n'.join([source] * copies)
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-l", "--lines", type="int", default=50000,
+                      dest="lines", help="Lines in the document")
+    parser.add_option("-e", "--edits", type="int", default=1000,
+                      dest="edits", help="Number of edits")
+    options, args = parser.parse_args(args)
+
+    source = scale_source(args[1] if len(args) > 1 else EXAMPLE,
+                          options.lines)
+    t = time.time()
+    GMLParser().parse(StringIO(source))
+    full = time.time() - t
+
+    doc = Document(source)
+    random.seed(0)
+    strings = []
+    pos = source.find('"')
+    while pos != -1:
+        strings.append(pos + 1)
+        pos = source.find('"', source.find('"', pos + 1) + 1)
+    # Type a word into a random string, then delete it again
+    times = []
+    word = 'hello'
+    for i in range(options.edits // (len(word) * 2)):
+        pos = random.choice(strings)
+        for j in range(len(word)):
+            t = time.time()
+            doc.edit(pos + j, pos + j, word[j])
+            times.append(time.time() - t)
+        for j in range(len(word), 0, -1):
+            t = time.time()
+            doc.edit(pos + j - 1, pos + j, '')
+            times.append(time.time() - t)
+    times.sort()
+
+    print('%d lines, %d bytes, %d edits' % (
+        source.count('\n') + 1, len(source), len(times)))
+    print('full parse  %9.3fms' % (full * 1000, ))
+    print('edit median %9.3fms' % (times[len(times) // 2] * 1000, ))
+    print('edit p99    %9.3fms' % (times[len(times) * 99 // 100] * 1000, ))
+    print('edit max    %9.3fms' % (times[-1] * 1000, ))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""lexer - compare the GML lexer with the stdlib tokenize front end"""
+
+import glob
+import optparse
+import os
+import sys
+import time
+import tokenize
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml.lexer import Token, generate_tokens
+from gml.parser import GMLParser
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def count_objects(objects):
+    n = 0
+    for obj in objects:
+        n += 1 + count_objects(obj.children)
+    return n
+
+
+def scale_source(filename, n_objects):
+    source = open(filename).read()
+    ns = GMLParser().parse(StringIO(source))
+    per_copy = max(count_objects(ns.objects), 1)
+    copies = (n_objects + per_copy - 1) // per_copy
+    return '\n'.join([source] * copies), copies * per_copy
+
+
+def stdlib_tokens(fp):
+    # The front end GMLParser used before it got its own lexer
+    tokens = []
+    for kind, value, start, end, raw in tokenize.generate_tokens(fp.readline):
+        v = value.strip()
+        if v == "" or v in '\n' or v.startswith('#'):
+            continue
+        tokens.append(Token(kind, value, start, end))
+    return tokens
+
+
+def gml_tokens(fp):
+    return list(generate_tokens(fp.readline))
+
+
+def best_of(func, source, repeat):
+    best = None
+    for i in range(repeat):
+        fp = StringIO(source)
+        t = time.time()
+        func(fp)
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-n", "--objects", type="int", default=10000,
+                      dest="objects", help="Objects per document")
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      dest="repeat", help="Runs, the best one is reported")
+    options, args = parser.parse_args(args)
+
+    filenames = args[1:] or sorted(glob.glob(os.path.join(EXAMPLES, '*.gml')))
+    print('%-20s %8s %8s %10s %10s %8s' % (
+        'file', 'objects', 'tokens', 'tokenize', 'lexer', 'speedup'))
+    for filename in filenames:
+        source, n_objects = scale_source(filename, options.objects)
+        n_tokens = len(gml_tokens(StringIO(source)))
+        old = best_of(stdlib_tokens, source, options.repeat)
+        new = best_of(gml_tokens, source, options.repeat)
+        print('%-20s %8d %8d %9.1fms %9.1fms %7.1fx' % (
+            os.path.basename(filename), n_objects, n_tokens,
+            old * 1000, new * 1000, old / new))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""memory - memory used by the parse tree, requires tracemalloc"""
+
+import glob
+import optparse
+import os
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import lexer, parser
+from gml.parser import GMLParser
+
+from io import StringIO
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+# The dict backed nodes the parser used to create, every object
+# allocated its three lists up front and names were not interned.
+class LegacyToken(object):
+    def __init__(self, kind, value, start, end):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+
+
+class LegacyObject(object):
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.properties = []
+        self.signals = []
+        self.is_property = False
+        self.child_type = None
+
+    def add_child(self, child):
+        self.children.append(child)
+
+    def add_property(self, prop):
+        self.properties.append(prop)
+
+    def add_signal(self, signal):
+        self.signals.append(signal)
+
+    json = parser.Object.json
+
+
+class LegacyProperty(object):
+    def __init__(self, name, value, kind):
+        self.name = name
+        self.value = value
+        self.kind = kind
+
+    json = parser.Property.json
+
+
+class LegacySignal(object):
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+
+    json = parser.Signal.json
+
+
+def no_intern(value):
+    return value
+
+
+LEGACY = [(lexer, 'intern', no_intern),
+          (lexer, 'Token', LegacyToken),
+          (parser, 'Token', LegacyToken),
+          (parser, 'Object', LegacyObject),
+          (parser, 'Property', LegacyProperty),
+          (parser, 'Signal', LegacySignal)]
+
+
+def count_objects(objects):
+    n = 0
+    for obj in objects:
+        n += 1 + count_objects(obj.children)
+    return n
+
+
+def scale_source(filename, n_objects):
+    source = open(filename).read()
+    ns = GMLParser().parse(StringIO(source))
+    per_copy = max(count_objects(ns.objects), 1)
+    copies = (n_objects + per_copy - 1) // per_copy
+    return '\n'.join([source] * copies), copies * per_copy
+
+
+def measure(source, legacy):
+    saved = [(module, name, getattr(module, name))
+             for module, name, cls in LEGACY]
+    if legacy:
+        for module, name, cls in LEGACY:
+            setattr(module, name, cls)
+    try:
+        tracemalloc.start()
+        ns = GMLParser().parse(StringIO(source))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+    return ns, current, peak
+
+
+def main(args):
+    option_parser = optparse.OptionParser()
+    option_parser.add_option("-n", "--objects", type="int", default=10000,
+                             dest="objects", help="Objects per document")
+    options, args = option_parser.parse_args(args)
+    if tracemalloc is None:
+        raise SystemExit("tracemalloc is unsupported on this Python")
+
+    filenames = args[1:] or sorted(glob.glob(os.path.join(EXAMPLES, '*.gml')))
+    print('%-20s %8s %8s %16s %16s %8s' % (
+        'file', 'objects', 'source', 'dict tree/peak', 'slots tree/peak',
+        'saved'))
+    for filename in filenames:
+        source, n_objects = scale_source(filename, options.objects)
+        old_ns, old_current, old_peak = measure(source, True)
+        new_ns, new_current, new_peak = measure(source, False)
+        if ([o.json() for o in old_ns.objects] !=
+            [o.json() for o in new_ns.objects]):
+            raise SystemExit("json() output differs for %s" % (filename, ))
+        scale = 10000.0 / n_objects / 1024
+        print('%-20s %8d %7dK %7dK/%7dK %7dK/%7dK %7.0f%%' % (
+            os.path.basename(filename), n_objects, len(source) / 1024,
+            old_current * scale, old_peak * scale,
+            new_current * scale, new_peak * scale,
+            100.0 - 100.0 * new_current / old_current))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
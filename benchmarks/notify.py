@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""notify - count the notifications emitted while constructing
+
+Constructs the documents of the benchmark suite with the fake backend
+and counts the property and child property sets, and the notify and
+child-notify emissions. The builder sets the properties of an object
+with its notifications frozen, so a property set several times is
+only notified once. Without batching, freeze and thaw do nothing.
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import config
+config.backend = 'fake'
+
+from gml import fake
+from gml.builder import GMLBuilder
+from suite import SCENARIOS
+from synthetic import generate
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _on_clicked(button):
+    pass
+
+
+class Counter(object):
+    # Counts the calls of the fake methods, and turns the freezing of
+    # notifications on and off
+    def __init__(self):
+        self.counts = {}
+        self._originals = []
+
+    def _wrap(self, cls, name, func):
+        self._originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, func)
+
+    def install(self, batch):
+        counts = self.counts
+        emit = fake.Object.emit
+        set_property = fake.Object.set_property
+        child_set_property = fake.Container.child_set_property
+
+        def counting_emit(obj, signal, *args):
+            if signal in ['notify', 'child-notify']:
+                counts[signal] = counts.get(signal, 0) + 1
+            return emit(obj, signal, *args)
+
+        def counting_set_property(obj, name, value):
+            counts['set'] = counts.get('set', 0) + 1
+            return set_property(obj, name, value)
+
+        def counting_child_set_property(container, child, name, value):
+            counts['child_set'] = counts.get('child_set', 0) + 1
+            return child_set_property(container, child, name, value)
+
+        self._wrap(fake.Object, 'emit', counting_emit)
+        self._wrap(fake.Object, 'set_property', counting_set_property)
+        self._wrap(fake.Container, 'child_set_property',
+                   counting_child_set_property)
+        if not batch:
+            def nothing(obj):
+                pass
+            for name in ['freeze_notify', 'thaw_notify']:
+                self._wrap(fake.Object, name, nothing)
+            for name in ['freeze_child_notify', 'thaw_child_notify']:
+                self._wrap(fake.Widget, name, nothing)
+
+    def uninstall(self):
+        while self._originals:
+            cls, name, func = self._originals.pop()
+            setattr(cls, name, func)
+
+
+def construct(source):
+    builder = GMLBuilder()
+    builder.signals['on_clicked'] = _on_clicked
+    builder.add_from_string(source)
+
+
+def measure(source, batch, repeat):
+    # Returns the counts of one construction and the best time
+    counter = Counter()
+    counter.install(batch)
+    try:
+        construct(source)
+    finally:
+        counter.uninstall()
+
+    best = None
+    for i in range(repeat):
+        t = timer()
+        construct(source)
+        t = timer() - t
+        if best is None or t < best:
+            best = t
+    return counter.counts, best
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      dest="repeat", help="Runs, the best one is reported")
+    parser.add_option("-s", "--scenario", action="append", default=[],
+                      dest="scenarios", help="Only run this scenario")
+    options, args = parser.parse_args(args)
+    config.use_cache = False
+
+    print('%-12s %7s %7s %9s %15s %15s %9s' % (
+        'scenario', 'sets', 'packing', 'time', 'notify', 'child-notify',
+        'saved'))
+    for name, params in SCENARIOS:
+        if options.scenarios and name not in options.scenarios:
+            continue
+        source, n_objects = generate(**params)
+        # The time is measured without the counting wrappers, which
+        # would slow the construction down.
+        before, t = measure(source, False, 0)
+        after, t = measure(source, True, options.repeat)
+        total_before = before.get('notify', 0) + before.get('child-notify', 0)
+        total_after = after.get('notify', 0) + after.get('child-notify', 0)
+        print('%-12s %7d %7d %7.1fms %7d->%-7d %7d->%-7d %8.1f%%' % (
+            name, after.get('set', 0), after.get('child_set', 0), t * 1000,
+            before.get('notify', 0), after.get('notify', 0),
+            before.get('child-notify', 0), after.get('child-notify', 0),
+            100.0 * (total_before - total_after) / max(total_before, 1)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""packing - cost of child properties when building a box
+
+The packing columns are the extra time per packed child, with the
+child properties of the box enumerated for every child as they used
+to be (uncached) and once per container type (cached). lookups are the
+calls to list_child_properties() in both cases.
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml.builder import GMLBuilder, Gtk, type_cache
+
+CHILD = 'GtkButton { label: "Row %d" %s }\n'
+PACKING = 'packing { expand: false; fill: false }'
+
+
+def generate(n_children, packing):
+    return 'GtkVBox {\n%s}\n' % (
+        ''.join([CHILD % (i, packing) for i in range(n_children)]), )
+
+
+def build(source, repeat):
+    best = None
+    for i in range(repeat):
+        builder = GMLBuilder()
+        t = time.time()
+        builder.add_from_string(source)
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def uncached_child_properties(container):
+    # What each packed child used to cost, the child properties of its
+    # container were enumerated again for every child.
+    child_properties = {}
+    for pspec in container.list_child_properties():
+        child_properties[pspec.name] = (
+            pspec, type_cache.get_parser(pspec.value_type))
+    return child_properties
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      dest="repeat", help="Runs, the best one is reported")
+    options, args = parser.parse_args(args)
+
+    # Repeated runs only measure construction, the parse trees are
+    # kept in the memory cache after the first one.
+    # Count the child property enumerations, they used to be done for
+    # every child and are now done once per container type.
+    calls = [0]
+    list_child_properties = Gtk.Container.list_child_properties
+
+    def counting_list_child_properties(self, *args):
+        calls[0] += 1
+        return list_child_properties(self, *args)
+    Gtk.Container.list_child_properties = counting_list_child_properties
+
+    print('%8s %10s %10s %10s %10s %10s %15s' % (
+        'children', 'plain', 'uncached', 'packing', 'cached', 'packing',
+        'lookups'))
+    for n_children in [10, 100, 1000, 5000]:
+        plain = build(generate(n_children, ''), options.repeat)
+        source = generate(n_children, PACKING)
+
+        type_cache.get_child_properties = uncached_child_properties
+        calls[0] = 0
+        try:
+            uncached = build(source, options.repeat)
+        finally:
+            del type_cache.get_child_properties
+        uncached_calls = calls[0]
+
+        type_cache.clear()
+        calls[0] = 0
+        cached = build(source, options.repeat)
+        print('%8d %8.2fms %8.2fms %8.2fus %8.2fms %8.2fus %15s' % (
+            n_children, plain * 1000,
+            uncached * 1000, (uncached - plain) * 1e6 / n_children,
+            cached * 1000, (cached - plain) * 1e6 / n_children,
+            '%d/%d' % (uncached_calls, calls[0])))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
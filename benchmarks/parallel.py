@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""parallel - parse many files with a growing pool of workers"""
+
+import glob
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import cache, config
+from gml.parser import GMLParser
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def count_objects(objects):
+    n = 0
+    for obj in objects:
+        n += 1 + count_objects(obj.children)
+    return n
+
+
+def write_files(path, n_files, n_objects):
+    filenames = []
+    sources = sorted(glob.glob(os.path.join(EXAMPLES, '*.gml')))
+    for i in range(n_files):
+        source_file = sources[i % len(sources)]
+        with open(source_file) as fp:
+            source = fp.read()
+            fp.seek(0)
+            per_copy = max(count_objects(GMLParser().parse(fp).objects), 1)
+        copies = (n_objects + per_copy - 1) // per_copy
+        filename = os.path.join(path, '%04d.gml' % (i, ))
+        with open(filename, 'w') as fp:
+            # Different contents for every file, like a real application
+            fp.write('# %d\n' % (i, ))
+            fp.write('\n'.join([source] * copies))
+        filenames.append(filename)
+    return filenames
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-f", "--files", type="int", default=300,
+                      dest="files", help="Number of files")
+    parser.add_option("-n", "--objects", type="int", default=500,
+                      dest="objects", help="Objects per file")
+    parser.add_option("-w", "--workers", default="1,auto,2,4,8",
+                      dest="workers",
+                      help="Comma separated pool sizes, auto for the default")
+    parser.add_option("-r", "--repeat", type="int", default=3,
+                      dest="repeat", help="Runs, the best one is reported")
+    parser.add_option("-c", "--cached", action="store_true", default=False,
+                      dest="cached",
+                      help="Load the files from their cache files instead")
+    options, args = parser.parse_args(args)
+
+    # Measure parsing, not loading cache files, unless asked to
+    config.use_cache = options.cached
+    path = tempfile.mkdtemp()
+    config.cache_dir = os.path.join(path, 'cache')
+    try:
+        filenames = write_files(path, options.files, options.objects)
+        if options.cached:
+            cache.compile_dir(path)
+        print('%d files, %d objects each, %d CPUs' % (
+            options.files, options.objects, cache._cpu_count()))
+        print('%8s %10s %10s %8s' % ('workers', 'time', 'files/s', 'speedup'))
+        base = None
+        for name in options.workers.split(','):
+            workers = None
+            if name != 'auto':
+                workers = int(name)
+            best = None
+            for i in range(options.repeat):
+                t = time.time()
+                cache.parse_files(filenames, workers)
+                t = time.time() - t
+                if best is None or t < best:
+                    best = t
+            if base is None:
+                base = best
+            print('%8s %9.1fms %10.0f %7.2fx' % (
+                name, best * 1000, len(filenames) / best, base / best))
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
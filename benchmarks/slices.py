@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""slices - measure the slices of add_from_file_async()
+
+Constructs the documents of the benchmark suite a slice at a time with
+the fake backend, once with nothing cached and once with the tree and
+the program in the memory cache, and reports the number of slices and
+the longest one. The documents of the suite are a single toplevel
+window, which is parsed in one slice. The toplevels document has the
+same buttons as the flat one, each of them a toplevel object.
+"""
+
+import optparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import cache, config
+config.backend = 'fake'
+
+from gml.builder import GMLBuilder, _Construction
+from suite import SCENARIOS
+from synthetic import generate
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def _on_clicked(button):
+    pass
+
+
+def toplevels(n):
+    return ''.join(['GtkButton { id: button%d; label: "Button %d" }\n' % (
+        i, i) for i in range(n)])
+
+
+def measure(filename, budget):
+    # Returns the duration of each slice
+    builder = GMLBuilder()
+    builder.signals['on_clicked'] = _on_clicked
+    construction = _Construction(builder, filename, None, None, budget)
+    slices = []
+    while True:
+        t = timer()
+        more = construction.step()
+        slices.append(timer() - t)
+        if not more:
+            return slices
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-b", "--budget", type="float",
+                      default=config.slice_budget * 1000, dest="budget",
+                      help="Budget of a slice in milliseconds")
+    parser.add_option("-s", "--scenario", action="append", default=[],
+                      dest="scenarios", help="Only run this scenario")
+    options, args = parser.parse_args(args)
+    config.use_cache = False
+    budget = options.budget / 1000.0
+
+    documents = [(name, generate(**params)[0]) for name, params in SCENARIOS]
+    documents.append(('toplevels', toplevels(2000)))
+    print('%-12s %9s %7s %9s %9s %7s %9s %9s' % (
+        'scenario', 'size', 'slices', 'longest', 'total', 'cached',
+        'longest', 'total'))
+    for name, source in documents:
+        if options.scenarios and name not in options.scenarios:
+            continue
+        fd, filename = tempfile.mkstemp(suffix='.gml')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(source)
+            cache.memory_cache.clear()
+            cache.program_cache.clear()
+            uncached = measure(filename, budget)
+            cached = measure(filename, budget)
+        finally:
+            os.unlink(filename)
+        print('%-12s %7dKB %7d %7.1fms %7.1fms %7d %7.1fms %7.1fms' % (
+            name, len(source) // 1024,
+            len(uncached), max(uncached) * 1000, sum(uncached) * 1000,
+            len(cached), max(cached) * 1000, sum(cached) * 1000))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""sources - compare the sources the parser takes
+
+Tokenizes and parses the synthetic mixed document read line by line
+from a file object, and scanned whole from a string, from bytes and
+from a mapped file.
+"""
+
+import io
+import optparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import cache
+from gml.lexer import source_tokens
+from gml.parser import GMLParser
+from suite import SCENARIOS
+from synthetic import generate
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def best_of(func, make_source, repeat):
+    best = None
+    for i in range(repeat):
+        source = make_source()
+        t = timer()
+        func(source)
+        t = timer() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def tokenize(source):
+    return list(source_tokens(source))
+
+
+def parse(source):
+    return GMLParser().parse(source)
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-c", "--copies", type="int", default=2,
+                      dest="copies", help="Copies of the mixed document")
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      dest="repeat", help="Runs, the best one is reported")
+    options, args = parser.parse_args(args)
+
+    source, n_objects = generate(**dict(SCENARIOS)['mixed'])
+    source = source * options.copies
+    data = source.encode('utf-8')
+    if str is bytes:
+        # Lines read from a file in text mode are byte strings
+        lines = lambda: io.BytesIO(data)
+    else:
+        lines = lambda: io.StringIO(source)
+
+    fd, filename = tempfile.mkstemp(suffix='.gml')
+    os.write(fd, data)
+    os.close(fd)
+    try:
+        with cache.mapped(filename) as mapped:
+            sources = [('lines', lines),
+                       ('str', lambda: source),
+                       ('bytes', lambda: data),
+                       ('mmap', lambda: mapped)]
+            print('%dKB, %d objects' % (len(data) // 1024,
+                                        n_objects * options.copies))
+            print('%-8s %10s %10s' % ('source', 'tokenize', 'parse'))
+            for name, make_source in sources:
+                print('%-8s %8.1fms %8.1fms' % (
+                    name,
+                    best_of(tokenize, make_source, options.repeat) * 1000,
+                    best_of(parse, make_source, options.repeat) * 1000))
+    finally:
+        os.unlink(filename)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""suite - time and memory of each phase on synthetic documents
+
+Every scenario is a document generated by synthetic.py. The phases
+are measured separately:
+
+  tokenize   the lexer alone, on the UTF-8 bytes of the document
+             as GMLBuilder.add_from_file() maps them
+  parse      tokenizing and building the parse tree
+  compile    turning the tree into a builder program
+  construct  running the program, including the fixups
+
+For each phase the best time of the runs is reported, and with
+tracemalloc (Python 3) the blocks and bytes still allocated at the
+end of the phase and the peak memory during it. Construction uses
+the fake backend unless another one is asked for.
+
+The results can be written as JSON with -o and compared with a
+previous run with -c; the exit status is 1 if any phase got slower
+or used more memory than the threshold allows.
+"""
+
+import gc
+import json
+import optparse
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml import config
+from synthetic import generate
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+timer = getattr(time, 'perf_counter', time.time)
+
+FORMAT_VERSION = 1
+PHASES = ['tokenize', 'parse', 'compile', 'construct']
+SCENARIOS = [
+    ('flat', dict(depth=1, fanout=2000)),
+    ('deep', dict(depth=11, fanout=2)),
+    ('properties', dict(depth=2, fanout=40, properties=8)),
+    ('signals', dict(depth=2, fanout=40, signals=1.0)),
+    ('references', dict(depth=2, fanout=40, references=1.0)),
+    ('packing', dict(depth=2, fanout=40, packing=1.0)),
+    ('mixed', dict(depth=3, fanout=12, properties=4, signals=0.3,
+                   references=0.2, packing=0.5)),
+    ]
+
+
+def _on_clicked(button):
+    pass
+
+
+def phases(source):
+    """Returns (name, setup, run) for each phase of source, run is
+    called with the arguments returned by setup.
+    """
+    from gml.builder import GMLBuilder
+    from gml.compiler import GMLCompiler
+    from gml.lexer import scan_tokens
+    from gml.parser import GMLParser
+
+    def new_builder():
+        builder = GMLBuilder()
+        builder.signals['on_clicked'] = _on_clicked
+        return builder
+
+    data = source.encode('utf-8')
+    ns = GMLParser().parse(data)
+    for import_ in ns.imports:
+        new_builder()._import(import_)
+    program = GMLCompiler(new_builder()).compile(ns.objects)
+
+    def tokenize(data):
+        return list(scan_tokens(data))
+
+    def parse(data):
+        return GMLParser().parse(data)
+
+    def compile_(builder):
+        return GMLCompiler(builder).compile(ns.objects)
+
+    def construct(builder):
+        builder._execute(program)
+        builder._apply_fixups()
+        return builder
+
+    return [('tokenize', lambda: (data, ), tokenize),
+            ('parse', lambda: (data, ), parse),
+            ('compile', lambda: (new_builder(), ), compile_),
+            ('construct', lambda: (new_builder(), ), construct)]
+
+
+def measure(setup, run, repeat):
+    best = None
+    for i in range(repeat):
+        args = setup()
+        gc.collect()
+        t = timer()
+        run(*args)
+        t = timer() - t
+        if best is None or t < best:
+            best = t
+    result = {'time': best, 'blocks': None, 'memory': None, 'peak': None}
+    if tracemalloc is None:
+        return result
+
+    args = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = run(*args)
+        snapshot = tracemalloc.take_snapshot()
+        memory, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del value
+    result['blocks'] = sum([stat.count for stat in
+                            snapshot.statistics('filename')])
+    result['memory'] = memory
+    result['peak'] = peak
+    return result
+
+
+def run_suite(names, repeat):
+    scenarios = {}
+    for name, params in SCENARIOS:
+        if names and name not in names:
+            continue
+        source, n_objects = generate(**params)
+        results = {}
+        for phase, setup, run in phases(source):
+            results[phase] = measure(setup, run, repeat)
+        scenarios[name] = {'params': params,
+                           'objects': n_objects,
+                           'bytes': len(source),
+                           'phases': results}
+    return {'version': FORMAT_VERSION,
+            'python': platform.python_version(),
+            'backend': config.backend,
+            'repeat': repeat,
+            'scenarios': scenarios}
+
+
+def _format_size(size):
+    if size is None:
+        return '-'
+    return '%.0fK' % (size / 1024.0, )
+
+
+def print_results(results):
+    print('%-12s %8s %-10s %10s %10s %9s %9s' % (
+        'scenario', 'objects', 'phase', 'time', 'per object', 'memory',
+        'peak'))
+    for name, params in SCENARIOS:
+        scenario = results['scenarios'].get(name)
+        if scenario is None:
+            continue
+        for phase in PHASES:
+            result = scenario['phases'][phase]
+            print('%-12s %8d %-10s %8.2fms %8.2fus %9s %9s' % (
+                name, scenario['objects'], phase, result['time'] * 1000,
+                result['time'] * 1e6 / scenario['objects'],
+                _format_size(result['memory']),
+                _format_size(result['peak'])))
+
+
+def _format_change(change):
+    if change is None:
+        return '-'
+    return '%+.0f%%' % (change, )
+
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return 100.0 * (new - old) / old
+
+
+def compare(old, new, threshold):
+    """Print the changes from the results old to new, returns the
+    number of regressions above threshold percent.
+    """
+    regressions = 0
+    for key in ['python', 'backend']:
+        if old[key] != new[key]:
+            print('Warning: %s %s, was %s' % (key, new[key], old[key]))
+    print('%-12s %-10s %10s %10s %8s %8s' % (
+        'scenario', 'phase', 'old', 'new', 'time', 'peak'))
+    for name, params in SCENARIOS:
+        if name not in old['scenarios'] or name not in new['scenarios']:
+            continue
+        old_scenario = old['scenarios'][name]
+        new_scenario = new['scenarios'][name]
+        if old_scenario['params'] != new_scenario['params']:
+            print('%-12s parameters differ, skipped' % (name, ))
+            continue
+        for phase in PHASES:
+            old_result = old_scenario['phases'][phase]
+            new_result = new_scenario['phases'][phase]
+            changes = [_change(old_result[key], new_result[key])
+                       for key in ['time', 'peak']]
+            regressed = [change for change in changes
+                         if change is not None and change > threshold]
+            regressions += bool(regressed)
+            print('%-12s %-10s %8.2fms %8.2fms %8s %8s%s' % (
+                (name, phase, old_result['time'] * 1000,
+                 new_result['time'] * 1000) +
+                tuple([_format_change(change) for change in changes]) +
+                (regressed and '  REGRESSION' or '', )))
+    return regressions
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-r", "--repeat", type="int", default=5,
+                      dest="repeat", help="Runs, the best one is reported")
+    parser.add_option("-s", "--scenario", action="append", default=[],
+                      dest="scenarios", help="Only run this scenario")
+    parser.add_option("-b", "--backend", dest="backend",
+                      help="Bindings used to construct, default fake")
+    parser.add_option("-o", "--output", dest="output",
+                      help="Write the results as JSON to this file")
+    parser.add_option("-i", "--input", dest="input",
+                      help="Read the results from this file instead of "
+                      "running the suite")
+    parser.add_option("-c", "--compare", dest="compare",
+                      help="Compare with the results in this file")
+    parser.add_option("-t", "--threshold", type="float", default=10.0,
+                      dest="threshold",
+                      help="Allowed slowdown or memory growth, in percent")
+    options, args = parser.parse_args(args)
+
+    if options.input:
+        with open(options.input) as fp:
+            results = json.load(fp)
+    else:
+        config.backend = (options.backend or os.environ.get('GML_BACKEND') or
+                          'fake')
+        names = options.scenarios
+        unknown = set(names) - set([name for name, params in SCENARIOS])
+        if unknown:
+            parser.error("unknown scenario: %s" % (', '.join(unknown), ))
+        results = run_suite(names, options.repeat)
+        print_results(results)
+
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as fp:
+            baseline = json.load(fp)
+        if options.input is None:
+            print('')
+        if compare(baseline, results, options.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""synthetic - generate GML documents of a given shape
+
+A document is a GtkWindow holding a tree of boxes, depth levels deep
+with fanout children per box, the last level are buttons. The other
+parameters are the number of properties of each button, and the
+fraction of the buttons with a signal, with a dotted reference to the
+window title and with packing. The features are spread evenly over
+the buttons, the same parameters always give the same document.
+"""
+
+import optparse
+import sys
+
+# Button properties, in the order they are added
+PROPERTIES = [
+    ('label', '"Button %(n)d"'),
+    ('name', '"button%(n)d"'),
+    ('sensitive', 'true'),
+    ('visible', 'true'),
+    ('use_underline', 'false'),
+    ('width_request', '%(n)d'),
+    ('height_request', '24'),
+    ('events', 'button_press_mask|key_press_mask'),
+    ]
+
+SIGNAL = 'clicked:: on_clicked'
+REFERENCE = 'tooltip_text: window.title'
+PACKING = 'packing { expand: false; fill: true; padding: 2 }'
+
+
+def _spread(fraction, n):
+    # True for about fraction of the indexes, evenly spaced
+    return int((n + 1) * fraction) > int(n * fraction)
+
+
+class Generator(object):
+    def __init__(self, depth=3, fanout=10, properties=2, signals=0.0,
+                 references=0.0, packing=0.0):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        if properties > len(PROPERTIES):
+            raise ValueError("at most %d properties" % (len(PROPERTIES), ))
+        self.depth = depth
+        self.fanout = fanout
+        self.properties = properties
+        self.signals = signals
+        self.references = references
+        self.packing = packing
+        self.n_objects = 0
+        self._lines = None
+        self._n_buttons = 0
+
+    def generate(self):
+        """Returns the source of the document"""
+        self._lines = []
+        self._n_buttons = 0
+        self.n_objects = 1
+        self._lines.append('GtkWindow {')
+        self._lines.append('  id: window')
+        self._lines.append('  title: "Synthetic"')
+        self._box(1, 1)
+        self._lines.append('}')
+        source = '\n'.join(self._lines) + '\n'
+        self._lines = None
+        return source
+
+    def _box(self, level, indent):
+        prefix = '  ' * indent
+        self.n_objects += 1
+        self._lines.append(prefix + 'GtkVBox {')
+        for i in range(self.fanout):
+            if level < self.depth:
+                self._box(level + 1, indent + 1)
+            else:
+                self._button(indent + 1)
+        self._lines.append(prefix + '}')
+
+    def _button(self, indent):
+        n = self._n_buttons
+        self._n_buttons += 1
+        self.n_objects += 1
+        statements = ['%s: %s' % (name, value % {'n': n})
+                      for name, value in PROPERTIES[:self.properties]]
+        if _spread(self.signals, n):
+            statements.append(SIGNAL)
+        if _spread(self.references, n):
+            statements.append(REFERENCE)
+        if _spread(self.packing, n):
+            statements.append(PACKING)
+        prefix = '  ' * indent
+        if statements:
+            self._lines.append('%sGtkButton { %s }' % (
+                prefix, '; '.join(statements)))
+        else:
+            self._lines.append(prefix + 'GtkButton')
+
+
+def generate(**params):
+    """Returns the source and the number of objects of a document,
+    params are the arguments of Generator.
+    """
+    generator = Generator(**params)
+    source = generator.generate()
+    return source, generator.n_objects
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-d", "--depth", type="int", default=3,
+                      dest="depth", help="Levels of boxes")
+    parser.add_option("-f", "--fanout", type="int", default=10,
+                      dest="fanout", help="Children per box")
+    parser.add_option("-p", "--properties", type="int", default=2,
+                      dest="properties", help="Properties per button")
+    parser.add_option("-s", "--signals", type="float", default=0.0,
+                      dest="signals", help="Fraction of buttons with a signal")
+    parser.add_option("-r", "--references", type="float", default=0.0,
+                      dest="references",
+                      help="Fraction of buttons with a dotted reference")
+    parser.add_option("-k", "--packing", type="float", default=0.0,
+                      dest="packing", help="Fraction of buttons with packing")
+    options, args = parser.parse_args(args)
+
+    source, n_objects = generate(
+        depth=options.depth, fanout=options.fanout,
+        properties=options.properties, signals=options.signals,
+        references=options.references, packing=options.packing)
+    sys.stdout.write(source)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""tokens - check that tokenizing and parsing scale linearly"""
+
+import gc
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gml.parser import GMLParser
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# 12 tokens per object
+SNIPPET = 'GtkButton { id: b%d; label: "Label"; visible: true }\n'
+TOKENS_PER_OBJECT = 12
+
+
+class StackParser(GMLParser):
+    # The token store GMLParser used to have, a reversed list that
+    # every token is inserted at the front of. The whole document
+    # was tokenized before parsing started.
+    def iterparse(self, fp):
+        self.tokenize(fp)
+        return GMLParser.iterparse(self, StringIO())
+
+    def feed(self, token):
+        self._tokens.insert(0, token)
+
+    def _pop_token(self):
+        if self._tokens:
+            return self._tokens.pop()
+
+    def _peek_token(self, offset=0):
+        if len(self._tokens) > offset:
+            return self._tokens[-1 - offset]
+
+
+def generate(n_tokens):
+    return ''.join([SNIPPET % (i, )
+                    for i in range(n_tokens // TOKENS_PER_OBJECT)])
+
+
+def run(parser_type, source):
+    # Like timeit, keep the cyclic garbage collector out of the
+    # measurement, it walks every live token and would hide the
+    # behaviour of the token store.
+    parser = parser_type()
+    gc.disable()
+    try:
+        t = time.time()
+        parser.parse(StringIO(source))
+        return time.time() - t
+    finally:
+        gc.enable()
+
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--max", type="int", default=1000000,
+                      dest="max", help="Largest number of tokens")
+    parser.add_option("-s", "--stack-max", type="int", default=100000,
+                      dest="stack_max",
+                      help="Largest number of tokens for the old store")
+    options, args = parser.parse_args(args)
+
+    print('%10s %10s %10s %12s %12s' % (
+        'tokens', 'time', 'us/token', 'old time', 'old us/token'))
+    n_tokens = 1000
+    while n_tokens <= options.max:
+        source = generate(n_tokens)
+        new = run(GMLParser, source)
+        line = '%10d %9.1fms %10.2f' % (
+            n_tokens, new * 1000, new * 1e6 / n_tokens)
+        if n_tokens <= options.stack_max:
+            old = run(StackParser, source)
+            line += ' %11.1fms %12.2f' % (old * 1000, old * 1e6 / n_tokens)
+        print(line)
+        n_tokens *= 10
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,53 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Backend - the GLib, GObject and Gtk modules selected by config.backend"""
+
+from . import config
+
+if config.backend == 'fake':
+    from .fake import GLib, GObject, Gtk
+elif config.backend == 'pygtk':
+    import glib as GLib
+    import gobject as GObject
+    import gtk as Gtk
+elif config.backend == 'gi':
+    from gi.repository import GLib, GObject, Gtk
+else:
+    raise Exception("Unknown backend: %r" % (config.backend, ))
+
+
+def list_child_properties(gtype):
+    """Returns the child property pspecs of the container type gtype,
+    they are read from its class without creating an instance.
+    """
+    if config.backend == 'pygtk':
+        return Gtk.container_class_list_child_properties(gtype)
+    return Gtk.ContainerClass.list_child_properties(gtype.pytype)
+
+
+def import_module(name):
+    """Returns the module of the library name, eg Clutter"""
+    if config.backend == 'fake':
+        from . import fake
+        return getattr(fake, name)
+    elif config.backend == 'pygtk':
+        return __import__(name.lower())
+    else:
+        return getattr(__import__('gi.repository', fromlist=[name]), name)
@@ -19,141 +19,460 @@
 
 """Builder - runtime, construct objects from a parser tree."""
 
-import StringIO
+import os
+from itertools import islice
 
-from .config import use_pygtk
-from .parser import (Object, GMLParser, TYPE_STRING, TYPE_IDENTIFIER,
-                     TYPE_BOOLEAN, TYPE_NUMBER, TYPE_OBJECT)
+from . import backend, cache, config, gtkbuilder
+from .backend import GLib, GObject, Gtk
+from .compiler import (GMLCompiler, type_cache, is_reference_type,
+                       split_reference, NEW, GET, SET, CONNECT, ADD_CHILD,
+                       LAZY)
+from .lexer import scan_tokens
+from .parser import (Namespace, Object, GMLParser, TYPE_STRING,
+                     TYPE_IDENTIFIER, TYPE_BOOLEAN, TYPE_NUMBER, TYPE_OBJECT)
+from .stats import timer
 
-if use_pygtk:
-    import gobject as GObject
-    import gtk as Gtk
-else:
-    from gi.repository import GObject, Gtk
+# The stats phase of each opcode, the packing set by ADD_CHILD is
+# recorded as child_set
+_phase_names = ['new', 'get', 'set', 'connect', 'add_child', 'lazy']
 
+# Instructions executed between two looks at the clock when
+# constructing in slices
+_slice_step = 8
+# Tokens scanned between two looks at the clock
+_slice_tokens = 256
 
-class DelayedProperty(Exception):
-    pass
+
+class _LazyObject(object):
+    __slots__ = ('program', 'parent', 'ids', 'handler_id')
+
+    def __init__(self, program, parent, ids):
+        self.program = program
+        self.parent = parent
+        self.ids = ids
+        self.handler_id = None
+
+
+class _Construction(object):
+    # A file being constructed by add_from_file_async(), step() is
+    # the main loop source running _work() for a slice.
+    #
+    # A file which is not cached is tokenized a few hundred tokens at
+    # a time, then each toplevel object is parsed and compiled in a
+    # slice of its own, so a single large toplevel object still takes
+    # a long slice. The program is executed _slice_step instructions
+    # at a time.
+
+    def __init__(self, builder, filename, callback, progress, budget):
+        self.builder = builder
+        self.filename = filename
+        self.callback = callback
+        self.progress = progress
+        self.budget = budget
+        # The fixups of this file, other files can be added between
+        # two slices and must not apply them before it is complete
+        self.fixups = []
+        self._steps = self._work()
+
+    def _read(self, st):
+        # Generates the progress while reading, sets self.ns and
+        # self.key when done.
+        builder = self.builder
+        stats = builder.stats
+        with open(self.filename, 'rb') as fp:
+            data = fp.read()
+        n_lines = data.count(b'\n') + 1
+        tokens = []
+        scanner = scan_tokens(data)
+        while True:
+            if stats is not None:
+                t = timer()
+            n_tokens = len(tokens)
+            tokens.extend(islice(scanner, _slice_tokens))
+            if stats is not None:
+                stats.add_time('tokenize', timer() - t)
+            if len(tokens) == n_tokens:
+                break
+            yield 0.5 * tokens[-1].start[0] / n_lines
+
+        ns = Namespace()
+        for node in GMLParser(stats).iterparse(tokens):
+            if isinstance(node, Object):
+                ns.objects.append(node)
+            else:
+                ns.imports.append(node)
+            yield 0.5
+        key = cache.digest(data)
+        _cache_file(self.filename, st, ns, key, stats)
+        self.ns = ns
+        self.key = key
+
+    def _work(self):
+        # Generates the fraction of the work done after each step,
+        # reading the file counts for half of it.
+        builder = self.builder
+        st = os.stat(self.filename)
+        self.ns, self.key = _cached_file(self.filename, st, builder.stats)
+        read = 0.0
+        if self.ns is None:
+            for done in self._read(st):
+                yield done
+            read = 0.5
+        ns = self.ns
+        builder._files[self.filename] = ns
+        for import_ in ns.imports:
+            builder._import(import_)
+
+        key = (self.key, builder.lazy)
+        entry = cache.program_cache.get(key)
+        if entry is not None and entry[0] is ns:
+            programs = [entry[1]]
+        else:
+            programs = []
+            for obj in ns.objects:
+                programs.append(builder._compile_objects([obj]))
+                yield read
+            if len(programs) == 1:
+                # The same as the program of the whole file
+                cache.program_cache.put(key, (ns, programs[0]))
+
+        total = sum([len(program.instructions) for program in programs])
+        position = 0
+        for program in programs:
+            slots = [None] * program.n_slots
+            slot_times = None
+            if builder.stats is not None:
+                slot_times = [0.0] * program.n_slots
+            instructions = program.instructions
+            for i in range(0, len(instructions), _slice_step):
+                step = instructions[i:i + _slice_step]
+                builder._run(step, slots, slot_times)
+                position += len(step)
+                yield read + (1.0 - read) * position / total
+            builder._finish(program, slots, slot_times)
+        builder._apply_fixups()
+
+    def step(self):
+        deadline = timer() + self.budget
+        builder = self.builder
+        fixups = builder._fixups
+        builder._fixups = self.fixups
+        try:
+            # At least one step per slice, however small the budget
+            for done in self._steps:
+                if timer() >= deadline:
+                    break
+            else:
+                done = None
+        finally:
+            self.fixups = builder._fixups
+            builder._fixups = fixups
+
+        if done is not None:
+            if self.progress is not None:
+                self.progress(done)
+            return True
+        if self.progress is not None:
+            self.progress(1.0)
+        if self.callback is not None:
+            self.callback(builder)
+        return False
 
 
 class GMLBuilder(object):
-    def __init__(self):
+    """Constructs the objects of GML documents.
+
+    If lazy is true, toplevel objects with an id are only constructed
+    when get_by_name() first asks for them or for one of their
+    children, like objects marked with lazy: true. A lazy child is
+    constructed at the latest when its parent is realized.
+
+    stats is a gml.stats.Stats recording the time spent in each phase,
+    or None to not measure anything.
+
+    If native is true, documents are translated into GtkBuilder XML
+    and constructed by Gtk.Builder, see gml.gtkbuilder. Documents
+    which can not be translated, lazy builders and
+    add_from_file_async() use the compiled programs instead.
+    """
+
+    def __init__(self, lazy=False, stats=None, native=False):
         self._fake_builder = Gtk.Builder()
         self._objects = {}
-        self._property_parsers = {}
+        self._lazy_objects = {}
+        # Parser node -> object, and filename -> tree, for reloading
+        self._instances = {}
+        self._files = {}
+        self.lazy = lazy
+        self.stats = stats
+        self.native = native
         self.signals = {}
-        self._delayed_properties = []
+        # Object -> ids of the handlers connected to it, the application
+        # may connect the same functions itself
+        self._handler_ids = {}
+        # (slots, fixups) of the programs executed, applied once the
+        # whole document is constructed
+        self._fixups = []
 
-        self._register_property_parsers()
+    def _execute(self, program, parent=None):
+        slots = [None] * program.n_slots
+        if parent is not None:
+            slots[0] = parent
+        slot_times = None
+        if self.stats is not None:
+            slot_times = [0.0] * program.n_slots
+        self._run(program.instructions, slots, slot_times)
+        self._finish(program, slots, slot_times)
+        return slots
 
-    def _register_property_parsers(self):
-        self._property_parsers[GObject.TYPE_BOOLEAN] = self._parse_property_bool
-        self._property_parsers[GObject.TYPE_INT] = self._parse_property_int
-        self._property_parsers[GObject.TYPE_UINT] = self._parse_property_int
-        self._property_parsers[GObject.TYPE_STRING] = self._parse_property_string
-        self._property_parsers[GObject.TYPE_ENUM] = self._parse_property_enum
-        self._property_parsers[GObject.TYPE_OBJECT] = self._parse_property_object
-        self._property_parsers[GObject.TYPE_INTERFACE] = self._parse_property_object
+    def _run(self, instructions, slots, slot_times):
+        objects = self._objects
+        stats = self.stats
+        for instruction in instructions:
+            if stats is not None:
+                t = timer()
+            op = instruction[0]
+            if op == NEW:
+                op, slot, gtype, properties, dynamic, obj_id = instruction
+                if dynamic:
+                    properties = dict(properties)
+                    for name, value_slot, path in dynamic:
+                        value = slots[value_slot]
+                        for part in path:
+                            value = getattr(value.props, part)
+                        properties[name] = value
+                inst = GObject.new(gtype, **properties)
+                slots[slot] = inst
+                if obj_id is None:
+                    obj_id = str(hash(inst))
+                objects[obj_id] = inst
+                if stats is not None:
+                    stats.add_type(gtype.name, timer() - t)
+            elif op == ADD_CHILD:
+                op, parent_slot, slot, child_type, packing = instruction
+                parent = slots[parent_slot]
+                child = slots[slot]
+                if not packing:
+                    Gtk.Buildable.add_child(parent, self._fake_builder, child,
+                                            child_type)
+                else:
+                    # Adding can notify child properties too, they are
+                    # only notified once.
+                    child.freeze_child_notify()
+                    try:
+                        Gtk.Buildable.add_child(parent, self._fake_builder,
+                                                child, child_type)
+                        if stats is not None:
+                            t_packing = timer()
+                        self._set_packing(parent, child, packing)
+                    finally:
+                        child.thaw_child_notify()
+                    if stats is not None:
+                        packing_time = timer() - t_packing
+                        stats.add_time('child_set', packing_time)
+                        t += packing_time
+            elif op == CONNECT:
+                op, slot, signal, handler = instruction
+                self._connect(slots[slot], signal, handler)
+            elif op == GET:
+                op, slot, parent_slot, name = instruction
+                inst = getattr(slots[parent_slot].props, name, None)
+                if inst is None:
+                    raise Exception("Property %r is not set" % (name, ))
+                slots[slot] = inst
+            elif op == SET:
+                op, slot, properties = instruction
+                inst = slots[slot]
+                if len(properties) == 1:
+                    self._set_properties(inst, slot, properties, slots)
+                else:
+                    inst.freeze_notify()
+                    try:
+                        self._set_properties(inst, slot, properties, slots)
+                    finally:
+                        inst.thaw_notify()
+            elif op == LAZY:
+                op, slot, parent_slot, lazy_program, ids = instruction
+                lazy_parent = None
+                if parent_slot is not None:
+                    lazy_parent = slots[parent_slot]
+                lazy = _LazyObject(lazy_program, lazy_parent, ids)
+                slots[slot] = lazy
+                for obj_id in ids:
+                    self._lazy_objects[obj_id] = lazy
+                if lazy_parent is not None:
+                    lazy.handler_id = lazy_parent.connect(
+                        'realize', self._on_parent_realize, lazy)
+            else:
+                raise Exception("Unknown opcode: %r" % (op, ))
+            if stats is not None:
+                elapsed = timer() - t
+                stats.add_time(_phase_names[op], elapsed)
+                if op != SET:
+                    slot_times[slot] += elapsed
 
-    def _construct_object(self, obj, parent=None):
-        if parent is not None:
-            inst = getattr(parent.props, obj.name, None)
-        else:
-            inst = None
-        if inst:
-            obj_type = inst.__gtype__
+    def _connect(self, inst, signal, handler):
+        handler_id = inst.connect(signal, self.signals[handler])
+        handler_ids = self._handler_ids.get(inst)
+        if handler_ids is None:
+            self._handler_ids[inst] = [handler_id]
         else:
-            obj_type = GObject.type_from_name(obj.name)
+            handler_ids.append(handler_id)
 
-        obj_id = None
+    def _set_properties(self, inst, slot, properties, slots):
+        stats = self.stats
+        nodes = None
+        if stats is not None:
+            nodes = stats.nodes
+        for name, value_slot, prop in properties:
+            if nodes is not None:
+                t = timer()
+            if value_slot is not None:
+                inst.set_property(name, slots[value_slot])
+            else:
+                pspec, parser = type_cache.get_property(inst.__gtype__, name)
+                if (prop.kind == TYPE_IDENTIFIER and
+                    is_reference_type(pspec.value_type)):
+                    reference = (None,) + split_reference(prop.value)
+                    self._fixups.append(
+                        (slots, ((slot, (), name, reference, prop),)))
+                else:
+                    inst.set_property(
+                        name, self._convert_property(pspec, parser, prop))
+            if nodes is not None:
+                stats.add_node(prop, timer() - t)
 
-        # Properties
-        properties = {}
-        delayed_properties = []
-        for prop in obj.properties:
-            name = prop.name
-            if name == 'id':
-                obj_id = prop.value
-                continue
+    def _set_packing(self, parent, child, packing):
+        stats = self.stats
+        nodes = None
+        if stats is not None:
+            nodes = stats.nodes
+        child_properties = type_cache.get_child_properties(parent)
+        for prop in packing:
+            if nodes is not None:
+                t = timer()
+            pspec, parser = child_properties[prop.name]
+            parent.child_set_property(
+                child, prop.name, self._convert_property(pspec, parser, prop))
+            if nodes is not None:
+                stats.add_node(prop, timer() - t)
 
-            if name == 'child_type':
-                obj.child_type = prop.value
-                continue
-            if isinstance(prop.value, Object):
-                prop.value = self._construct_object(prop.value)
+    def _finish(self, program, slots, slot_times):
+        if program.fixups:
+            self._fixups.append((slots, program.fixups))
+        instances = self._instances
+        for node, inst in zip(program.nodes, slots):
+            if node is not None and inst is not None:
+                instances[node] = inst
+        if slot_times is not None:
+            self._add_object_times(program, slot_times)
 
-            if '.' in name:
-                delayed_properties.append(prop)
-            else:
-                pspec = getattr(obj_type.pytype.props, name)
-                try:
-                    properties[name] = self._parse_property(pspec, prop)
-                except DelayedProperty:
-                    delayed_properties.append(prop)
-
-        if inst is None:
-            inst = GObject.new(obj_type, **properties)
-            if obj_id is None:
-                obj_id = str(hash(obj))
-            self._objects[obj_id] = inst
+    def _add_object_times(self, program, slot_times):
+        stats = self.stats
+        for node, seconds in zip(program.nodes, slot_times):
+            if node is not None:
+                stats.add_object(node.name, _object_id(node), seconds)
+                if stats.nodes is not None:
+                    stats.add_node(node, seconds)
 
-            if parent is not None and not obj.is_property:
-                Gtk.Buildable.add_child(parent, self._fake_builder,
-                                        inst, obj.child_type)
-        else:
-            for name, value in properties.items():
-                inst.set_property(name, value)
-
-        # Signals
-        for signal in obj.signals:
-            inst.connect(signal.name, self.signals[signal.handler])
-
-        # Children
-        if isinstance(inst, Gtk.Container):
-            for child in obj.children:
-                properties = self._extract_child_properties(child)
-                child_inst = self._construct_object(child, inst)
-                child_pspecs = self._get_child_pspecs(inst)
-                for prop in properties:
-                    pspec = child_pspecs[prop.name]
-                    value = self._parse_property(pspec, prop)
-                    inst.child_set_property(child_inst, prop.name, value)
-
-        # Delayed_properties
-        for prop in delayed_properties:
-            self._delayed_properties.append((inst, prop))
-        return inst
-
-    def _extract_child_properties(self, obj):
-        for child in obj.children[:]:
-            if child.name == 'packing':
-                obj.children.remove(child)
-                return child.properties
-        return []
-
-    def _get_child_pspecs(self, inst):
-        pspecs = {}
-        for pspec in inst.list_child_properties():
-            pspecs[pspec.name] = pspec
-        return pspecs
-
-    def _apply_delayed_properties(self):
-        for inst, prop in self._delayed_properties:
-            if '.' in prop.name:
-                parts = prop.name.split('.')
-                start = parts[0]
-                for part in parts[:-1]:
-                    inst = getattr(inst.props, part)
-                prop_name = parts[-1]
-            else:
-                prop_name = prop.name
-            pspec = getattr(inst.__class__.props, prop_name)
-            if GObject.type_is_a(pspec.value_type, GObject.TYPE_OBJECT):
-                value = self._objects[prop.value]
-            else:
-                value = self._parse_property(pspec, prop)
+    def _on_parent_realize(self, parent, lazy):
+        self._construct_lazy(lazy)
+
+    def _discard_lazy(self, lazy):
+        for obj_id in lazy.ids:
+            if self._lazy_objects.get(obj_id) is lazy:
+                del self._lazy_objects[obj_id]
+        if lazy.handler_id is not None:
+            lazy.parent.disconnect(lazy.handler_id)
+            lazy.handler_id = None
 
-            inst.set_property(prop_name, value)
+    def _construct_lazy(self, lazy):
+        self._discard_lazy(lazy)
+        # The lazy object can be asked for while other objects are
+        # being constructed, keep their fixups for later.
+        fixups = self._fixups
+        self._fixups = []
+        self._execute(lazy.program, lazy.parent)
+        self._apply_fixups()
+        self._fixups = fixups
+
+    def _apply_fixups(self):
+        fixups = self._fixups
+        self._fixups = []
+        if not fixups:
+            return
+        stats = self.stats
+        if stats is not None:
+            t = timer()
+            nodes = stats.nodes
+
+        # Each object is set once, with notify frozen if there are
+        # several properties, in the order its first fixup comes in.
+        # An object set through a path is looked up when its turn
+        # comes, the fixups before it can change what the path leads
+        # to.
+        targets = []
+        groups = {}
+        for slots, program_fixups in fixups:
+            for slot, path, name, reference, prop in program_fixups:
+                key = (id(slots), slot, path)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = []
+                    targets.append((slots, slot, path, group))
+                group.append((name, reference, prop))
+
+        for slots, slot, path, group in targets:
+            inst = slots[slot]
+            for part in path:
+                inst = getattr(inst.props, part)
+            frozen = len(group) > 1
+            if frozen:
+                inst.freeze_notify()
+            try:
+                for name, reference, prop in group:
+                    if stats is not None and nodes is not None:
+                        t_prop = timer()
+                    if reference is not None:
+                        value_slot, obj_id, value_path = reference
+                        if value_slot is not None:
+                            value = slots[value_slot]
+                        else:
+                            value = self._lookup(obj_id)
+                        for part in value_path:
+                            value = getattr(value.props, part)
+                    else:
+                        value = self._convert_fixup(inst, name, prop)
+                    inst.set_property(name, value)
+                    if (stats is not None and nodes is not None and
+                        prop is not None):
+                        stats.add_node(prop, timer() - t_prop)
+            finally:
+                if frozen:
+                    inst.thaw_notify()
+        if stats is not None:
+            stats.add_time('fixup', timer() - t)
+
+    def _convert_fixup(self, inst, name, prop):
+        pspec, parser = type_cache.get_property(inst.__gtype__, name)
+        if (prop.kind == TYPE_IDENTIFIER and
+            is_reference_type(pspec.value_type)):
+            return self._resolve(prop.value)
+        return self._convert_property(pspec, parser, prop)
+
+    def _lookup(self, obj_id):
+        obj = self.get_by_name(obj_id)
+        if obj is None:
+            raise Exception("Unknown object: %r" % (obj_id, ))
+        return obj
+
+    def _resolve(self, value):
+        # b1.parent.name -> the name of the parent of b1
+        obj_id, path = split_reference(value)
+        obj = self._lookup(obj_id)
+        for part in path:
+            obj = getattr(obj.props, part)
+        return obj
 
     def _parse_property_bool(self, pspec, prop):
         if prop.kind != TYPE_BOOLEAN:
@@ -180,22 +499,56 @@ class GMLBuilder(object):
         except ValueError:
             raise Exception("Invalid integer propety value: %r" % (value, ))
 
+    def _lookup_enum_value(self, pspec, value):
+        values = type_cache.get_enum_values(pspec.value_type)
+        try:
+            return values[value]
+        except KeyError:
+            pass
+
+        # Qualified, GtkPolicyType.automatic or Gtk.PolicyType.automatic,
+        # remember it so that the next lookup is a single one.
+        if '.' not in value:
+            raise Exception(value)
+        enum, nick = value.rsplit('.', 1)
+        enum_type = type_cache.get_type(enum.replace('.', ''))
+        if not GObject.type_is_a(enum_type, pspec.value_type):
+            raise Exception("%s is not a %s" % (
+                value, GObject.type_name(pspec.value_type)))
+        try:
+            result = type_cache.get_enum_values(enum_type)[nick]
+        except KeyError:
+            raise Exception(value)
+        values[value] = result
+        return result
+
     def _parse_property_enum(self, pspec, prop):
         if prop.kind != TYPE_IDENTIFIER:
             raise Exception("Invalid enum property value: %r" % (
                 prop.value, ))
 
+        return self._lookup_enum_value(pspec, prop.value)
+
+    def _parse_property_flags(self, pspec, prop):
+        if prop.kind != TYPE_IDENTIFIER:
+            raise Exception("Invalid flags property value: %r" % (
+                prop.value, ))
+
         value = prop.value
-        if '.' in value:
-            enum, value = value.split(".", 1)
-            enum_type = GObject.type_from_name(enum)
-        else:
-            enum_type = pspec.value_type
-        for e in enum_type.pytype.__enum_values__.values():
-            if e.value_nick == value:
-                return e
+        if '|' not in value:
+            return self._lookup_enum_value(pspec, value)
 
-        raise Exception(value)
+        values = type_cache.get_enum_values(pspec.value_type)
+        result = values.get(value)
+        if result is None:
+            for part in value.split('|'):
+                flag = self._lookup_enum_value(pspec, part)
+                if result is None:
+                    result = flag
+                else:
+                    result = result | flag
+            values[value] = result
+        return result
 
     def _parse_property_string(self, pspec, prop):
         value = prop.value
@@ -205,19 +558,7 @@ class GMLBuilder(object):
             raise Exception("Invalid string property value: %r" % (
                 prop.value, ))
 
-        if "." in value:
-            parts = value.split(".")
-            obj_name = parts[0]
-        else:
-            parts = []
-            obj_name = value
-        obj = self.get_by_name(obj_name)
-        if obj is None:
-            raise Exception("Invalid string property value: %r" % (
-                prop.value, ))
-        for part in parts[1:]:
-            obj = getattr(obj.props, part)
-        return obj
+        return self._resolve(value)
 
     def _parse_property_object(self, pspec, prop):
         if prop.kind not in [TYPE_IDENTIFIER, TYPE_OBJECT]:
@@ -228,23 +569,20 @@ class GMLBuilder(object):
         if isinstance(value, GObject.GObject):
             return value
         elif isinstance(value, str):
-            raise DelayedProperty
+            return self._resolve(value)
         else:
             raise Exception(value)
 
-    def _parse_property(self, pspec, prop):
-        value_type = pspec.value_type
-        while True:
-            parser = self._property_parsers.get(value_type, None)
-            if parser is not None:
-                return parser(pspec, prop)
+    def _convert_property(self, pspec, parser, prop):
+        if parser is None:
+            raise NotImplementedError(pspec.value_type)
+        if self.stats is not None:
+            self.stats.add_conversion(parser)
+        return parser(self, pspec, prop)
 
-            try:
-                value_type = GObject.type_parent(value_type)
-            except RuntimeError:
-                break
-
-        raise NotImplementedError(pspec.value_type)
+    def _parse_property(self, pspec, prop):
+        parser = type_cache.get_parser(pspec.value_type)
+        return self._convert_property(pspec, parser, prop)
 
     def _import(self, import_):
         # FIXME: Proper import system
@@ -252,40 +590,366 @@ class GMLBuilder(object):
         if name == 'Gtk':
             self.signals["gtk_main_quit"] = Gtk.main_quit
         elif name == 'Clutter':
-            if use_pygtk:
-                import clutter as Clutter
-            else:
-                from gi.repository import Clutter
+            Clutter = backend.import_module('Clutter')
             self.signals["clutter_main_quit"] = Clutter.main_quit
 
-            def convert_color(pspec, prop):
-                s = value[1:-1]
-                return Clutter.color_from_string(s)
-            self._property_parsers[Clutter.Color.__gtype__] = convert_color
+            def convert_color(builder, pspec, prop):
+                return Clutter.color_from_string(prop.value[1:-1])
+            # Registering a parser flushes type_cache, only do it once
+            color_type = Clutter.Color.__gtype__
+            if not type_cache.has_property_parser(color_type):
+                type_cache.register_property_parser(color_type, convert_color)
         else:
             raise Exception("Unknown module: %r" % (name, ))
 
-    def _parse_and_construct(self, fp):
-        parser = GMLParser()
-        ns = parser.parse(fp)
+    def _parse_and_construct(self, filename, st):
+        # Construct each toplevel object as soon as the parser is done
+        # with it instead of waiting for the rest of the file, the tree
+        # is cached once it is complete.
+        ns = Namespace()
+        parser = GMLParser(self.stats)
+        with cache.mapped(filename) as data:
+            for node in parser.iterparse(data):
+                if isinstance(node, Object):
+                    ns.objects.append(node)
+                    self._execute(self._compile_objects([node]))
+                else:
+                    ns.imports.append(node)
+                    self._import(node)
+            key = cache.digest(data)
+        _cache_file(filename, st, ns, key, self.stats)
+
+        self._apply_fixups()
+        return ns
+
+    def _compile(self, ns, key):
+        # Imports load the types used by the objects, they must be
+        # done before compiling.
+        key = (key, self.lazy)
+        entry = cache.program_cache.get(key)
+        # The nodes of the program must be the ones of ns
+        if entry is None or entry[0] is not ns:
+            entry = (ns, self._compile_objects(ns.objects))
+            cache.program_cache.put(key, entry)
+        return entry[1]
+
+    def _translate(self, ns, key):
+        entry = cache.xml_cache.get(key)
+        if entry is None or entry[0] is not ns:
+            stats = self.stats
+            if stats is not None:
+                t = timer()
+            entry = (ns, gtkbuilder.translate(ns, self))
+            cache.xml_cache.put(key, entry)
+            if stats is not None:
+                stats.add_time('translate', timer() - t)
+        return entry[1]
+
+    def _load_translation(self, translation):
+        stats = self.stats
+        if stats is not None:
+            t = timer()
+        gtk_builder = Gtk.Builder()
+        gtk_builder.add_from_string(translation.xml)
+        slots = [gtk_builder.get_object(translation.object_id(slot))
+                 for slot in range(len(translation.nodes))]
+        for slot, signal, handler in translation.signals:
+            self._connect(slots[slot], signal, handler)
+        objects = self._objects
+        instances = self._instances
+        for node, obj_id, inst in zip(translation.nodes, translation.ids,
+                                      slots):
+            if obj_id is None:
+                obj_id = str(hash(inst))
+            objects[obj_id] = inst
+            instances[node] = inst
+        if translation.fixups:
+            self._fixups.append((slots, translation.fixups))
+        if stats is not None:
+            stats.add_time('gtkbuilder', timer() - t)
+
+    def _compile_objects(self, objects):
+        stats = self.stats
+        if stats is None:
+            return GMLCompiler(self).compile(objects)
+        t = timer()
+        misses = type_cache.misses
+        program = GMLCompiler(self).compile(objects)
+        stats.add_time('compile', timer() - t)
+        stats.count('type_cache_misses', type_cache.misses - misses)
+        return program
+
+    def _construct_namespace(self, ns, key):
         for import_ in ns.imports:
             self._import(import_)
 
-        for obj in ns.objects:
-            self._construct_object(obj)
-
-        self._apply_delayed_properties()
+        translation = None
+        if self.native and not self.lazy:
+            translation = self._translate(ns, key)
+        if translation is not None:
+            self._load_translation(translation)
+        else:
+            self._execute(self._compile(ns, key))
+        self._apply_fixups()
 
     def add_from_file(self, filename):
-        fp = open(filename)
-        self._parse_and_construct(fp)
+        if self.native:
+            ns, key = _parse_file(filename, self.stats)
+        else:
+            st = os.stat(filename)
+            ns, key = _cached_file(filename, st, self.stats)
+            if ns is None:
+                self._files[filename] = self._parse_and_construct(filename,
+                                                                  st)
+                return
+        self._files[filename] = ns
+        self._construct_namespace(ns, key)
+
+    def add_from_file_async(self, filename, callback=None, progress=None,
+                            budget=None, interval=None):
+        """Like add_from_file(), but construct the objects a slice at a
+        time from the main loop, which keeps running in between.
+
+        A slice takes about budget seconds, config.slice_budget by
+        default, and runs from an idle source, or from a timeout
+        source every interval milliseconds. progress is called after
+        each slice with the fraction of the work done, callback with
+        the builder once all the references are set. Until then
+        get_by_name() only finds the objects constructed so far.
+        Returns the id of the source.
+        """
+        if budget is None:
+            budget = config.slice_budget
+        construction = _Construction(self, filename, callback, progress,
+                                     budget)
+        if interval is None:
+            return GLib.idle_add(construction.step)
+        return GLib.timeout_add(interval, construction.step)
+
+    def add_from_files(self, filenames, workers=None):
+        """Add several files, the ones which are not cached are parsed
+        by a pool of worker processes, see cache.parse_uncached_files().
+        The objects are constructed in order.
+        """
+        trees = {}
+        missing = []
+        for filename in filenames:
+            if filename in trees:
+                continue
+            st = os.stat(filename)
+            trees[filename] = _cached_file(filename, st, self.stats)
+            if trees[filename][0] is None:
+                missing.append((filename, st))
+
+        # Their cache files were looked for already
+        parsed = cache.parse_uncached_files(
+            [filename for filename, st in missing], workers)
+        for (filename, st), ns in zip(missing, parsed):
+            # Files parsed by the workers have not been seen here
+            key = cache.known_digest(filename, st)
+            if key is None:
+                with cache.mapped(filename) as data:
+                    key = cache.digest(data)
+                cache.remember_digest(filename, st, key)
+            cache.memory_cache.put(key, ns)
+            trees[filename] = (ns, key)
+
+        for filename in filenames:
+            ns, key = trees[filename]
+            self._files[filename] = ns
+            self._construct_namespace(ns, key)
 
     def add_from_string(self, string):
-        fp = StringIO.StringIO(string)
-        self._parse_and_construct(fp)
+        key = cache.digest(string)
+        self._construct_namespace(_parse(key, string, self.stats), key)
+
+    def reload_from_file(self, filename):
+        """Parse a file added with add_from_file() again and apply the
+        changes to the objects constructed from it.
+
+        Objects are matched with their previous version by id, or
+        else by type and position among their siblings. Matched
+        objects are kept and only their changed properties are set,
+        and signals reconnected; the others are removed or added.
+        """
+        old = self._files.get(filename)
+        if old is None:
+            self.add_from_file(filename)
+            return
+
+        ns = _parse_file(filename, self.stats)[0]
+        self._files[filename] = ns
+        if ns is old:
+            return
+
+        for import_ in ns.imports:
+            self._import(import_)
+        self._patch_children(None, old.objects, ns.objects)
+        self._apply_fixups()
+
+    def _patch_children(self, parent, old_children, new_children):
+        pairs, removed, added = _match_objects(old_children, new_children)
+        for old in removed:
+            self._remove_object(parent, old)
+        for old, new in pairs:
+            inst = self._instances.get(old)
+            if inst is None or isinstance(inst, _LazyObject):
+                # Not constructed yet, let the new version be lazy
+                self._remove_object(parent, old)
+                self._add_object(parent, new)
+                continue
+            self._patch_object(old, new, inst)
+            if parent is not None:
+                self._patch_packing(parent, inst, old, new)
+        for new in added:
+            self._add_object(parent, new)
+
+        if parent is None or not hasattr(parent, 'reorder_child'):
+            return
+        order = []
+        for new in new_children:
+            inst = self._instances.get(new)
+            if inst is not None and not isinstance(inst, _LazyObject):
+                order.append(inst)
+        current = [child for child in parent.get_children() if child in order]
+        if current != order:
+            for position, inst in enumerate(order):
+                parent.reorder_child(inst, position)
+
+    def _patch_object(self, old, new, inst):
+        self._instances[new] = self._instances.pop(old)
+        old_id = _object_id(old)
+        new_id = _object_id(new)
+        if old_id != new_id:
+            auto_id = str(hash(inst))
+            self._objects.pop(old_id or auto_id, None)
+            self._objects[new_id or auto_id] = inst
+
+        old_properties = dict((prop.name, prop) for prop in old.properties)
+        for prop in new.properties:
+            if prop.name in ['id', 'child_type', 'lazy']:
+                continue
+            old_prop = old_properties.pop(prop.name, None)
+            if old_prop is not None and _same_property(old_prop, prop):
+                continue
+            if isinstance(prop.value, Object):
+                inst.set_property(prop.name,
+                                  self._construct_value(prop.value))
+            else:
+                # Set with the fixups, it may refer to an object added
+                # further down
+                path = prop.name.split('.')
+                self._fixups.append(
+                    ([inst], ((0, tuple(path[:-1]), path[-1], None, prop),)))
+        for name in old_properties:
+            if name not in ['id', 'child_type', 'lazy']:
+                self._reset_property(inst, name)
+
+        old_signals = [(signal.name, signal.handler) for signal in old.signals]
+        signals = [(signal.name, signal.handler) for signal in new.signals]
+        if old_signals != signals:
+            for handler_id in self._handler_ids.pop(inst, ()):
+                inst.disconnect(handler_id)
+            for name, handler in signals:
+                self._connect(inst, name, handler)
+
+        gtype = inst.__gtype__
+        if not GObject.type_is_a(gtype, Gtk.Container.__gtype__):
+            return
+        # Children named after a property modify the object in it
+        old_values = {}
+        old_children = []
+        for child in old.children:
+            if type_cache.find_property(gtype, child.name) is not None:
+                old_values[child.name] = child
+            elif child.name != 'packing':
+                old_children.append(child)
+        new_children = []
+        for child in new.children:
+            if type_cache.find_property(gtype, child.name) is None:
+                if child.name != 'packing':
+                    new_children.append(child)
+            elif child.name in old_values:
+                old_child = old_values[child.name]
+                self._patch_object(old_child, child,
+                                   self._instances[old_child])
+            else:
+                self._add_object(inst, child)
+        self._patch_children(inst, old_children, new_children)
+
+    def _patch_packing(self, parent, inst, old, new):
+        old_packing = _packing(old)
+        new_packing = _packing(new)
+        changed = []
+        for name, prop in new_packing.items():
+            old_prop = old_packing.pop(name, None)
+            if old_prop is None or not _same_property(old_prop, prop):
+                changed.append(prop)
+        if not changed and not old_packing:
+            return
+
+        inst.freeze_child_notify()
+        try:
+            self._set_packing(parent, inst, changed)
+            child_properties = type_cache.get_child_properties(parent)
+            for name in old_packing:
+                pspec, parser = child_properties[name]
+                parent.child_set_property(
+                    inst, name, getattr(pspec, 'default_value', None))
+        finally:
+            inst.thaw_child_notify()
+
+    def _reset_property(self, inst, name):
+        parts = name.split('.')
+        for part in parts[:-1]:
+            inst = getattr(inst.props, part)
+        pspec, parser = type_cache.get_property(inst.__gtype__, parts[-1])
+        inst.set_property(parts[-1], getattr(pspec, 'default_value', None))
+
+    def _construct_value(self, obj):
+        return self._execute(GMLCompiler(self).compile_object(obj))[0]
+
+    def _add_object(self, parent, obj):
+        if parent is None:
+            self._execute(self._compile_objects([obj]))
+        else:
+            self._execute(
+                GMLCompiler(self).compile_child(obj, parent.__gtype__), parent)
+
+    def _remove_object(self, parent, obj):
+        inst = self._instances.get(obj)
+        self._forget(obj)
+        if inst is None or isinstance(inst, _LazyObject):
+            return
+        if parent is not None:
+            parent.remove(inst)
+        elif hasattr(inst, 'destroy'):
+            inst.destroy()
+
+    def _forget(self, obj):
+        inst = self._instances.pop(obj, None)
+        if isinstance(inst, _LazyObject):
+            self._discard_lazy(inst)
+            return
+        if inst is not None:
+            obj_id = _object_id(obj) or str(hash(inst))
+            if self._objects.get(obj_id) is inst:
+                del self._objects[obj_id]
+            self._handler_ids.pop(inst, None)
+        for prop in obj.properties:
+            if isinstance(prop.value, Object):
+                self._forget(prop.value)
+        for child in obj.children:
+            self._forget(child)
 
     def get_by_name(self, name):
-        return self._objects.get(name)
+        obj = self._objects.get(name)
+        while obj is None and name in self._lazy_objects:
+            # Constructing a lazy object can add another lazy object
+            # holding name, when they are nested.
+            self._construct_lazy(self._lazy_objects[name])
+            obj = self._objects.get(name)
+        return obj
 
     @property
     def objects(self):
@@ -294,3 +958,175 @@ class GMLBuilder(object):
     def main(self):
         # FIXME: modules should define this
         Gtk.main()
+
+
+class GMLTemplate(object):
+    """A document which is parsed and compiled once and can then be
+    instantiated any number of times.
+
+    Each instantiation gets a builder of its own, so the ids in the
+    document only have to be unique within one instance.
+    """
+
+    def __init__(self, ns):
+        self.signals = {}
+        # Passed on to the builders, see GMLBuilder
+        self.stats = None
+        self._ns = ns
+        self._program = None
+
+    @classmethod
+    def new_from_file(cls, filename):
+        return cls(_parse_file(filename)[0])
+
+    @classmethod
+    def new_from_string(cls, string):
+        return cls(_parse(cache.digest(string), string))
+
+    def instantiate(self):
+        """Construct the objects of the template, returns a new
+        GMLBuilder holding them.
+        """
+        builder = GMLBuilder(stats=self.stats)
+        builder.signals.update(self.signals)
+        for import_ in self._ns.imports:
+            builder._import(import_)
+
+        if self._program is None:
+            self._program = builder._compile_objects(self._ns.objects)
+        builder._execute(self._program)
+        builder._apply_fixups()
+        return builder
+
+
+def _object_id(obj):
+    for prop in obj.properties:
+        if prop.name == 'id':
+            return prop.value
+    return None
+
+
+def _packing(obj):
+    for child in obj.children:
+        if child.name == 'packing':
+            return dict((prop.name, prop) for prop in child.properties)
+    return {}
+
+
+def _same_property(a, b):
+    if a.kind != b.kind:
+        return False
+    if isinstance(a.value, Object) and isinstance(b.value, Object):
+        return cache.dump_object(a.value) == cache.dump_object(b.value)
+    return a.value == b.value
+
+
+def _match_objects(old, new):
+    """Pair the objects of old with the ones of new that replace
+    them, returns the pairs, the removed and the added objects.
+    """
+    old_ids = {}
+    for obj in old:
+        obj_id = _object_id(obj)
+        if obj_id is not None:
+            old_ids[obj_id] = obj
+
+    matched = {}
+    for obj in new:
+        old_obj = old_ids.get(_object_id(obj))
+        if old_obj is not None and old_obj.name == obj.name:
+            matched[obj] = old_obj
+
+    # The rest by type, keeping their order
+    used = set(matched.values())
+    rest = [obj for obj in old if obj not in used]
+    for obj in new:
+        if obj in matched:
+            continue
+        for i, old_obj in enumerate(rest):
+            if old_obj.name == obj.name:
+                matched[obj] = old_obj
+                del rest[:i + 1]
+                break
+
+    used = set(matched.values())
+    pairs = [(matched[obj], obj) for obj in new if obj in matched]
+    removed = [obj for obj in old if obj not in used]
+    added = [obj for obj in new if obj not in matched]
+    return pairs, removed, added
+
+
+def _parse(key, source, stats=None):
+    # Parse trees are shared between builders through the memory
+    # cache, so they must never be modified while constructing objects.
+    ns = cache.memory_cache.get(key)
+    if ns is None:
+        ns = GMLParser(stats).parse(source)
+        cache.memory_cache.put(key, ns)
+    elif stats is not None:
+        stats.count('memory_cache_hits')
+    return ns
+
+
+def _cached_file(filename, st, stats=None):
+    # The tree and the key of filename if it is in the memory cache or
+    # has a cache file, else (None, None). Files seen before are looked
+    # up by their mtime and size, without reading them.
+    key = cache.known_digest(filename, st)
+    if key is not None:
+        ns = cache.memory_cache.get(key)
+        if ns is not None:
+            if stats is not None:
+                stats.count('memory_cache_hits')
+            return ns, key
+    if not config.use_cache:
+        return None, None
+    if stats is not None:
+        t = timer()
+    ns = cache.load(filename)
+    if stats is not None:
+        stats.add_time('load', timer() - t)
+    # The file may have changed since st
+    key = cache.known_digest(filename, st)
+    if ns is None or key is None:
+        return None, None
+    cache.memory_cache.put(key, ns)
+    return ns, key
+
+
+def _cache_file(filename, st, ns, key, stats=None):
+    cache.memory_cache.put(key, ns)
+    if not config.use_cache:
+        cache.remember_digest(filename, st, key)
+        return
+    if stats is not None:
+        t = timer()
+    cache.store(filename, ns, st, key)
+    if stats is not None:
+        stats.add_time('load', timer() - t)
+
+
+def _parse_file(filename, stats=None):
+    # The tree and the key of filename, parsed if it is not cached
+    st = os.stat(filename)
+    ns, key = _cached_file(filename, st, stats)
+    if ns is None:
+        with cache.mapped(filename) as data:
+            ns = GMLParser(stats).parse(data)
+            key = cache.digest(data)
+        _cache_file(filename, st, ns, key, stats)
+    return ns, key
+
+
+def _register_property_parsers():
+    register = type_cache.register_property_parser
+    register(GObject.TYPE_BOOLEAN, GMLBuilder._parse_property_bool)
+    register(GObject.TYPE_INT, GMLBuilder._parse_property_int)
+    register(GObject.TYPE_UINT, GMLBuilder._parse_property_int)
+    register(GObject.TYPE_STRING, GMLBuilder._parse_property_string)
+    register(GObject.TYPE_ENUM, GMLBuilder._parse_property_enum)
+    register(GObject.TYPE_FLAGS, GMLBuilder._parse_property_flags)
+    register(GObject.TYPE_OBJECT, GMLBuilder._parse_property_object)
+    register(GObject.TYPE_INTERFACE, GMLBuilder._parse_property_object)
+
+_register_property_parsers()
@@ -0,0 +1,449 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Cache - parsed GML files in memory and compiled GML files on disk
+
+Parsed files are stored as .gmlc files in config.cache_dir, much like
+Python stores .pyc files. A .gmlc file is a small header followed by
+the parse tree as nested tuples, serialized with marshal:
+
+  magic, mtime and size of the source, sha1 digest of the source
+
+A cached tree is used when the mtime and size of the source match, or
+failing that, when the digest of its contents does.
+
+Many files can be parsed at once by a pool of worker processes, which
+send the trees back in the same serialized form.
+"""
+
+import contextlib
+import hashlib
+import marshal
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+from collections import OrderedDict
+
+from . import config
+from .parser import (GMLParser, Namespace, Import, Object, Property, Signal,
+                     TYPE_OBJECT)
+
+MAGIC = b'GMLc\x01\r\n\x00'
+_header = struct.Struct('<8sdQ20s')
+# The marshal format differs between Python versions
+_tag = 'py%d%d' % sys.version_info[:2]
+
+try:
+    _unicode = unicode
+except NameError:
+    _unicode = str
+
+
+# Serialization
+
+def dump_object(obj):
+    properties = []
+    for prop in obj.properties:
+        value = prop.value
+        if prop.kind == TYPE_OBJECT:
+            value = dump_object(value)
+        properties.append((prop.name, value, prop.kind))
+    return (obj.name,
+            tuple([dump_object(child) for child in obj.children]),
+            tuple(properties),
+            tuple([(signal.name, signal.handler) for signal in obj.signals]),
+            obj.is_property)
+
+
+def load_object(data):
+    name, children, properties, signals, is_property = data
+    obj = Object(name)
+    if children:
+        obj.children = [load_object(child) for child in children]
+    if properties:
+        obj.properties = [
+            Property(prop_name,
+                     load_object(value) if kind == TYPE_OBJECT else value,
+                     kind)
+            for prop_name, value, kind in properties]
+    if signals:
+        obj.signals = [Signal(signal, handler) for signal, handler in signals]
+    obj.is_property = is_property
+    return obj
+
+
+def dumps(ns):
+    return marshal.dumps((tuple([import_.name for import_ in ns.imports]),
+                          tuple([dump_object(obj) for obj in ns.objects])))
+
+
+def loads(data):
+    imports, objects = marshal.loads(data)
+    ns = Namespace()
+    ns.imports = [Import(name) for name in imports]
+    ns.objects = [load_object(obj) for obj in objects]
+    return ns
+
+
+# Memory cache
+
+def digest(source):
+    """The key of source, a string or a bytes-like object"""
+    if isinstance(source, _unicode):
+        source = source.encode('utf-8')
+    return hashlib.sha1(source).digest()
+
+
+class MemoryCache(object):
+    """Least recently used parse trees, keyed by the digest of their
+    source. The size defaults to config.memory_cache_size.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._trees = OrderedDict()
+
+    def __len__(self):
+        return len(self._trees)
+
+    def get(self, key):
+        try:
+            ns = self._trees.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._trees[key] = ns
+        self.hits += 1
+        return ns
+
+    def put(self, key, ns):
+        max_size = self.max_size
+        if max_size is None:
+            max_size = config.memory_cache_size
+        self._trees.pop(key, None)
+        self._trees[key] = ns
+        while len(self._trees) > max_size:
+            self._trees.popitem(last=False)
+
+    def clear(self):
+        self._trees.clear()
+        self.hits = 0
+        self.misses = 0
+
+memory_cache = MemoryCache()
+# Compiled programs of the trees, see gml.compiler
+program_cache = MemoryCache()
+# GtkBuilder XML of the trees, see gml.gtkbuilder
+xml_cache = MemoryCache()
+
+
+# Cache files
+
+@contextlib.contextmanager
+def mapped(filename):
+    """The contents of filename, mapped read-only into memory so that
+    they can be hashed and parsed without being copied.
+    """
+    with open(filename, 'rb') as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # Empty files can not be mapped
+            yield fp.read()
+            return
+        try:
+            yield data
+        finally:
+            data.close()
+
+
+def cache_filename(filename):
+    path = os.path.abspath(filename)
+    if not isinstance(path, bytes):
+        path = path.encode('utf-8')
+    return os.path.join(config.cache_dir, '%s.%s.gmlc' % (
+        hashlib.sha1(path).hexdigest(), _tag))
+
+
+def _digest(filename):
+    with mapped(filename) as data:
+        return hashlib.sha1(data).digest()
+
+
+# Absolute filename -> (mtime, size, digest) of the files loaded or
+# stored, so that they can be found in the memory cache without
+# reading them again.
+_file_digests = {}
+
+
+def known_digest(filename, st):
+    """The digest of filename if it was loaded from or stored in the
+    cache and its mtime and size are still the ones of st, else None.
+    """
+    entry = _file_digests.get(os.path.abspath(filename))
+    if entry is None or entry[:2] != (st.st_mtime, st.st_size):
+        return None
+    return entry[2]
+
+
+def remember_digest(filename, st, digest):
+    _file_digests[os.path.abspath(filename)] = (st.st_mtime, st.st_size,
+                                                digest)
+
+
+def _write(cache_file, header, body):
+    # Write to a temporary file and rename it, so that a concurrent
+    # reader never sees a partially written cache file.
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(header)
+            fp.write(body)
+        os.rename(tmp_file, cache_file)
+    except:
+        os.unlink(tmp_file)
+        raise
+
+
+def load(filename):
+    """Load the cached tree of filename, returns None if there is no
+    cache file or if it is out of date.
+    """
+    cache_file = cache_filename(filename)
+    try:
+        st = os.stat(filename)
+        with open(cache_file, 'rb') as fp:
+            header = fp.read(_header.size)
+            if len(header) != _header.size:
+                return None
+            magic, mtime, size, digest = _header.unpack(header)
+            if magic != MAGIC:
+                return None
+            body = fp.read()
+        if (mtime, size) != (st.st_mtime, st.st_size):
+            # Touched but possibly unchanged, compare the contents
+            if _digest(filename) != digest:
+                return None
+    except (IOError, OSError):
+        return None
+
+    try:
+        if (mtime, size) != (st.st_mtime, st.st_size):
+            # Refresh the header so that the next load is fast again
+            _write(cache_file,
+                   _header.pack(MAGIC, st.st_mtime, st.st_size, digest), body)
+        else:
+            # Mark it as recently used for the eviction
+            os.utime(cache_file, None)
+    except (IOError, OSError):
+        pass
+
+    try:
+        ns = loads(body)
+    except (EOFError, ValueError, TypeError):
+        return None
+    remember_digest(filename, st, digest)
+    return ns
+
+
+def store(filename, ns, st=None, digest=None):
+    """Store the tree parsed from filename in the cache.
+
+    st is the result of os.stat() from before the file was parsed,
+    nothing is stored if the file changed since then. digest is the
+    one of the contents parsed, if known. Errors writing the cache are
+    ignored.
+    """
+    try:
+        if digest is None:
+            digest = _digest(filename)
+        current = os.stat(filename)
+        if st is None:
+            st = current
+        elif (st.st_mtime, st.st_size) != (current.st_mtime, current.st_size):
+            return
+        if not os.path.isdir(config.cache_dir):
+            os.makedirs(config.cache_dir)
+        remember_digest(filename, st, digest)
+        body = dumps(ns)
+        _write(cache_filename(filename),
+               _header.pack(MAGIC, st.st_mtime, st.st_size, digest), body)
+        _grow(_header.size + len(body))
+    except (IOError, OSError):
+        pass
+
+
+# The bytes in each cache directory as of its last eviction plus the
+# ones written since. Replaced files are counted twice, so it is an
+# upper bound as long as this process is the only writer.
+_cache_sizes = {}
+
+
+def _grow(size):
+    # Only list the cache directory when the cache may be too large,
+    # and then make some room so that the next stores do not have to.
+    cache_dir = config.cache_dir
+    total = _cache_sizes.get(cache_dir)
+    if total is None:
+        total = evict(config.cache_max_size)
+    else:
+        total += size
+        if total > config.cache_max_size:
+            total = evict(config.cache_max_size * 3 // 4)
+    _cache_sizes[cache_dir] = total
+
+
+def evict(max_size):
+    """Remove the least recently used cache files until the cache
+    takes up at most max_size bytes, returns the size it takes up.
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(config.cache_dir):
+        if not name.endswith('.gmlc'):
+            continue
+        path = os.path.join(config.cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def compile_file(filename):
+    """Parse filename and store it in the cache, returns the tree."""
+    st = os.stat(filename)
+    with mapped(filename) as data:
+        ns = GMLParser().parse(data)
+        key = digest(data)
+    store(filename, ns, st, key)
+    return ns
+
+
+def compile_dir(path):
+    """Compile all .gml files below path, returns the filenames."""
+    filenames = []
+    for dirpath, dirnames, names in os.walk(path):
+        dirnames.sort()
+        for name in sorted(names):
+            if name.endswith('.gml'):
+                filename = os.path.join(dirpath, name)
+                compile_file(filename)
+                filenames.append(filename)
+    return filenames
+
+
+def parse_file(filename):
+    """Parse filename, or load it from its cache file if enabled."""
+    if config.use_cache:
+        ns = load(filename)
+        if ns is not None:
+            return ns
+    return _parse_uncached(filename)
+
+
+def _parse_uncached(filename):
+    # Parse a file without a valid cache file, and store it if enabled
+    if config.use_cache:
+        return compile_file(filename)
+    with mapped(filename) as data:
+        return GMLParser().parse(data)
+
+
+def _init_worker(use_cache, cache_dir):
+    # Workers are not necessarily forked from the parent
+    config.use_cache = use_cache
+    config.cache_dir = cache_dir
+
+
+def _parse_worker(filename):
+    return dumps(_parse_uncached(filename))
+
+
+def _cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def parse_files(filenames, workers=None):
+    """Parse filenames using a pool of workers processes, returns the
+    trees in the same order.
+
+    Files with a valid cache file are loaded in this process, only the
+    others are parsed by the workers. workers defaults to the number
+    of CPUs. If it is 1, or if the files to parse are smaller than
+    config.parse_pool_min_size altogether, they are parsed in this
+    process.
+    """
+    trees = [None] * len(filenames)
+    missing = []
+    for i, filename in enumerate(filenames):
+        if config.use_cache:
+            trees[i] = load(filename)
+        if trees[i] is None:
+            missing.append(i)
+
+    parsed = parse_uncached_files([filenames[i] for i in missing], workers)
+    for i, ns in zip(missing, parsed):
+        trees[i] = ns
+    return trees
+
+
+def parse_uncached_files(filenames, workers=None):
+    """Like parse_files(), for files known not to have a valid cache
+    file: they are parsed without looking for one, and stored in the
+    cache if enabled.
+    """
+    if workers is None:
+        workers = _cpu_count()
+    if (workers == 1 or len(filenames) < 2 or
+        sum([os.path.getsize(filename) for filename in filenames]) <
+        config.parse_pool_min_size):
+        return [_parse_uncached(filename) for filename in filenames]
+
+    pool = multiprocessing.Pool(min(workers, len(filenames)), _init_worker,
+                                (config.use_cache, config.cache_dir))
+    try:
+        parsed = pool.map(_parse_worker, filenames)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return [loads(data) for data in parsed]
@@ -0,0 +1,523 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Codegen - write a GML document as a Python module
+
+The module constructs the objects of the document like GMLBuilder
+does, with the work of the parser and the compiler done ahead of
+time: types are looked up once when it is imported, property values
+are literals, enums and flags included, and references go straight to
+the variables holding the objects. Each toplevel object is constructed
+by a function of its own, build() calls them in the order of their
+references, applies the fixups and returns the toplevel objects:
+
+  import window
+  toplevels = window.build(signals, objects)
+
+Objects marked as lazy are constructed right away. Values without a
+literal are constructed by an expression, see _expression_writers.
+"""
+
+import keyword
+import os
+import py_compile
+import re
+
+from . import cache
+from .builder import GMLBuilder
+from .compiler import (GMLCompiler, type_cache, is_reference_type,
+                       split_reference, NEW, GET, SET, CONNECT, ADD_CHILD)
+from .parser import (GMLParser, TYPE_BOOLEAN, TYPE_IDENTIFIER, TYPE_NUMBER,
+                     TYPE_STRING)
+
+try:
+    _int_types = (int, long)
+    _string_types = (str, unicode)
+except NameError:
+    _int_types = (int, )
+    _string_types = (str, )
+
+# The signal handlers provided by the imports, see GMLBuilder._import()
+_import_handlers = {
+    'Gtk': [('gtk_main_quit', 'Gtk.main_quit')],
+    'Clutter': [('clutter_main_quit', 'Clutter.main_quit')],
+    }
+
+
+# The first line of a module, files without it are not overwritten
+_header = '# Generated from %s by gmltool compile --python, changes'
+
+
+# Value type name -> function returning the expression constructing
+# the value of a Property, for the types which have no literal
+_expression_writers = {
+    'ClutterColor': lambda prop: 'Clutter.color_from_string(%r)' % (
+        prop.value[1:-1], ),
+    }
+
+
+class _Code(object):
+    # A Python expression, in place of a converted value
+    __slots__ = ('code', )
+
+    def __init__(self, code):
+        self.code = code
+
+
+class _Compiler(GMLCompiler):
+    # The generated functions construct everything
+    def _is_lazy(self, obj, toplevel=False):
+        return False
+
+    def _convert_property(self, pspec, parser, prop):
+        writer = _expression_writers.get(pspec.value_type.name)
+        if writer is not None:
+            return _Code(writer(prop))
+        return _Code(_literal(
+            self._builder._convert_property(pspec, parser, prop)))
+
+
+def _literal(value):
+    if isinstance(value, _Code):
+        return value.code
+    if value is None or isinstance(value, bool):
+        return repr(value)
+    if isinstance(value, _int_types):
+        # Enum and flags values are ints as well
+        return repr(int(value))
+    if isinstance(value, float) or isinstance(value, _string_types):
+        return repr(value)
+    raise Exception("Can not write %r as a Python literal" % (value, ))
+
+
+def _token_literal(prop):
+    # The value of prop when its pspec is only known at runtime
+    value = prop.value
+    if prop.kind == TYPE_STRING:
+        return repr(value[1:-1])
+    elif prop.kind == TYPE_BOOLEAN:
+        return repr(value == 'true')
+    elif prop.kind == TYPE_NUMBER:
+        try:
+            return repr(int(value))
+        except ValueError:
+            return repr(float(value))
+    raise Exception("Can not resolve the type of property %r" % (
+        prop.name, ))
+
+
+def _props(expression, path):
+    return expression + ''.join(['.props.' + part for part in path])
+
+
+def _call(function, args, kwargs):
+    # kwargs is a list of (name, expression)
+    if [name for name, value in kwargs if keyword.iskeyword(name)]:
+        args = args + ['**{%s}' % (', '.join(
+            ['%r: %s' % (name, value) for name, value in kwargs]), )]
+    else:
+        args = args + ['%s=%s' % (name, value) for name, value in kwargs]
+    return '%s(%s)' % (function, ', '.join(args))
+
+
+def _set_properties(target, values):
+    # The statements setting the (name, value) pairs of values, with
+    # notify frozen if there are several
+    lines = ['%s.set_property(%r, %s)' % (target, name, value)
+             for name, value in values]
+    if len(lines) > 1:
+        lines.insert(0, '%s.freeze_notify()' % (target, ))
+        lines.append('%s.thaw_notify()' % (target, ))
+    return lines
+
+
+def _operands(instruction):
+    # The slots an instruction defines or uses
+    op = instruction[0]
+    if op == NEW:
+        return [instruction[1]] + [value_slot for name, value_slot, path
+                                   in instruction[4]]
+    elif op == SET:
+        return [instruction[1]] + [value_slot for name, value_slot, prop
+                                   in instruction[2]
+                                   if value_slot is not None]
+    elif op == CONNECT:
+        return [instruction[1]]
+    elif op in [GET, ADD_CHILD]:
+        return [instruction[1], instruction[2]]
+    return []
+
+
+class _Writer(object):
+    def __init__(self, builder, compiler):
+        self._builder = builder
+        self._compiler = compiler
+        self._lines = []
+        # GType name -> variable, for the module header
+        self._types = {}
+        # Static type of each slot
+        self._slot_types = {}
+        # The chunk constructing each slot, and the slots which are
+        # used outside of it and stored in the slots list
+        self._owners = {}
+        self._exported = set()
+        # Slot -> index of the line assigning its variable, and the
+        # variable
+        self._defined = {}
+        self._fixups = []
+        self._chunk = None
+        # Variables of the slots of the current chunk. A variable is
+        # reused once its object is no longer needed, functions with
+        # thousands of locals are slow to call.
+        self._variables = {}
+        self._free = []
+        self._n_variables = 0
+
+    def _emit(self, line, indent=1):
+        self._lines.append('    ' * indent + line)
+
+    def _type(self, gtype):
+        variable = self._types.get(gtype.name)
+        if variable is None:
+            variable = self._types[gtype.name] = '_' + gtype.name
+        return variable
+
+    def _var(self, slot):
+        if self._owners.get(slot) == self._chunk:
+            return self._variables[slot]
+        self._exported.add(slot)
+        return 'slots[%d]' % (slot, )
+
+    def _define(self, slot):
+        if self._free:
+            variable = self._free.pop()
+        else:
+            variable = 'o%d' % (self._n_variables, )
+            self._n_variables += 1
+        self._variables[slot] = variable
+        return variable
+
+    def _reference(self, value):
+        obj_id, path = split_reference(value)
+        return _props('objects[%r]' % (obj_id, ), path)
+
+    def _convert(self, pspec, parser, prop):
+        return self._compiler._convert_property(pspec, parser, prop).code
+
+    def _child_property(self, gtype, prop):
+        pspec, parser = type_cache.get_type_child_properties(gtype)[prop.name]
+        return self._convert(pspec, parser, prop)
+
+    def _fixup(self, slot, path, name, reference, prop):
+        # Returns the object a fixup sets, the property and the value,
+        # or raises if it can not be resolved.
+        target = _props('slots[%d]' % (slot, ), path)
+        self._exported.add(slot)
+        if reference is not None:
+            value_slot, obj_id, value_path = reference
+            if value_slot is not None:
+                self._exported.add(value_slot)
+                value = 'slots[%d]' % (value_slot, )
+            else:
+                value = 'objects[%r]' % (obj_id, )
+            value = _props(value, value_path)
+        else:
+            gtype = self._slot_types[slot]
+            try:
+                for part in path:
+                    gtype = type_cache.get_property(gtype, part)[0].value_type
+                pspec, parser = type_cache.get_property(gtype, name)
+            except AttributeError:
+                # A subclass property, eg image.pixel_size of a
+                # GtkWidget holding a GtkImage
+                value = _token_literal(prop)
+            else:
+                if (prop.kind == TYPE_IDENTIFIER and
+                    is_reference_type(pspec.value_type)):
+                    value = self._reference(prop.value)
+                else:
+                    value = self._convert(pspec, parser, prop)
+        return target, name, value
+
+    def _write_instruction(self, instruction):
+        op = instruction[0]
+        if op == NEW:
+            op, slot, gtype, properties, dynamic, obj_id = instruction
+            kwargs = [(name, _literal(value))
+                      for name, value in sorted(properties.items())]
+            for name, value_slot, path in dynamic:
+                kwargs.append((name, _props(self._var(value_slot), path)))
+            variable = self._define(slot)
+            self._emit('%s = %s' % (variable, _call(
+                '_new', [self._type(gtype)], kwargs)))
+            self._defined[slot] = (len(self._lines) - 1, variable)
+            self._slot_types[slot] = gtype
+            if obj_id is not None:
+                self._emit('objects[%r] = %s' % (obj_id, variable))
+        elif op == GET:
+            op, slot, parent_slot, name = instruction
+            value = '%s.props.%s' % (self._var(parent_slot), name)
+            variable = self._define(slot)
+            self._emit('%s = %s' % (variable, value))
+            self._defined[slot] = (len(self._lines) - 1, variable)
+            self._slot_types[slot] = type_cache.get_property(
+                self._slot_types[parent_slot], name)[0].value_type
+        elif op == SET:
+            op, slot, properties = instruction
+            target = self._var(slot)
+            values = []
+            for name, value_slot, prop in properties:
+                if value_slot is not None:
+                    values.append((name, self._var(value_slot)))
+                    continue
+                pspec, parser = type_cache.get_property(
+                    self._slot_types[slot], name)
+                if (prop.kind == TYPE_IDENTIFIER and
+                    is_reference_type(pspec.value_type)):
+                    # The object may be constructed further down
+                    self._fixups.append(self._fixup(
+                        slot, (), name,
+                        (None, ) + split_reference(prop.value), prop))
+                else:
+                    values.append((name, self._convert(pspec, parser, prop)))
+            for line in _set_properties(target, values):
+                self._emit(line)
+        elif op == CONNECT:
+            op, slot, signal, handler = instruction
+            self._emit('%s.connect(%r, signals[%r])' % (self._var(slot),
+                                                        signal, handler))
+        elif op == ADD_CHILD:
+            op, parent_slot, slot, child_type, packing = instruction
+            parent = self._var(parent_slot)
+            child = self._var(slot)
+            if packing:
+                self._emit('%s.freeze_child_notify()' % (child, ))
+            self._emit('_add_child(%s, _builder, %s, %r)' % (
+                parent, child, child_type))
+            for prop in packing:
+                self._emit('%s.child_set_property(%s, %r, %s)' % (
+                    parent, child, prop.name,
+                    self._child_property(self._slot_types[parent_slot],
+                                         prop)))
+            if packing:
+                self._emit('%s.thaw_child_notify()' % (child, ))
+        else:
+            raise Exception("Can not generate code for opcode %r" % (op, ))
+
+    def _write_chunk(self, chunk, result):
+        # The index of the last instruction using each slot
+        last_use = {}
+        for i, instruction in enumerate(chunk):
+            for slot in _operands(instruction):
+                last_use[slot] = i
+        last_use[result] = len(chunk)
+        released = {}
+        for slot, i in last_use.items():
+            released.setdefault(i, []).append(slot)
+
+        self._variables = {}
+        self._free = []
+        self._n_variables = 0
+        for i, instruction in enumerate(chunk):
+            self._write_instruction(instruction)
+            for slot in sorted(released.get(i, ()), reverse=True):
+                if slot in self._variables:
+                    self._free.append(self._variables[slot])
+        self._emit('return %s' % (self._variables[result], ))
+
+    def write(self, ns, source_name):
+        compiler = self._compiler
+        objects = ns.objects
+        chunks = compiler.compile_chunks(objects)
+        instructions = []
+        for obj, chunk in chunks:
+            instructions.extend(chunk)
+        program = compiler._link(instructions)
+        # Linking keeps the instructions one for one, only the ones
+        # it moved to the fixups change.
+        start = 0
+        linked = []
+        for i, (obj, chunk) in enumerate(chunks):
+            chunk = program.instructions[start:start + len(chunk)]
+            start += len(chunk)
+            for instruction in chunk:
+                if instruction[0] in [NEW, GET]:
+                    self._owners[instruction[1]] = i
+            linked.append((obj, chunk))
+
+        names = set()
+        functions = []
+        for i, (obj, chunk) in enumerate(linked):
+            self._chunk = i
+            name = _function_name(obj, objects.index(obj), names)
+            self._emit('', 0)
+            self._emit('', 0)
+            self._emit('def %s(slots, objects, signals):' % (name, ), 0)
+            self._write_chunk(chunk, compiler._slots[obj])
+            functions.append(name)
+        self._chunk = None
+        fixups = [self._fixup(*fixup) for fixup in program.fixups]
+        fixups.extend(self._fixups)
+
+        lines = [
+            _header % (source_name, ),
+            '# will be lost.',
+            '',
+            ]
+        modules = [import_.name for import_ in ns.imports
+                   if import_.name != 'Gtk']
+        if modules:
+            lines.append('from gml import backend')
+        lines.append('from gml.backend import GObject, Gtk')
+        handlers = []
+        for import_ in ns.imports:
+            if import_.name != 'Gtk':
+                lines.append('%s = backend.import_module(%r)' % (
+                    import_.name, import_.name))
+            handlers.extend(_import_handlers[import_.name])
+        lines.extend([
+            '',
+            '_new = GObject.new',
+            '_add_child = Gtk.Buildable.add_child',
+            '_builder = Gtk.Builder()',
+            ])
+        for type_name, variable in sorted(self._types.items()):
+            lines.append('%s = GObject.type_from_name(%r)' % (
+                variable, type_name))
+        lines.append('_signals = {%s}' % (', '.join(
+            ['%r: %s' % handler for handler in handlers]), ))
+
+        defined = dict((line, (slot, variable))
+                       for slot, (line, variable) in self._defined.items())
+        for i, line in enumerate(self._lines):
+            lines.append(line)
+            slot, variable = defined.get(i, (None, None))
+            if slot in self._exported:
+                lines.append('    slots[%d] = %s' % (slot, variable))
+
+        lines.extend([
+            '',
+            '',
+            'def build(signals=None, objects=None):',
+            '    """Construct the objects, returns the toplevel ones. '
+            'signals',
+            '    maps the handler names to functions, the objects with an '
+            'id',
+            '    are stored in objects.',
+            '    """',
+            '    if objects is None:',
+            '        objects = {}',
+            '    handlers = dict(_signals)',
+            '    if signals:',
+            '        handlers.update(signals)',
+            '    slots = [None] * %d' % (program.n_slots, ),
+            ])
+        results = {}
+        for (obj, chunk), name in zip(linked, functions):
+            results[obj] = 'top%d' % (objects.index(obj), )
+            lines.append('    %s = %s(slots, objects, handlers)' % (
+                results[obj], name))
+        # Like GMLBuilder._apply_fixups(), each object is set once
+        targets = []
+        groups = {}
+        for target, name, value in fixups:
+            if target not in groups:
+                groups[target] = []
+                targets.append(target)
+            groups[target].append((name, value))
+        for target in targets:
+            for line in _set_properties(target, groups[target]):
+                lines.append('    ' + line)
+        lines.append('    return [%s]' % (', '.join(
+            [results[obj] for obj in objects]), ))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _function_name(obj, index, names):
+    name = 'build_%d' % (index, )
+    for prop in obj.properties:
+        if prop.name == 'id':
+            if 'build_' + prop.value not in names:
+                name = 'build_' + prop.value
+            break
+    names.add(name)
+    return name
+
+
+def generate(ns, source_name='<string>'):
+    """Returns the source of a Python module constructing the objects
+    of the parse tree ns.
+    """
+    builder = GMLBuilder()
+    for import_ in ns.imports:
+        builder._import(import_)
+    return _Writer(builder, _Compiler(builder)).write(ns, source_name)
+
+
+def _module_name(filename):
+    # The base name of filename turned into an identifier, so that the
+    # module can be imported: gtk3-demo.gml is gtk3_demo
+    name = os.path.splitext(os.path.basename(filename))[0]
+    name = re.sub(r'\W', '_', name)
+    if not name or name[0].isdigit() or keyword.iskeyword(name):
+        name = '_' + name
+    return name
+
+
+def _is_generated(filename):
+    with open(filename) as fp:
+        line = fp.readline().rstrip('\n')
+    prefix, suffix = _header.split('%s')
+    return line.startswith(prefix) and line.endswith(suffix)
+
+
+def compile_file(filename, output=None):
+    """Write the module of filename next to it, or to output, and
+    byte-compile it. Returns the name of the module file.
+
+    An existing file is only overwritten if it is a module written
+    before, a hand written main.py next to main.gml is left alone.
+    """
+    if output is None:
+        output = os.path.join(os.path.dirname(filename),
+                              _module_name(filename) + '.py')
+    if os.path.exists(output) and not _is_generated(output):
+        raise Exception("%s was not generated by gmltool, not overwriting it"
+                        % (output, ))
+    with cache.mapped(filename) as data:
+        ns = GMLParser().parse(data)
+    source = generate(ns, os.path.basename(filename))
+    with open(output, 'w') as fp:
+        fp.write(source)
+    py_compile.compile(output, doraise=True)
+    return output
+
+
+def compile_dir(path):
+    """Write the modules of all .gml files below path, returns the
+    names of the module files.
+    """
+    outputs = []
+    for dirpath, dirnames, names in os.walk(path):
+        dirnames.sort()
+        for name in sorted(names):
+            if name.endswith('.gml'):
+                outputs.append(compile_file(os.path.join(dirpath, name)))
+    return outputs
@@ -0,0 +1,605 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Compiler - turn a parser tree into a flat list of instructions
+
+Type names, pspecs and property values are resolved once, when a
+document is compiled. GMLBuilder then only has to run through the
+instructions to construct the objects, which it can do any number of
+times. Each instruction is a tuple starting with its opcode, objects
+are referred to by the slot they are stored in while executing:
+
+  NEW slot gtype properties dynamic id
+      Create an object with the converted properties. dynamic is a
+      sequence of (name, value_slot, path), properties which are set
+      to the object in value_slot, or to its property path.
+  GET slot parent_slot name
+      Store the object in property name of the parent, eg
+      image { ... } inside a GtkButton.
+  SET slot properties
+      Set properties of an object fetched with GET, its type is only
+      known when executing. properties is a sequence of (name,
+      value_slot, prop), they are set with notify frozen.
+  CONNECT slot signal handler
+      Connect signal to the builder handler with that name.
+  ADD_CHILD parent_slot slot child_type packing
+      Add a child and set the child properties in packing, a sequence
+      of Property nodes. Child notify is frozen until they are set.
+  LAZY slot parent_slot program ids
+      Construct an object marked as lazy later, when one of the ids
+      in its subtree is asked for or when the parent is realized.
+      program is run with the parent in slot 0.
+
+References to other objects are resolved when compiling. The ids of
+the objects in a program are indexed first and their slots assigned,
+then the toplevel objects are ordered so that the ones referred to are
+constructed before the ones referring to them, and a reference
+becomes a slot and a path of property names, eg (slot of b1,
+('parent', 'name')) for b1.parent.name.
+
+What can not be set when creating an object is set by a single fixup
+pass once the whole document has been constructed: references to
+objects constructed later, which happens within a toplevel object or
+with cycles, references to objects outside of the program, which are
+looked up by id, and properties of properties such as
+image.pixel_size. A fixup is a tuple (slot, path, name, reference,
+prop) setting property name of the object in slot, or of its property
+path. reference is (slot, id, path), the slot being None for objects
+outside of the program, or None to convert prop when the fixup is
+applied.
+
+Programs also remember the parser node of each slot, so that the
+objects of a document can be found again when it is reloaded.
+"""
+
+import heapq
+import os
+
+from . import backend
+from .backend import GObject, Gtk
+from .parser import Object, TYPE_IDENTIFIER
+from .stats import timer
+
+(NEW,
+ GET,
+ SET,
+ CONNECT,
+ ADD_CHILD,
+ LAZY) = range(6)
+
+opcode_names = ['NEW', 'GET', 'SET', 'CONNECT', 'ADD_CHILD', 'LAZY']
+
+
+# The entry of a property which a type does not have
+_NO_PROPERTY = (None, None)
+
+
+class TypeCache(object):
+    """GTypes, pspecs and property parsers resolved by name.
+
+    The property parsers are functions taking a builder, a pspec and
+    a Property. Resolving them walks the parents of the value type,
+    the result is remembered per (type name, property name) and shared
+    by all builders.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._property_parsers = {}
+        self._types = {}
+        self._properties = {}
+        self._child_properties = {}
+        self._parsers = {}
+        self._enum_values = {}
+
+    def register_property_parser(self, value_type, parser):
+        self._property_parsers[value_type] = parser
+        self._properties.clear()
+        self._child_properties.clear()
+        self._parsers.clear()
+
+    def has_property_parser(self, value_type):
+        return value_type in self._property_parsers
+
+    def get_type(self, type_name):
+        gtype = self._types.get(type_name)
+        if gtype is None:
+            self.misses += 1
+            gtype = GObject.type_from_name(type_name)
+            self._types[type_name] = gtype
+        else:
+            self.hits += 1
+        return gtype
+
+    def get_property(self, gtype, name):
+        """Returns the pspec and the property parser of property name"""
+        key = (gtype.name, name)
+        entry = self._properties.get(key)
+        if entry is None:
+            self.misses += 1
+            try:
+                pspec = getattr(gtype.pytype.props, name)
+            except AttributeError:
+                # Children and signals are looked up as properties
+                # first, remember that they are not
+                self._properties[key] = _NO_PROPERTY
+                raise
+            entry = (pspec, self.get_parser(pspec.value_type))
+            self._properties[key] = entry
+        else:
+            self.hits += 1
+            if entry is _NO_PROPERTY:
+                raise AttributeError(name)
+        return entry
+
+    def find_property(self, gtype, name):
+        """Returns the pspec of property name, or None if gtype does
+        not have such a property.
+        """
+        try:
+            return self.get_property(gtype, name)[0]
+        except AttributeError:
+            return None
+
+    def get_child_properties(self, container):
+        """Returns a dict mapping the child property names of
+        container to their pspecs and property parsers
+        """
+        return self.get_type_child_properties(container.__gtype__)
+
+    def get_type_child_properties(self, gtype):
+        """Like get_child_properties(), for the container type gtype"""
+        child_properties = self._child_properties.get(gtype.name)
+        if child_properties is None:
+            self.misses += 1
+            child_properties = {}
+            for pspec in backend.list_child_properties(gtype):
+                child_properties[pspec.name] = (
+                    pspec, self.get_parser(pspec.value_type))
+            self._child_properties[gtype.name] = child_properties
+        else:
+            self.hits += 1
+        return child_properties
+
+    def get_enum_values(self, gtype):
+        """Returns a dict mapping the nicks, names and short names of
+        the values of an enum or flags type to the values.
+        """
+        values = self._enum_values.get(gtype.name)
+        if values is not None:
+            self.hits += 1
+            return values
+
+        self.misses += 1
+        if GObject.type_is_a(gtype, GObject.TYPE_FLAGS):
+            members = [(v.first_value_nick, v.first_value_name, v)
+                       for v in gtype.pytype.__flags_values__.values()]
+        else:
+            members = [(v.value_nick, v.value_name, v)
+                       for v in gtype.pytype.__enum_values__.values()]
+
+        # GTK_POLICY_AUTOMATIC -> AUTOMATIC
+        prefix = ''
+        if len(members) > 1:
+            prefix = os.path.commonprefix([name for nick, name, v in members])
+            prefix = prefix[:prefix.rfind('_') + 1]
+
+        values = {}
+        for nick, name, value in members:
+            values[name[len(prefix):]] = value
+            values[name] = value
+            values[nick.replace('-', '_')] = value
+            values[nick] = value
+        self._enum_values[gtype.name] = values
+        return values
+
+    def get_parser(self, value_type):
+        try:
+            return self._parsers[value_type]
+        except KeyError:
+            pass
+
+        parser = None
+        parent_type = value_type
+        while True:
+            parser = self._property_parsers.get(parent_type, None)
+            if parser is not None:
+                break
+            try:
+                parent_type = GObject.type_parent(parent_type)
+            except RuntimeError:
+                break
+        self._parsers[value_type] = parser
+        return parser
+
+    def clear(self):
+        self._types.clear()
+        self._properties.clear()
+        self._child_properties.clear()
+        self._parsers.clear()
+        self._enum_values.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class Program(object):
+    __slots__ = ('instructions', 'n_slots', 'nodes', 'fixups')
+
+    def __init__(self, instructions, nodes, fixups=()):
+        self.instructions = instructions
+        self.n_slots = len(nodes)
+        self.nodes = nodes
+        self.fixups = fixups
+
+    def dump(self):
+        return (['%-10s %s' % (opcode_names[instruction[0]],
+                               ' '.join(map(repr, instruction[1:])))
+                 for instruction in self.instructions] +
+                ['%-10s %s' % ('FIXUP', ' '.join(map(repr, fixup)))
+                 for fixup in self.fixups])
+
+
+def _is_object_type(value_type):
+    return (GObject.type_is_a(value_type, GObject.TYPE_OBJECT) or
+            GObject.type_is_a(value_type, GObject.TYPE_INTERFACE))
+
+
+def is_reference_type(value_type):
+    """Whether an identifier assigned to a property of value_type
+    refers to another object, eg model: liststore1 or label: b1.label
+    """
+    return (_is_object_type(value_type) or
+            GObject.type_is_a(value_type, GObject.TYPE_STRING))
+
+
+def split_reference(value):
+    """b1.parent.name -> 'b1', ('parent', 'name')"""
+    parts = value.split('.')
+    return parts[0], tuple(parts[1:])
+
+
+def _order(deps):
+    # The indexes of deps in topological order, deps[i] are the
+    # indexes which must come before i. Ties and cycles are broken
+    # by taking the lowest index, the order of the document.
+    n = len(deps)
+    waiting = [0] * n
+    users = [[] for i in range(n)]
+    for i, before in enumerate(deps):
+        for j in before:
+            waiting[i] += 1
+            users[j].append(i)
+    ready = [i for i in range(n) if not waiting[i]]
+    heapq.heapify(ready)
+    done = [False] * n
+    order = []
+    first = 0
+    while len(order) < n:
+        if ready:
+            i = heapq.heappop(ready)
+            if done[i]:
+                continue
+        else:
+            while done[first]:
+                first += 1
+            i = first
+        done[i] = True
+        order.append(i)
+        for j in users[i]:
+            waiting[j] -= 1
+            if not waiting[j] and not done[j]:
+                heapq.heappush(ready, j)
+    return order
+
+
+def _object_id(obj):
+    for prop in obj.properties:
+        if prop.name == 'id':
+            return prop.value
+    return None
+
+
+def _packing(obj):
+    for child in obj.children:
+        if child.name == 'packing':
+            return tuple(child.properties)
+    return ()
+
+
+def _collect_ids(obj, ids):
+    for prop in obj.properties:
+        if prop.name == 'id':
+            ids.append(prop.value)
+        elif isinstance(prop.value, Object):
+            _collect_ids(prop.value, ids)
+    for child in obj.children:
+        _collect_ids(child, ids)
+    return ids
+
+
+class GMLCompiler(object):
+    """Compiles toplevel objects into a Program.
+
+    Property values which do not refer to other objects are converted
+    by the property parsers of the builder when compiling, the program
+    does not depend on the builder and can be executed by any of them
+    with the same lazy setting.
+    """
+
+    def __init__(self, builder):
+        self._builder = builder
+        self._instructions = []
+        self._nodes = []
+        # Object -> slot, and id -> object of the objects in the
+        # program which are constructed with it
+        self._slots = {}
+        self._index = {}
+        self._fixups = []
+        # The slots referred to by the object being compiled
+        self._references = set()
+
+    def compile(self, objects):
+        instructions = []
+        for obj, chunk in self.compile_chunks(objects):
+            instructions.extend(chunk)
+        return self._link(instructions)
+
+    def compile_chunks(self, objects):
+        """Compile each toplevel object, returns the objects and their
+        instructions in the order they must be executed in. The
+        instructions are not linked yet, see compile().
+        """
+        # The toplevel object owning each slot
+        owners = {}
+        for i, obj in enumerate(objects):
+            if not self._is_lazy(obj, toplevel=True):
+                for slot in self._prepare(obj):
+                    owners[slot] = i
+
+        chunks = []
+        for obj in objects:
+            self._instructions = []
+            self._references = set()
+            if self._is_lazy(obj, toplevel=True):
+                self._compile_lazy(obj)
+            else:
+                self._compile_object(obj)
+            chunks.append((self._instructions, self._references))
+
+        deps = []
+        for i, (instructions, references) in enumerate(chunks):
+            deps.append(set([owners[slot] for slot in references]) -
+                        set([i]))
+        return [(objects[i], chunks[i][0]) for i in _order(deps)]
+
+    def compile_object(self, obj):
+        """Compile a single object which is not lazy, it is stored in
+        slot 0 when executing.
+        """
+        self._new_slot(obj)
+        self._prepare(obj)
+        self._compile_object(obj)
+        return self._link(self._instructions)
+
+    def compile_child(self, child, parent_type):
+        """Compile a child to add to an existing parent, the parent
+        must be passed to the builder when executing the program.
+        """
+        self._nodes.append(None)
+        if not self._is_lazy(child):
+            self._prepare(child)
+        self._compile_children(0, parent_type, [child])
+        return self._link(self._instructions)
+
+    def _prepare(self, obj):
+        # Index the ids of the objects constructed along with obj and
+        # assign their slots, returns the slots.
+        slots = []
+        for node in self._identified(obj, []):
+            slots.append(self._new_slot(node))
+            self._index[_object_id(node)] = node
+        return slots
+
+    def _identified(self, obj, nodes):
+        if _object_id(obj) is not None:
+            nodes.append(obj)
+        for prop in obj.properties:
+            if isinstance(prop.value, Object):
+                self._identified(prop.value, nodes)
+        for child in obj.children:
+            if child.name != 'packing' and not self._is_lazy(child):
+                self._identified(child, nodes)
+        return nodes
+
+    def _link(self, instructions):
+        # Move the references to objects which are not constructed
+        # yet to the fixups
+        fixups = self._fixups
+        constructed = set()
+        linked = []
+        for instruction in instructions:
+            op = instruction[0]
+            if op == NEW:
+                op, slot, gtype, properties, dynamic, obj_id = instruction
+                if dynamic:
+                    now = []
+                    for name, value_slot, path in dynamic:
+                        if value_slot in constructed:
+                            now.append((name, value_slot, path))
+                        else:
+                            reference = (value_slot,
+                                         _object_id(self._nodes[value_slot]),
+                                         path)
+                            fixups.append((slot, (), name, reference, None))
+                    instruction = (NEW, slot, gtype, properties, tuple(now),
+                                   obj_id)
+                constructed.add(slot)
+            elif op == GET:
+                constructed.add(instruction[1])
+            linked.append(instruction)
+        return Program(linked, self._nodes, tuple(fixups))
+
+    def _is_lazy(self, obj, toplevel=False):
+        for prop in obj.properties:
+            if prop.name == 'lazy':
+                lazy = prop.value == 'true'
+                break
+        else:
+            lazy = toplevel and self._builder.lazy
+        if lazy and toplevel:
+            # Nothing could ask for a toplevel object without an id
+            return _collect_ids(obj, []) != []
+        return lazy
+
+    def _new_slot(self, obj):
+        slot = self._slots.get(obj)
+        if slot is None:
+            slot = len(self._nodes)
+            self._nodes.append(obj)
+            self._slots[obj] = slot
+        return slot
+
+    def _compile_lazy(self, obj, parent_slot=None, parent_type=None):
+        compiler = GMLCompiler(self._builder)
+        if parent_slot is None:
+            program = compiler.compile_object(obj)
+        else:
+            compiler._nodes.append(None)
+            compiler._prepare(obj)
+            compiler._compile_object(obj, 0, parent_type)
+            program = compiler._link(compiler._instructions)
+        self._instructions.append(
+            (LAZY, self._new_slot(obj), parent_slot, program,
+             tuple(_collect_ids(obj, []))))
+
+    def _reference(self, slot, name, value, prop):
+        # Returns the (name, value_slot, path) to create the object
+        # in slot with, or None if the object referred to is not in
+        # the program and has to be looked up by id.
+        target_id, target_path = split_reference(value)
+        target = self._index.get(target_id)
+        if target is None:
+            self._fixups.append((slot, (), name,
+                                 (None, target_id, target_path), prop))
+            return None
+        target_slot = self._slots[target]
+        self._references.add(target_slot)
+        return (name, target_slot, target_path)
+
+    def _compile_object(self, obj, parent_slot=None, parent_type=None):
+        emit = self._instructions.append
+        slot = self._new_slot(obj)
+
+        # A child named after a property of its parent modifies the
+        # object in that property, its real type is only known when
+        # executing.
+        pspec = None
+        if parent_type is not None:
+            pspec = type_cache.find_property(parent_type, obj.name)
+        if pspec is not None:
+            emit((GET, slot, parent_slot, obj.name))
+            gtype = pspec.value_type
+        else:
+            gtype = type_cache.get_type(obj.name)
+
+        obj_id = None
+        child_type = None
+        properties = {}
+        dynamic = []
+        sets = []
+        for prop in obj.properties:
+            name = prop.name
+            if name == 'id':
+                obj_id = prop.value
+                continue
+            if name == 'child_type':
+                child_type = prop.value
+                continue
+            if name == 'lazy':
+                continue
+
+            value_slot = None
+            if isinstance(prop.value, Object):
+                value_slot = self._compile_object(prop.value)
+            if '.' in name:
+                self._compile_fixup(slot, prop, value_slot)
+            elif pspec is not None:
+                sets.append((name, value_slot, prop))
+            elif value_slot is not None:
+                dynamic.append((name, value_slot, ()))
+            else:
+                prop_pspec, parser = type_cache.get_property(gtype, name)
+                if (prop.kind == TYPE_IDENTIFIER and
+                    is_reference_type(prop_pspec.value_type)):
+                    entry = self._reference(slot, name, prop.value, prop)
+                    if entry is not None:
+                        dynamic.append(entry)
+                else:
+                    properties[name] = self._convert_property(
+                        prop_pspec, parser, prop)
+
+        if pspec is None:
+            emit((NEW, slot, gtype, properties, tuple(dynamic), obj_id))
+            if parent_slot is not None and not obj.is_property:
+                emit((ADD_CHILD, parent_slot, slot, child_type,
+                      _packing(obj)))
+        elif sets:
+            emit((SET, slot, tuple(sets)))
+
+        for signal in obj.signals:
+            emit((CONNECT, slot, signal.name, signal.handler))
+
+        # The object in a property can be a container even if the type
+        # of the property is not, adding its children checks that.
+        if (pspec is not None or
+            GObject.type_is_a(gtype, Gtk.Container.__gtype__)):
+            self._compile_children(slot, gtype, obj.children)
+        return slot
+
+    def _compile_fixup(self, slot, prop, value_slot):
+        # image.pixel_size: 32, the type of image is only known when
+        # executing, so is the pspec of pixel_size.
+        path = prop.name.split('.')
+        reference = None
+        if value_slot is not None:
+            reference = (value_slot, None, ())
+        self._fixups.append(
+            (slot, tuple(path[:-1]), path[-1], reference, prop))
+
+    def _convert_property(self, pspec, parser, prop):
+        stats = self._builder.stats
+        if stats is None or stats.nodes is None:
+            return self._builder._convert_property(pspec, parser, prop)
+        t = timer()
+        value = self._builder._convert_property(pspec, parser, prop)
+        stats.add_node(prop, timer() - t)
+        return value
+
+    def _compile_children(self, slot, gtype, children):
+        for child in children:
+            if child.name == 'packing':
+                continue
+            if self._is_lazy(child):
+                self._compile_lazy(child, slot, gtype)
+            else:
+                self._compile_object(child, slot, gtype)
+
+
+type_cache = TypeCache()
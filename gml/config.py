@@ -19,4 +19,29 @@
 
 """Config - global configuration"""
 
+import os
+
 use_pygtk = False
+
+# The GObject bindings, 'gi', 'pygtk' or 'fake', see gml.backend. The
+# fake backend is a pure Python stand-in which does not need a display.
+backend = os.environ.get('GML_BACKEND')
+if not backend:
+    backend = 'pygtk' if use_pygtk else 'gi'
+
+# Compiled (.gmlc) files, see gml.cache
+use_cache = True
+cache_dir = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'gml')
+cache_max_size = 32 * 1024 * 1024
+
+# Number of parse trees kept in memory and shared between builders
+memory_cache_size = 64
+
+# Bytes of source below which cache.parse_files() parses the files
+# itself, starting a pool of workers takes longer than that
+parse_pool_min_size = 1024 * 1024
+
+# Seconds spent constructing objects per main loop iteration by
+# GMLBuilder.add_from_file_async(), half of a frame at 60 Hz
+slice_budget = 0.008
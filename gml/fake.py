@@ -0,0 +1,917 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Fake - a pure Python stand-in for GObject, Gtk and Clutter
+
+Selected with config.backend = 'fake'. It implements the parts the
+builder uses: types looked up by name, properties and their pspecs,
+enums and flags, signals, notify, containers with child properties
+and Buildable.add_child, a Builder loading GtkBuilder XML, and a main
+loop running idle and timeout sources. Nothing is ever drawn, it is
+meant for tests and benchmarks on machines without a display.
+"""
+
+import time
+
+
+class _Module(object):
+    def __init__(self, name):
+        self.__name__ = name
+
+    def __repr__(self):
+        return '<fake module %s>' % (self.__name__, )
+
+GLib = _Module('GLib')
+GObject = _Module('GObject')
+Gtk = _Module('Gtk')
+Clutter = _Module('Clutter')
+
+
+# Types
+
+class GType(object):
+    def __init__(self, name, parent=None, interfaces=()):
+        self.name = name
+        self.parent = parent
+        self.interfaces = interfaces
+        self.pytype = None
+
+    def __repr__(self):
+        return '<GType %s>' % (self.name, )
+
+_types = {}
+
+
+def _register_type(name, parent=None, interfaces=()):
+    gtype = GType(name, parent, interfaces)
+    _types[name] = gtype
+    return gtype
+
+
+def type_from_name(name):
+    try:
+        return _types[name]
+    except KeyError:
+        raise RuntimeError("unknown type name: %s" % (name, ))
+
+
+def type_parent(gtype):
+    if gtype.parent is None:
+        raise RuntimeError("no parent for %s" % (gtype.name, ))
+    return gtype.parent
+
+
+def type_is_a(gtype, is_a_type):
+    while gtype is not None:
+        if gtype is is_a_type:
+            return True
+        for interface in gtype.interfaces:
+            if type_is_a(interface, is_a_type):
+                return True
+        gtype = gtype.parent
+    return False
+
+
+def type_name(gtype):
+    return gtype.name
+
+GObject.type_from_name = type_from_name
+GObject.type_parent = type_parent
+GObject.type_is_a = type_is_a
+GObject.type_name = type_name
+
+GObject.TYPE_NONE = _register_type('void')
+GObject.TYPE_BOOLEAN = _register_type('gboolean')
+GObject.TYPE_INT = _register_type('gint')
+GObject.TYPE_UINT = _register_type('guint')
+GObject.TYPE_DOUBLE = _register_type('gdouble')
+GObject.TYPE_STRING = _register_type('gchararray')
+GObject.TYPE_ENUM = _register_type('GEnum')
+GObject.TYPE_FLAGS = _register_type('GFlags')
+GObject.TYPE_OBJECT = _register_type('GObject')
+# Interfaces have GObject as their prerequisite
+GObject.TYPE_INTERFACE = _register_type('GInterface', None,
+                                        (GObject.TYPE_OBJECT, ))
+
+
+def _register_interface(name):
+    return _register_type(name, GObject.TYPE_INTERFACE)
+
+
+# Enums and flags
+
+class EnumValue(int):
+    def __new__(cls, value, nick, name):
+        self = int.__new__(cls, value)
+        self.value_nick = nick
+        self.value_name = name
+        return self
+
+    def __repr__(self):
+        return '<enum %s>' % (self.value_name, )
+
+
+class FlagsValue(int):
+    def __new__(cls, value, nick=None, name=None):
+        self = int.__new__(cls, value)
+        self.first_value_nick = nick
+        self.first_value_name = name
+        return self
+
+    def __or__(self, other):
+        return FlagsValue(int(self) | int(other))
+
+    def __repr__(self):
+        return '<flags %d>' % (self, )
+
+
+def _enum_class(name, parent, prefix, values):
+    # Like the static bindings, the values are also available on the
+    # module, Gtk.POLICY_AUTOMATIC, and on the class, as AUTOMATIC
+    gtype = _register_type(name, parent)
+    if parent is GObject.TYPE_FLAGS:
+        namespace = {'__gtype__': gtype, '__flags_values__': values}
+        names = [(v.first_value_name, v) for v in values.values()]
+    else:
+        namespace = {'__gtype__': gtype, '__enum_values__': values}
+        names = [(v.value_name, v) for v in values.values()]
+    for value_name, value in names:
+        setattr(Gtk, value_name.split('_', 1)[1], value)
+        namespace[value_name[len(prefix):]] = value
+    cls = type(name[3:], (object, ), namespace)
+    gtype.pytype = cls
+    return cls
+
+
+def _enum(name, prefix, nicks):
+    values = {}
+    for value, nick in enumerate(nicks):
+        values[value] = EnumValue(
+            value, nick, prefix + nick.upper().replace('-', '_'))
+    return _enum_class(name, GObject.TYPE_ENUM, prefix, values)
+
+
+def _flags(name, prefix, nicks):
+    values = {}
+    for i, nick in enumerate(nicks):
+        values[1 << i] = FlagsValue(
+            1 << i, nick, prefix + nick.upper().replace('-', '_'))
+    return _enum_class(name, GObject.TYPE_FLAGS, prefix, values)
+
+
+# Properties
+
+class ParamSpec(object):
+    def __init__(self, name, value_type, default=None):
+        self.name = name
+        self.value_type = value_type
+        # A callable creates the default value of each instance,
+        # for object properties which are constructed by the object.
+        self.default = default
+
+    @property
+    def default_value(self):
+        if callable(self.default):
+            return None
+        return self.default
+
+    def __repr__(self):
+        return '<ParamSpec %s %s>' % (self.name, self.value_type.name)
+
+
+class _Props(object):
+    # obj.props, or the pspecs when accessed on the class
+    def __init__(self, pspecs, instance):
+        self.__dict__['_pspecs'] = pspecs
+        self.__dict__['_instance'] = instance
+
+    def __getattr__(self, name):
+        pspec = self._pspecs.get(name.replace('-', '_'))
+        if pspec is None:
+            raise AttributeError(name)
+        if self._instance is None:
+            return pspec
+        return self._instance.get_property(pspec.name)
+
+    def __setattr__(self, name, value):
+        self._instance.set_property(name, value)
+
+
+class _PropsDescriptor(object):
+    def __get__(self, instance, owner):
+        if instance is None:
+            return _Props(owner._pspecs, None)
+        return _Props(instance._pspecs, instance)
+
+
+# Objects
+
+class Object(object):
+    """GObject.Object, with properties, signals and notify"""
+
+    __gtype__ = GObject.TYPE_OBJECT
+    _pspecs = {}
+    props = _PropsDescriptor()
+    _next_handler_id = [0]
+
+    def __init__(self, **properties):
+        self._values = {}
+        self._handlers = {}
+        self._notify_frozen = 0
+        self._notify_queue = []
+        for name, value in properties.items():
+            self.set_property(name, value)
+
+    def _get_pspec(self, name):
+        pspec = self._pspecs.get(name.replace('-', '_'))
+        if pspec is None:
+            raise TypeError("object of type `%s' does not have property `%s'"
+                            % (self.__gtype__.name, name))
+        return pspec
+
+    def set_property(self, name, value):
+        pspec = self._get_pspec(name)
+        self._values[pspec.name] = value
+        self.notify(pspec.name)
+
+    def get_property(self, name):
+        pspec = self._get_pspec(name)
+        try:
+            return self._values[pspec.name]
+        except KeyError:
+            pass
+        value = pspec.default
+        if callable(value):
+            value = self._values[pspec.name] = value()
+        return value
+
+    def notify(self, name):
+        if self._notify_frozen:
+            if name not in self._notify_queue:
+                self._notify_queue.append(name)
+        else:
+            self.emit('notify', self._pspecs[name])
+
+    def freeze_notify(self):
+        self._notify_frozen += 1
+
+    def thaw_notify(self):
+        self._notify_frozen -= 1
+        if not self._notify_frozen:
+            queue = self._notify_queue
+            self._notify_queue = []
+            for name in queue:
+                self.notify(name)
+
+    def connect(self, signal, handler, *data):
+        self._next_handler_id[0] += 1
+        handler_id = self._next_handler_id[0]
+        self._handlers.setdefault(signal.split('::')[0], []).append(
+            (handler_id, handler, data))
+        return handler_id
+
+    def disconnect(self, handler_id):
+        for handlers in self._handlers.values():
+            handlers[:] = [h for h in handlers if h[0] != handler_id]
+
+    def disconnect_by_func(self, func):
+        for handlers in self._handlers.values():
+            handlers[:] = [h for h in handlers if h[1] != func]
+
+    def handler_count(self, signal):
+        return len(self._handlers.get(signal, ()))
+
+    def emit(self, signal, *args):
+        for handler_id, handler, data in list(self._handlers.get(signal, ())):
+            handler(self, *(args + data))
+
+GObject.GObject = GObject.Object = Object
+GObject.ParamSpec = ParamSpec
+
+
+def new(gtype, **properties):
+    return gtype.pytype(**properties)
+
+GObject.new = new
+
+
+def _class(name, parent, properties=(), child_properties=None,
+           interfaces=()):
+    """Create a class for the type name, with the properties of
+    parent and properties, a sequence of ParamSpecs.
+    """
+    gtype = _register_type(name, parent.__gtype__, interfaces)
+    pspecs = dict(parent._pspecs)
+    for pspec in properties:
+        pspecs[pspec.name] = pspec
+    namespace = {'__gtype__': gtype, '_pspecs': pspecs}
+    if child_properties is not None:
+        child_pspecs = dict(parent._child_pspecs)
+        for pspec in child_properties:
+            child_pspecs[pspec.name] = pspec
+        namespace['_child_pspecs'] = child_pspecs
+    for prefix in ['Gtk', 'Clutter']:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    cls = type(name, (parent, ), namespace)
+    gtype.pytype = cls
+    return cls
+
+P = ParamSpec
+
+
+# Gtk
+
+Gtk.Orientation = _enum('GtkOrientation', 'GTK_ORIENTATION_',
+                        ['horizontal', 'vertical'])
+Gtk.PolicyType = _enum('GtkPolicyType', 'GTK_POLICY_',
+                       ['always', 'automatic', 'never'])
+Gtk.ShadowType = _enum('GtkShadowType', 'GTK_SHADOW_',
+                       ['none', 'in', 'out', 'etched-in', 'etched-out'])
+Gtk.EventMask = _flags('GdkEventMask', 'GDK_',
+                       ['exposure-mask', 'pointer-motion-mask',
+                        'pointer-motion-hint-mask', 'button-motion-mask',
+                        'button1-motion-mask', 'button2-motion-mask',
+                        'button3-motion-mask', 'button-press-mask',
+                        'button-release-mask', 'key-press-mask',
+                        'key-release-mask'])
+_tree_model = _register_interface('GtkTreeModel')
+_buildable = _register_interface('GtkBuildable')
+
+
+class Widget(_class('GtkWidget', Object, [
+    P('name', GObject.TYPE_STRING, ''),
+    P('parent', GObject.TYPE_OBJECT),
+    P('visible', GObject.TYPE_BOOLEAN, False),
+    P('sensitive', GObject.TYPE_BOOLEAN, True),
+    P('tooltip_text', GObject.TYPE_STRING),
+    P('events', Gtk.EventMask.__gtype__, FlagsValue(0)),
+    P('width_request', GObject.TYPE_INT, -1),
+    P('height_request', GObject.TYPE_INT, -1),
+    ], interfaces=(_buildable, ))):
+
+    _child_pspecs = {}
+
+    def __init__(self, **properties):
+        self._realized = False
+        self._child_notify_frozen = 0
+        self._child_notify_queue = []
+        super(Widget, self).__init__(**properties)
+
+    def get_parent(self):
+        return self.get_property('parent')
+
+    def show(self):
+        self.set_property('visible', True)
+
+    def hide(self):
+        self.set_property('visible', False)
+
+    def realize(self):
+        if not self._realized:
+            self._realized = True
+            self.emit('realize')
+
+    def get_realized(self):
+        return self._realized
+
+    def destroy(self):
+        self.emit('destroy')
+
+    def child_notify(self, name):
+        if self._child_notify_frozen:
+            if name not in self._child_notify_queue:
+                self._child_notify_queue.append(name)
+        else:
+            parent = self.get_parent()
+            self.emit('child-notify', parent._child_pspecs[name])
+
+    def freeze_child_notify(self):
+        self._child_notify_frozen += 1
+
+    def thaw_child_notify(self):
+        self._child_notify_frozen -= 1
+        if not self._child_notify_frozen:
+            queue = self._child_notify_queue
+            self._child_notify_queue = []
+            for name in queue:
+                self.child_notify(name)
+
+Widget.__gtype__.pytype = Widget
+
+
+class ContainerClass(object):
+    # The class structure of GtkContainer, its methods take the class
+    # of a container like the gi ones
+    @staticmethod
+    def list_child_properties(cls):
+        return list(cls._child_pspecs.values())
+
+
+class Container(_class('GtkContainer', Widget)):
+    def __init__(self, **properties):
+        self._children = []
+        self._child_values = {}
+        super(Container, self).__init__(**properties)
+
+    def add(self, child):
+        self._children.append(child)
+        child.set_property('parent', self)
+        if self._realized:
+            child.realize()
+
+    def remove(self, child):
+        self._children.remove(child)
+        for key in list(self._child_values):
+            if key[0] is child:
+                del self._child_values[key]
+        child.set_property('parent', None)
+
+    def get_children(self):
+        return list(self._children)
+
+    def list_child_properties(self):
+        return ContainerClass.list_child_properties(type(self))
+
+    def _get_child_pspec(self, name):
+        pspec = self._child_pspecs.get(name.replace('-', '_'))
+        if pspec is None:
+            raise TypeError("container `%s' does not have child property "
+                            "`%s'" % (self.__gtype__.name, name))
+        return pspec
+
+    def child_set_property(self, child, name, value):
+        pspec = self._get_child_pspec(name)
+        self._child_values[(child, pspec.name)] = value
+        child.child_notify(pspec.name)
+
+    def child_get_property(self, child, name):
+        pspec = self._get_child_pspec(name)
+        return self._child_values.get((child, pspec.name), pspec.default)
+
+    def realize(self):
+        super(Container, self).realize()
+        for child in self._children:
+            child.realize()
+
+Container.__gtype__.pytype = Container
+
+
+class Bin(_class('GtkBin', Container)):
+    def get_child(self):
+        if self._children:
+            return self._children[0]
+
+Bin.__gtype__.pytype = Bin
+
+
+class Box(_class('GtkBox', Container, [
+    P('orientation', Gtk.Orientation.__gtype__, Gtk.ORIENTATION_HORIZONTAL),
+    P('spacing', GObject.TYPE_INT, 0),
+    P('homogeneous', GObject.TYPE_BOOLEAN, False),
+    ], [
+    P('expand', GObject.TYPE_BOOLEAN, True),
+    P('fill', GObject.TYPE_BOOLEAN, True),
+    P('padding', GObject.TYPE_UINT, 0),
+    ])):
+
+    def add(self, child):
+        # Like gtk_box_pack(), which notifies all the child properties
+        child.freeze_child_notify()
+        super(Box, self).add(child)
+        for name in sorted(self._child_pspecs):
+            child.child_notify(name)
+        child.thaw_child_notify()
+
+    def reorder_child(self, child, position):
+        self._children.remove(child)
+        self._children.insert(position, child)
+
+Box.__gtype__.pytype = Box
+
+
+class Image(_class('GtkImage', Widget, [
+    P('pixel_size', GObject.TYPE_INT, -1),
+    P('stock', GObject.TYPE_STRING),
+    P('icon_name', GObject.TYPE_STRING),
+    ])):
+
+    def get_pixel_size(self):
+        return self.get_property('pixel_size')
+
+    def get_stock(self):
+        return self.get_property('stock'), 0
+
+Image.__gtype__.pytype = Image
+
+
+class Button(_class('GtkButton', Bin, [
+    P('label', GObject.TYPE_STRING),
+    P('use_underline', GObject.TYPE_BOOLEAN, False),
+    P('use_stock', GObject.TYPE_BOOLEAN, False),
+    P('image', Image.__gtype__, Image),
+    ])):
+
+    def get_label(self):
+        return self.get_property('label')
+
+    def get_image(self):
+        return self.get_property('image')
+
+    def clicked(self):
+        self.emit('clicked')
+
+Button.__gtype__.pytype = Button
+
+
+Gtk.MenuShell = _class('GtkMenuShell', Container)
+Gtk.Menu = _class('GtkMenu', Gtk.MenuShell)
+
+
+class MenuItem(_class('GtkMenuItem', Bin, [
+    P('label', GObject.TYPE_STRING),
+    P('use_underline', GObject.TYPE_BOOLEAN, False),
+    P('submenu', Gtk.Menu.__gtype__),
+    ])):
+
+    def get_submenu(self):
+        return self.get_property('submenu')
+
+    def set_submenu(self, submenu):
+        self.set_property('submenu', submenu)
+
+    def activate(self):
+        self.emit('activate')
+
+MenuItem.__gtype__.pytype = MenuItem
+
+
+class Action(_class('GtkAction', Object, [
+    P('name', GObject.TYPE_STRING),
+    P('label', GObject.TYPE_STRING),
+    P('stock_id', GObject.TYPE_STRING),
+    ])):
+
+    def activate(self):
+        self.emit('activate')
+
+Action.__gtype__.pytype = Action
+
+
+class TreeView(_class('GtkTreeView', Container, [
+    P('model', _tree_model),
+    P('tooltip_column', GObject.TYPE_INT, -1),
+    P('headers_visible', GObject.TYPE_BOOLEAN, True),
+    ])):
+
+    def __init__(self, **properties):
+        self._columns = []
+        super(TreeView, self).__init__(**properties)
+
+    def append_column(self, column):
+        self._columns.append(column)
+        return len(self._columns)
+
+    def get_columns(self):
+        return list(self._columns)
+
+TreeView.__gtype__.pytype = TreeView
+Gtk.TreeViewColumn = _class('GtkTreeViewColumn', Object, [
+    P('title', GObject.TYPE_STRING, ''),
+    ])
+
+
+def _value_from_string(pspec, text):
+    # Like gtk_builder_value_from_string(), for the types above
+    value_type = pspec.value_type
+    if value_type is GObject.TYPE_BOOLEAN:
+        lower = text.strip().lower()
+        if lower in ['true', 't', 'yes', 'y', '1']:
+            return True
+        elif lower in ['false', 'f', 'no', 'n', '0']:
+            return False
+    elif value_type in [GObject.TYPE_INT, GObject.TYPE_UINT]:
+        return int(text)
+    elif value_type is GObject.TYPE_DOUBLE:
+        return float(text)
+    elif value_type is GObject.TYPE_STRING:
+        return text
+    elif type_is_a(value_type, GObject.TYPE_ENUM):
+        values = value_type.pytype.__enum_values__
+        if text.isdigit():
+            return values[int(text)]
+        for value in values.values():
+            if text in [value.value_nick, value.value_name]:
+                return value
+    elif type_is_a(value_type, GObject.TYPE_FLAGS):
+        if text.isdigit():
+            return FlagsValue(int(text))
+        values = value_type.pytype.__flags_values__.values()
+        result = FlagsValue(0)
+        for part in text.split('|'):
+            part = part.strip()
+            for value in values:
+                if part in [value.first_value_nick, value.first_value_name]:
+                    result = result | value
+                    break
+            else:
+                break
+        else:
+            return result
+    raise ValueError("Could not parse %r as %s" % (text, value_type.name))
+
+
+class Builder(Object):
+    """Gtk.Builder, constructing the objects of GtkBuilder XML. Object
+    properties are set once all the objects exist.
+    """
+
+    def __init__(self, **properties):
+        self._built = {}
+        self._signals = []
+        super(Builder, self).__init__(**properties)
+
+    def add_from_string(self, string, length=-1):
+        from xml.etree import ElementTree
+        delayed = []
+        for element in ElementTree.fromstring(string).findall('object'):
+            self._construct(element, delayed)
+        for inst, name, obj_id in delayed:
+            obj = self._built.get(obj_id)
+            if obj is None:
+                raise ValueError("Invalid object id `%s'" % (obj_id, ))
+            inst.set_property(name, obj)
+        return 1
+
+    def _construct(self, element, delayed):
+        gtype = type_from_name(element.get('class'))
+        properties = {}
+        references = []
+        for prop in element.findall('property'):
+            pspec = getattr(gtype.pytype.props, prop.get('name'))
+            if type_is_a(pspec.value_type, GObject.TYPE_OBJECT):
+                references.append((pspec.name, prop.text))
+            else:
+                properties[pspec.name] = _value_from_string(
+                    pspec, prop.text or '')
+        inst = new(gtype, **properties)
+        self._built[element.get('id')] = inst
+        for name, obj_id in references:
+            delayed.append((inst, name, obj_id))
+        for signal in element.findall('signal'):
+            self._signals.append(
+                (inst, signal.get('name'), signal.get('handler')))
+
+        for child in element.findall('child'):
+            child_inst = self._construct(child.find('object'), delayed)
+            _Buildable.add_child(inst, self, child_inst, child.get('type'))
+            packing = child.find('packing')
+            if packing is not None:
+                for prop in packing.findall('property'):
+                    pspec = inst._get_child_pspec(prop.get('name'))
+                    inst.child_set_property(
+                        child_inst, pspec.name,
+                        _value_from_string(pspec, prop.text or ''))
+        return inst
+
+    def get_object(self, name):
+        return self._built.get(name)
+
+    def get_objects(self):
+        return list(self._built.values())
+
+    def connect_signals(self, handlers):
+        for inst, signal, handler in self._signals:
+            try:
+                func = handlers[handler]
+            except KeyError:
+                raise AttributeError("Handler %s not found" % (handler, ))
+            inst.connect(signal, func)
+        self._signals = []
+
+
+class _Buildable(object):
+    @staticmethod
+    def add_child(buildable, builder, child, type=None):
+        if type == 'submenu' and isinstance(buildable, MenuItem):
+            buildable.set_submenu(child)
+        elif (isinstance(buildable, TreeView) and
+              isinstance(child, Gtk.TreeViewColumn)):
+            buildable.append_column(child)
+        elif isinstance(buildable, Container):
+            buildable.add(child)
+        else:
+            raise TypeError("%s can not have children" % (
+                buildable.__gtype__.name, ))
+
+
+# Main loop
+
+class _MainLoop(object):
+    # Sources are dispatched in the order they were added, timeouts
+    # once they are due. Priorities are ignored. As there are no
+    # events, run() also returns when no source is left.
+
+    def __init__(self):
+        self.sources = {}
+        self.next_id = 1
+        self.quit = False
+
+    def add(self, interval, func, args):
+        source_id = self.next_id
+        self.next_id += 1
+        due = None
+        if interval is not None:
+            due = time.time() + interval / 1000.0
+        self.sources[source_id] = [interval, due, func, args]
+        return source_id
+
+    def remove(self, source_id):
+        return self.sources.pop(source_id, None) is not None
+
+    def iteration(self):
+        if not self.sources:
+            return False
+        now = time.time()
+        ready = [source_id for source_id, source in self.sources.items()
+                 if source[1] is None or source[1] <= now]
+        if not ready:
+            time.sleep(min([source[1] for source in self.sources.values()])
+                       - now)
+            return True
+        for source_id in sorted(ready):
+            source = self.sources.get(source_id)
+            if source is None:
+                continue
+            interval, due, func, args = source
+            if not func(*args):
+                self.remove(source_id)
+            elif interval is not None:
+                source[1] = time.time() + interval / 1000.0
+        return True
+
+    def run(self):
+        while not self.quit and self.iteration():
+            pass
+        self.quit = False
+
+_loop = _MainLoop()
+
+
+def idle_add(func, *args, **kwargs):
+    return _loop.add(None, func, args)
+
+
+def timeout_add(interval, func, *args, **kwargs):
+    return _loop.add(interval, func, args)
+
+
+def source_remove(source_id):
+    return _loop.remove(source_id)
+
+
+def _main():
+    _loop.run()
+
+
+def _main_quit(*args):
+    _loop.quit = True
+
+
+def _main_iteration(block=True):
+    _loop.iteration()
+    return False
+
+GLib.PRIORITY_HIGH = -100
+GLib.PRIORITY_DEFAULT = 0
+GLib.PRIORITY_HIGH_IDLE = 100
+GLib.PRIORITY_DEFAULT_IDLE = 200
+GLib.PRIORITY_LOW = 300
+GLib.idle_add = idle_add
+GLib.timeout_add = timeout_add
+GLib.source_remove = source_remove
+
+Gtk.Widget = Widget
+Gtk.Container = Container
+Gtk.ContainerClass = ContainerClass
+Gtk.Bin = Bin
+Gtk.Box = Box
+Gtk.VBox = _class('GtkVBox', Box)
+Gtk.HBox = _class('GtkHBox', Box)
+Gtk.Image = Image
+Gtk.Button = Button
+Gtk.Label = _class('GtkLabel', Widget, [
+    P('label', GObject.TYPE_STRING, ''),
+    P('use_markup', GObject.TYPE_BOOLEAN, False),
+    P('use_underline', GObject.TYPE_BOOLEAN, False),
+    ])
+Gtk.Entry = _class('GtkEntry', Widget, [
+    P('text', GObject.TYPE_STRING, ''),
+    P('editable', GObject.TYPE_BOOLEAN, True),
+    ])
+Gtk.Window = _class('GtkWindow', Bin, [
+    P('title', GObject.TYPE_STRING),
+    P('default_width', GObject.TYPE_INT, -1),
+    P('default_height', GObject.TYPE_INT, -1),
+    P('modal', GObject.TYPE_BOOLEAN, False),
+    ])
+Gtk.Dialog = _class('GtkDialog', Gtk.Window)
+Gtk.ScrolledWindow = _class('GtkScrolledWindow', Bin, [
+    P('hscrollbar_policy', Gtk.PolicyType.__gtype__, Gtk.POLICY_ALWAYS),
+    P('vscrollbar_policy', Gtk.PolicyType.__gtype__, Gtk.POLICY_ALWAYS),
+    P('shadow_type', Gtk.ShadowType.__gtype__, Gtk.SHADOW_NONE),
+    ])
+Gtk.MenuBar = _class('GtkMenuBar', Gtk.MenuShell)
+Gtk.MenuItem = MenuItem
+Gtk.ImageMenuItem = _class('GtkImageMenuItem', MenuItem, [
+    P('use_stock', GObject.TYPE_BOOLEAN, False),
+    P('image', Image.__gtype__),
+    ])
+Gtk.SeparatorMenuItem = _class('GtkSeparatorMenuItem', MenuItem)
+Gtk.Toolbar = _class('GtkToolbar', Container, [], [
+    P('expand', GObject.TYPE_BOOLEAN, False),
+    P('homogeneous', GObject.TYPE_BOOLEAN, True),
+    ])
+Gtk.ToolItem = _class('GtkToolItem', Bin)
+Gtk.ToolButton = _class('GtkToolButton', Gtk.ToolItem, [
+    P('label', GObject.TYPE_STRING),
+    P('stock_id', GObject.TYPE_STRING),
+    ])
+Gtk.SeparatorToolItem = _class('GtkSeparatorToolItem', Gtk.ToolItem)
+Gtk.Statusbar = _class('GtkStatusbar', Box)
+Gtk.TreeView = TreeView
+Gtk.CellRenderer = _class('GtkCellRenderer', Object)
+Gtk.CellRendererText = _class('GtkCellRendererText', Gtk.CellRenderer, [
+    P('text', GObject.TYPE_STRING),
+    ])
+Gtk.ListStore = _class('GtkListStore', Object, interfaces=(_tree_model, ))
+Gtk.Action = Action
+Gtk.Builder = Builder
+Gtk.Buildable = _Buildable
+Gtk.main = _main
+Gtk.main_quit = _main_quit
+Gtk.main_iteration = _main_iteration
+
+
+# Clutter
+
+class Color(_class('ClutterColor', Object)):
+    def __init__(self, name=None, **properties):
+        super(Color, self).__init__(**properties)
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Color) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return '<Color %s>' % (self.name, )
+
+Color.__gtype__.pytype = Color
+
+
+def color_from_string(name):
+    return Color(name)
+
+Clutter.Color = Color
+Clutter.color_from_string = color_from_string
+Clutter.Actor = _class('ClutterActor', Object, [
+    P('name', GObject.TYPE_STRING),
+    P('x', GObject.TYPE_INT, 0),
+    P('y', GObject.TYPE_INT, 0),
+    P('width', GObject.TYPE_INT, 0),
+    P('height', GObject.TYPE_INT, 0),
+    P('visible', GObject.TYPE_BOOLEAN, False),
+    ])
+Clutter.Stage = _class('ClutterStage', Clutter.Actor, [
+    P('color', Color.__gtype__),
+    P('title', GObject.TYPE_STRING),
+    ])
+Clutter.Text = _class('ClutterText', Clutter.Actor, [
+    P('text', GObject.TYPE_STRING, ''),
+    P('color', Color.__gtype__),
+    P('font_name', GObject.TYPE_STRING),
+    ])
+Clutter.main = _main
+Clutter.main_quit = _main_quit
@@ -0,0 +1,265 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""GtkBuilder - translate a parser tree into GtkBuilder XML
+
+GMLBuilder(native=True) hands the construction of a document over to
+Gtk.Builder: the tree is translated once, and a single
+add_from_string() of the XML creates the objects, sets their
+properties, adds the children and sets their packing in C.
+
+Property values are converted by the property parsers of the builder
+when translating and written in the form Gtk.Builder reads back,
+enums and flags as numbers. Every object gets an id, the one of the
+document or gml-N, so that the objects can be found again. An object
+in a property is written as a toplevel object and referred to by id.
+Signals are connected by the builder, which keeps the handler ids.
+
+What the XML can not express is left to the fixups of the builder,
+see gml.compiler: references to properties of other objects, such as
+b1.label, references to objects outside of the document, properties
+of properties such as image.pixel_size, and values without a string
+form. Documents with lazy objects, or with objects modifying the
+object in a property of their parent, are not translated.
+"""
+
+from xml.sax.saxutils import escape, quoteattr
+
+from .backend import GObject, Gtk
+from .compiler import type_cache, is_reference_type, split_reference
+from .parser import Object, TYPE_IDENTIFIER
+
+try:
+    _int_types = (int, long)
+    _string_types = (str, unicode)
+except NameError:
+    _int_types = (int, )
+    _string_types = (str, )
+
+
+class Translation(object):
+    """The XML of a document. nodes are the parser nodes of the
+    objects, ids their ids in the document or None, in the order of
+    the slots the fixups and the (slot, signal, handler) signals refer
+    to.
+    """
+
+    __slots__ = ('xml', 'nodes', 'ids', 'fixups', 'signals')
+
+    def __init__(self, xml, nodes, ids, fixups, signals):
+        self.xml = xml
+        self.nodes = nodes
+        self.ids = ids
+        self.fixups = fixups
+        self.signals = signals
+
+    def object_id(self, slot):
+        """The id of the object in slot in the XML"""
+        return _xml_id(self.ids[slot], slot)
+
+
+class _Untranslatable(Exception):
+    pass
+
+
+def _object_id(obj):
+    for prop in obj.properties:
+        if prop.name == 'id':
+            return prop.value
+    return None
+
+
+def _collect_ids(obj, ids):
+    obj_id = _object_id(obj)
+    if obj_id is not None:
+        ids.add(obj_id)
+    for prop in obj.properties:
+        if isinstance(prop.value, Object):
+            _collect_ids(prop.value, ids)
+    for child in obj.children:
+        _collect_ids(child, ids)
+    return ids
+
+
+def _xml_id(obj_id, slot):
+    # Identifiers can not contain a -, the generated ids never clash
+    # with the ones of the document
+    if obj_id is None:
+        return 'gml-%d' % (slot, )
+    return obj_id
+
+
+def _value_text(value):
+    # The string Gtk.Builder parses back into value, or None
+    if isinstance(value, bool):
+        if value:
+            return 'True'
+        return 'False'
+    elif isinstance(value, _int_types):
+        return str(int(value))
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, _string_types):
+        return value
+    return None
+
+
+class _Translator(object):
+    def __init__(self, builder):
+        self._builder = builder
+        self._lines = []
+        self._nodes = []
+        self._ids = []
+        self._fixups = []
+        self._signals = []
+        # Ids defined in the document, and the slots of the objects
+        # in properties, which are written after the current toplevel
+        self._document_ids = set()
+        self._pending = []
+
+    def translate(self, ns):
+        for obj in ns.objects:
+            _collect_ids(obj, self._document_ids)
+        self._lines.append('<interface>')
+        for obj in ns.objects:
+            self._write_object(obj, self._new_slot(obj), 1)
+            while self._pending:
+                slot = self._pending.pop(0)
+                self._write_object(self._nodes[slot], slot, 1)
+        self._lines.append('</interface>')
+        return Translation('\n'.join(self._lines), self._nodes, self._ids,
+                           tuple(self._fixups), tuple(self._signals))
+
+    def _new_slot(self, obj):
+        self._nodes.append(obj)
+        self._ids.append(_object_id(obj))
+        return len(self._nodes) - 1
+
+    def _write_object(self, obj, slot, indent):
+        emit = self._lines.append
+        pad = '  ' * indent
+        gtype = type_cache.get_type(obj.name)
+        emit('%s<object class=%s id=%s>' % (
+            pad, quoteattr(gtype.name),
+            quoteattr(_xml_id(self._ids[slot], slot))))
+        for prop in obj.properties:
+            name = prop.name
+            if name == 'lazy':
+                if prop.value == 'true':
+                    raise _Untranslatable("lazy object")
+                continue
+            elif name in ['id', 'child_type']:
+                continue
+
+            value_slot = None
+            if isinstance(prop.value, Object):
+                value_slot = self._new_slot(prop.value)
+                self._pending.append(value_slot)
+            if '.' in name:
+                path = name.split('.')
+                reference = None
+                if value_slot is not None:
+                    reference = (value_slot, None, ())
+                self._fixups.append(
+                    (slot, tuple(path[:-1]), path[-1], reference, prop))
+                continue
+
+            if value_slot is not None:
+                text = _xml_id(self._ids[value_slot], value_slot)
+            else:
+                text = self._property_text(slot, gtype, prop)
+                if text is None:
+                    continue
+            emit('%s  <property name=%s>%s</property>' % (
+                pad, quoteattr(name), escape(text)))
+
+        for signal in obj.signals:
+            self._signals.append((slot, signal.name, signal.handler))
+
+        if GObject.type_is_a(gtype, Gtk.Container.__gtype__):
+            for child in obj.children:
+                if child.name != 'packing':
+                    self._write_child(child, gtype, indent + 1)
+        emit('%s</object>' % (pad, ))
+
+    def _property_text(self, slot, gtype, prop):
+        # Returns the text of a property, or None if it is set by a
+        # fixup
+        pspec, parser = type_cache.get_property(gtype, prop.name)
+        if (prop.kind == TYPE_IDENTIFIER and
+            is_reference_type(pspec.value_type)):
+            obj_id, path = split_reference(prop.value)
+            if (not path and obj_id in self._document_ids and
+                not GObject.type_is_a(pspec.value_type,
+                                      GObject.TYPE_STRING)):
+                return obj_id
+            self._fixups.append(
+                (slot, (), prop.name, (None, obj_id, path), prop))
+            return None
+        text = _value_text(
+            self._builder._convert_property(pspec, parser, prop))
+        if text is None:
+            self._fixups.append((slot, (), prop.name, None, prop))
+        return text
+
+    def _write_child(self, child, parent_type, indent):
+        if type_cache.find_property(parent_type, child.name) is not None:
+            raise _Untranslatable("property object %s" % (child.name, ))
+        emit = self._lines.append
+        pad = '  ' * indent
+        for prop in child.properties:
+            if prop.name == 'child_type':
+                emit('%s<child type=%s>' % (pad, quoteattr(prop.value)))
+                break
+        else:
+            emit('%s<child>' % (pad, ))
+        self._write_object(child, self._new_slot(child), indent + 1)
+
+        for packing in child.children:
+            if packing.name == 'packing':
+                if packing.properties:
+                    self._write_packing(packing, parent_type, indent + 1)
+                break
+        emit('%s</child>' % (pad, ))
+
+    def _write_packing(self, packing, parent_type, indent):
+        emit = self._lines.append
+        pad = '  ' * indent
+        child_properties = type_cache.get_type_child_properties(parent_type)
+        emit('%s<packing>' % (pad, ))
+        for prop in packing.properties:
+            pspec, parser = child_properties[prop.name]
+            text = _value_text(
+                self._builder._convert_property(pspec, parser, prop))
+            if text is None:
+                raise _Untranslatable("child property %s" % (prop.name, ))
+            emit('%s  <property name=%s>%s</property>' % (
+                pad, quoteattr(prop.name), escape(text)))
+        emit('%s</packing>' % (pad, ))
+
+
+def translate(ns, builder):
+    """Returns the Translation of the parser tree ns, or None if it
+    can not be expressed as GtkBuilder XML. The imports of ns must be
+    done by builder first, its property parsers convert the values.
+    """
+    try:
+        return _Translator(builder).translate(ns)
+    except _Untranslatable:
+        return None
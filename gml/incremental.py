@@ -0,0 +1,374 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Incremental - parse only the part of a document changed by an edit
+
+A Document remembers where each object of its tree starts and ends in
+the source. After an edit it parses the smallest object enclosing the
+changed text again, on its own, and splices the result into a copy of
+the tree; the nodes outside of the path to the changed object are the
+ones of the previous tree.
+
+When the changed object does not parse on its own, its parent is
+tried, and so on. Edits between toplevel statements parse the lines
+around them. If nothing else works the whole source is parsed again.
+"""
+
+from bisect import bisect_right
+
+from .parser import GMLParser, Namespace, Object, Import, Property, TYPE_OBJECT
+
+
+class _SpanParser(GMLParser):
+    # Records the (line, column) range of every object and import. If
+    # strict, objects must be closed by a } before the end.
+
+    def __init__(self, strict=True):
+        GMLParser.__init__(self)
+        self.strict = strict
+        self.spans = {}
+
+    def _create_object(self, token, parent=None):
+        obj = GMLParser._create_object(self, token, parent)
+        self.spans[obj] = (token.start, token.end)
+        return obj
+
+    def _parse_object(self, name_token, parent=None):
+        obj = GMLParser._parse_object(self, name_token, parent)
+        # The source ran out before the closing }
+        if self.strict and self._eof:
+            raise Exception("Unterminated object %r" % (obj.name, ))
+        self.spans[obj] = (name_token.start,
+                           self._tokens[self._pos - 1].end)
+        return obj
+
+    def _parse_import(self):
+        start = self._tokens[self._pos - 1].start
+        import_ = GMLParser._parse_import(self)
+        self.spans[import_] = (start, self._tokens[self._pos - 1].end)
+        return import_
+
+
+class _Span(object):
+    __slots__ = ('node', 'start', 'end', 'children')
+
+    def __init__(self, node, start, end, children):
+        self.node = node
+        self.start = start
+        self.end = end
+        self.children = children
+
+
+class _SpanList(object):
+    """Sorted spans of sibling nodes, relative to the start of their
+    parent.
+
+    Edits usually happen close to each other, so instead of moving
+    all the spans after an edit, the spans from gap on are stored
+    shift characters too early, and only the ones between the old
+    and the new gap are moved.
+    """
+
+    __slots__ = ('spans', 'starts', 'gap', 'shift')
+
+    def __init__(self, spans):
+        self.spans = spans
+        self.starts = [span.start for span in spans]
+        self.gap = len(spans)
+        self.shift = 0
+
+    def _move_gap(self, index):
+        spans = self.spans
+        starts = self.starts
+        shift = self.shift
+        if index > self.gap:
+            for i in range(self.gap, index):
+                span = spans[i]
+                span.start += shift
+                span.end += shift
+                starts[i] += shift
+        else:
+            for i in range(index, self.gap):
+                span = spans[i]
+                span.start -= shift
+                span.end -= shift
+                starts[i] -= shift
+        self.gap = index
+
+    def get(self, index):
+        span = self.spans[index]
+        if index >= self.gap:
+            return span.start + self.shift, span.end + self.shift
+        return span.start, span.end
+
+    def _last_before(self, pos):
+        # The index of the last span starting at or before pos
+        gap = self.gap
+        starts = self.starts
+        if gap < len(starts) and starts[gap] + self.shift <= pos:
+            return bisect_right(starts, pos - self.shift, gap) - 1
+        return bisect_right(starts, pos, 0, gap) - 1
+
+    def find(self, start, end):
+        """Returns the index of the span containing start to end,
+        or None.
+        """
+        index = self._last_before(start)
+        if index < 0 or self.get(index)[1] < end:
+            return None
+        return index
+
+    def overlapping(self, start, end):
+        """Returns the range of the spans overlapping start to end"""
+        first = self._last_before(start)
+        if first < 0 or self.get(first)[1] <= start:
+            first += 1
+        last = first
+        while last < len(self.spans) and self.get(last)[0] < end:
+            last += 1
+        return first, last
+
+    def replace(self, index, span, delta):
+        # span has the correct position, the ones after it move
+        self._move_gap(index + 1)
+        self.spans[index] = span
+        self.starts[index] = span.start
+        self.shift += delta
+
+    def grow(self, index, delta):
+        self._move_gap(index + 1)
+        self.spans[index].end += delta
+        self.shift += delta
+
+    def splice(self, first, last, spans, delta):
+        self._move_gap(len(self.spans))
+        self.spans[first:last] = spans
+        self.starts[first:last] = [span.start for span in spans]
+        self.gap = first + len(spans)
+        self.shift = delta
+
+
+def _line_starts(source):
+    starts = [0]
+    pos = source.find('\n')
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = source.find('\n', pos + 1)
+    return starts
+
+
+def _parse(source, strict=True):
+    # Returns the statements of source and their spans
+    parser = _SpanParser(strict)
+    ns = parser.parse(source)
+    line_starts = _line_starts(source)
+    positions = {}
+    for node, ((start_line, start_col), (end_line, end_col)) in (
+        parser.spans.items()):
+        positions[node] = (line_starts[start_line - 1] + start_col,
+                           line_starts[end_line - 1] + end_col)
+
+    statements = ns.imports + ns.objects
+    spans = [_make_span(node, 0, positions) for node in statements]
+    spans.sort(key=lambda span: span.start)
+    return spans
+
+
+def _make_span(node, base, positions):
+    start, end = positions[node]
+    children = None
+    if isinstance(node, Object):
+        nodes = list(node.children)
+        for prop in node.properties:
+            if isinstance(prop.value, Object):
+                nodes.append(prop.value)
+        if nodes:
+            spans = [_make_span(child, start, positions) for child in nodes]
+            spans.sort(key=lambda span: span.start)
+            children = _SpanList(spans)
+    return _Span(node, start - base, end - base, children)
+
+
+def _replace_node(parent, old, new):
+    # A copy of parent with its child or property value old replaced
+    obj = Object(parent.name)
+    obj.children = parent.children
+    obj.properties = parent.properties
+    obj.signals = parent.signals
+    obj.is_property = parent.is_property
+    obj.child_type = parent.child_type
+    if old in parent.children:
+        obj.children = list(parent.children)
+        obj.children[obj.children.index(old)] = new
+    else:
+        obj.properties = [
+            Property(prop.name, new, TYPE_OBJECT) if prop.value is old
+            else prop for prop in parent.properties]
+    return obj
+
+
+class Document(object):
+    """A parsed GML source which can be edited.
+
+    Offsets are indexes into the source, edit() returns the tree of
+    the new source. Trees are never modified, the ones returned by
+    earlier calls stay valid.
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._spans = None
+        self._ns = None
+        self._parse_all()
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def ns(self):
+        return self._ns
+
+    def edit(self, start, end, text):
+        """Replace the source from start to end with text"""
+        old_source = self._source
+        source = old_source[:start] + text + old_source[end:]
+        delta = len(text) - (end - start)
+        self._source = source
+        if self._spans is None:
+            # The previous source did not parse
+            return self._parse_all()
+
+        # The path of spans from the toplevel statement down to the
+        # smallest object enclosing the edit
+        path = []
+        spans = self._spans
+        base = 0
+        while spans is not None:
+            index = spans.find(start - base, end - base)
+            if index is None:
+                break
+            path.append((spans, index, base))
+            span_start = spans.get(index)[0]
+            base += span_start
+            spans = spans.spans[index].children
+
+        while path:
+            spans, index, base = path[-1]
+            span_start, span_end = spans.get(index)
+            old = spans.spans[index].node
+            new = self._parse_node(
+                source[base + span_start:base + span_end + delta], old)
+            if new is not None:
+                self._splice(path, new, delta)
+                return self._ns
+            path.pop()
+
+        if self._parse_lines(old_source, start, end, delta):
+            return self._ns
+        return self._parse_all()
+
+    def _parse_all(self):
+        try:
+            spans = _parse(self._source, strict=False)
+        except Exception:
+            self._spans = None
+            raise
+        self._spans = _SpanList(spans)
+        self._ns = self._namespace()
+        return self._ns
+
+    def _namespace(self):
+        ns = Namespace()
+        for span in self._spans.spans:
+            if isinstance(span.node, Import):
+                ns.imports.append(span.node)
+            else:
+                ns.objects.append(span.node)
+        return ns
+
+    def _parse_node(self, source, old):
+        # Returns the span of source parsed as a single node of the same
+        # kind as old, or None
+        try:
+            spans = _parse(source)
+        except Exception:
+            return None
+        if len(spans) != 1 or spans[0].end != len(source):
+            return None
+        span = spans[0]
+        if type(span.node) is not type(old):
+            return None
+        if isinstance(old, Object):
+            span.node.is_property = old.is_property
+        return span
+
+    def _splice(self, path, span, delta):
+        spans, index, base = path[-1]
+        span.start = spans.get(index)[0]
+        span.end += span.start
+        old = spans.spans[index].node
+        new = span.node
+        spans.replace(index, span, delta)
+        for spans, index, base in reversed(path[:-1]):
+            parent = spans.spans[index]
+            node = _replace_node(parent.node, old, new)
+            old = parent.node
+            new = parent.node = node
+            spans.grow(index, delta)
+
+        ns = Namespace()
+        ns.imports = self._ns.imports
+        ns.objects = self._ns.objects
+        if isinstance(old, Import):
+            ns.imports = list(ns.imports)
+            ns.imports[ns.imports.index(old)] = new
+        else:
+            ns.objects = list(ns.objects)
+            ns.objects[ns.objects.index(old)] = new
+        self._ns = ns
+
+    def _parse_lines(self, old_source, start, end, delta):
+        # Parse the whole lines around the edit, and the statements on
+        # them, tokens never continue on the next line.
+        spans = self._spans
+        while True:
+            line_start = old_source.rfind('\n', 0, start) + 1
+            line_end = old_source.find('\n', end)
+            if line_end == -1:
+                line_end = len(old_source)
+            first, last = spans.overlapping(line_start, line_end)
+            if first < last:
+                line_start = min(line_start, spans.get(first)[0])
+                line_end = max(line_end, spans.get(last - 1)[1])
+            if (line_start, line_end) == (start, end):
+                break
+            start, end = line_start, line_end
+
+        text = self._source[start:end + delta]
+        try:
+            new_spans = _parse(text, strict=end + delta < len(self._source))
+        except Exception:
+            return False
+        for span in new_spans:
+            span.start += start
+            span.end += start
+        spans.splice(first, last, new_spans, delta)
+        self._ns = self._namespace()
+        return True
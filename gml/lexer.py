@@ -0,0 +1,207 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Lexer - split GML source into tokens
+
+Sources are read line by line from a file, or scanned in place when
+they are in memory already, see scan_tokens().
+"""
+
+import mmap
+import re
+
+try:
+    intern
+except NameError:
+    from sys import intern
+
+try:
+    _text_types = (str, unicode)
+except NameError:
+    _text_types = (str, )
+
+if str is bytes:
+    # Python 2 keeps the byte strings, like lines read from a file
+    _text = str
+else:
+    def _text(data):
+        return str(data, 'utf-8')
+
+(TOKEN_NAME,
+ TOKEN_STRING,
+ TOKEN_NUMBER,
+ TOKEN_OP) = range(4)
+
+token_names = {
+    TOKEN_NAME: 'NAME',
+    TOKEN_STRING: 'STRING',
+    TOKEN_NUMBER: 'NUMBER',
+    TOKEN_OP: 'OP',
+    }
+
+# Whitespace and comments are matched by the same expression as the
+# significant tokens, but in unnamed groups so that lastgroup is None
+# for them and they can be skipped without looking at the text.
+_token_re = re.compile(r"""
+    (?:[ \t\f\r\n]+)
+  | (?:(?:\#|//)[^\n]*)
+  | (?P<STRING>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<NUMBER>-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?)
+  | (?P<NAME>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<OP>::|[{}:;.,|\[\]()=])
+""", re.VERBOSE)
+
+# The same for a whole source, newlines are matched on their own so
+# that lines can be counted without looking at the whitespace.
+_source_pattern = r"""
+    (?:[ \t\f\r]+)
+  | (?P<NL>\n)
+  | (?:(?:\#|//)[^\n]*)
+  | (?P<STRING>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<NUMBER>-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?)
+  | (?P<NAME>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<OP>::|[{}:;.,|\[\]()=])
+"""
+_source_re = re.compile(_source_pattern, re.VERBOSE)
+_bytes_re = re.compile(_source_pattern.encode('ascii'), re.VERBOSE)
+
+_group_kinds = dict((name, kind) for kind, name in token_names.items())
+_ops = dict((op.encode('ascii'), op) for op in
+            ['::', '{', '}', ':', ';', '.', ',', '|', '[', ']', '(', ')',
+             '='])
+
+
+class Token(object):
+    __slots__ = ('kind', 'value', 'start', 'end')
+
+    def __init__(self, kind, value, start, end):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return '<Token %s, %r>' % (token_names[self.kind], self.value, )
+
+
+def generate_tokens(readline):
+    """Generate the significant tokens read from readline.
+
+    Whitespace and comments are dropped by the scanner, start and end
+    are (line, column) tuples like the ones in the tokenize module.
+    """
+    match = _token_re.match
+    lineno = 0
+    while True:
+        line = readline()
+        if not line:
+            break
+        lineno += 1
+        pos = 0
+        end = len(line)
+        while pos < end:
+            m = match(line, pos)
+            if m is None:
+                raise Exception("Invalid character %r at line %d, column %d" % (
+                    line[pos], lineno, pos))
+            group = m.lastgroup
+            start = pos
+            pos = m.end()
+            if group is None:
+                continue
+            value = m.group()
+            if group == 'NAME':
+                # Type, property and enum names repeat all over a
+                # document, share them between the nodes of the tree.
+                value = intern(value)
+            yield Token(_group_kinds[group], value, (lineno, start),
+                        (lineno, pos))
+
+
+def scan_tokens(source):
+    """Generate the significant tokens of a whole source.
+
+    source is a string, or UTF-8 text in a bytes-like object: bytes,
+    bytearray, memoryview or mmap. Those are scanned in place, nothing
+    is copied or decoded up front, each token is decoded as it is
+    matched. Columns are counted in bytes.
+    """
+    if isinstance(source, _text_types):
+        pattern = _source_re
+        buffer = False
+    else:
+        if isinstance(source, memoryview) and str is bytes:
+            # The re module of Python 2 does not take memoryviews
+            source = source.tobytes()
+        pattern = _bytes_re
+        buffer = True
+    # The matches of a bytearray are bytearrays, which can not be
+    # looked up in _ops
+    mutable = isinstance(source, bytearray)
+    match = pattern.match
+    lineno = 1
+    line_start = 0
+    pos = 0
+    end = len(source)
+    while pos < end:
+        m = match(source, pos)
+        if m is None:
+            raise Exception("Invalid character %r at line %d, column %d" % (
+                source[pos:pos + 1], lineno, pos - line_start))
+        group = m.lastgroup
+        start = pos
+        pos = m.end()
+        if group is None:
+            continue
+        if group == 'NL':
+            lineno += 1
+            line_start = pos
+            continue
+        kind = _group_kinds[group]
+        if not buffer:
+            value = m.group()
+            if kind == TOKEN_NAME:
+                value = intern(value)
+            yield Token(kind, value, (lineno, start - line_start),
+                        (lineno, pos - line_start))
+        elif kind == TOKEN_OP:
+            op = m.group()
+            if mutable:
+                op = bytes(op)
+            yield Token(kind, _ops[op], (lineno, start - line_start),
+                        (lineno, pos - line_start))
+        else:
+            value = _text(m.group())
+            if kind == TOKEN_NAME:
+                value = intern(value)
+            yield Token(kind, value, (lineno, start - line_start),
+                        (lineno, pos - line_start))
+
+
+def source_tokens(source):
+    """Generate the significant tokens of source, a file-like object
+    which is read line by line, a whole source, see scan_tokens(), or
+    a list of the tokens scanned already.
+    """
+    if isinstance(source, list):
+        return iter(source)
+    if (isinstance(source, _text_types) or
+        isinstance(source, (bytes, bytearray, memoryview, mmap.mmap))):
+        return scan_tokens(source)
+    return generate_tokens(source.readline)
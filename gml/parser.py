@@ -19,8 +19,9 @@
 
 """Parser of GML format"""
 
-import token
-import tokenize
+from .lexer import (Token, source_tokens, token_names, TOKEN_NAME,
+                    TOKEN_STRING, TOKEN_NUMBER)
+from .stats import timer
 
 (TYPE_IDENTIFIER,
  TYPE_STRING,
@@ -29,37 +30,53 @@ import tokenize
  TYPE_OBJECT) = range(5)
 
 
-class Token(object):
-    def __init__(self, kind, value, start, end):
-        self.kind = kind
-        self.value = value
-        self.start = start
-        self.end = end
-
-    def __repr__(self):
-        return '<Token %s, %r>' % (token.tok_name[self.kind], self.value, )
+# Shared by all objects until they get their first child, property
+# or signal, most objects in a layout are leaves.
+_EMPTY = ()
 
 
 class Namespace(object):
+    __slots__ = ('imports', 'objects')
+
     def __init__(self):
         self.imports = []
         self.objects = []
 
 
 class Import(object):
+    __slots__ = ('name', )
+
     def __init__(self, name):
         self.name = name
 
 
 class Object(object):
+    __slots__ = ('name', 'children', 'properties', 'signals',
+                 'is_property', 'child_type')
+
     def __init__(self, name):
         self.name = name
-        self.children = []
-        self.properties = []
-        self.signals = []
+        self.children = _EMPTY
+        self.properties = _EMPTY
+        self.signals = _EMPTY
         self.is_property = False
         self.child_type = None
 
+    def add_child(self, child):
+        if self.children is _EMPTY:
+            self.children = []
+        self.children.append(child)
+
+    def add_property(self, prop):
+        if self.properties is _EMPTY:
+            self.properties = []
+        self.properties.append(prop)
+
+    def add_signal(self, signal):
+        if self.signals is _EMPTY:
+            self.signals = []
+        self.signals.append(signal)
+
     def json(self):
         od = dict()
         od['name'] = self.name
@@ -76,6 +93,8 @@ class Object(object):
 
 
 class Property(object):
+    __slots__ = ('name', 'value', 'kind')
+
     def __init__(self, name, value, kind):
         self.name = name
         self.value = value
@@ -89,6 +108,8 @@ class Property(object):
 
 
 class Signal(object):
+    __slots__ = ('name', 'handler')
+
     def __init__(self, name, handler):
         self.name = name
         self.handler = handler
@@ -101,70 +122,111 @@ class Signal(object):
         return '<Signal %s=%s>' % (self.name, self.handler)
 
 
-def is_whitespace(token):
-    v = token.value.strip()
-    if v == "":
-        return True
-    if v in '\n':
-        return True
-    return False
-
-def is_comment(token):
-    v = token.value.strip()
-    if v.startswith("#"):
-        return True
-    return False
+def _timed_tokens(tokens, stats):
+    while True:
+        t = timer()
+        token = next(tokens, None)
+        stats.add_time('tokenize', timer() - t)
+        if token is None:
+            return
+        yield token
 
 
 class GMLParser(object):
-    def __init__(self):
+    def __init__(self, stats=None, positions=None):
+        # A gml.stats.Stats, or None
+        self.stats = stats
+        # If a dict, the (line, column) of each Object and Property
+        # is stored in it
+        self.positions = positions
         self._eof = False
+        # Lookahead buffer, _pos is the index of the next token to be
+        # consumed by the parser. When iterparsing it is refilled from
+        # _source on demand and trimmed after each toplevel statement.
         self._tokens = []
+        self._pos = 0
+        self._source = None
 
     def tokenize(self, fp):
-        # Pass 1: remove comments
-        tokenize.tokenize(fp.readline, self.feed)
+        for token in source_tokens(fp):
+            self.feed(token)
 
     @property
     def tokens(self):
-        return list(reversed(self._tokens))
+        return self._tokens[self._pos:]
 
     def parse(self, fp):
-        self.tokenize(fp)
-
         ns = Namespace()
+        for retval in self.iterparse(fp):
+            if isinstance(retval, Object):
+                ns.objects.append(retval)
+            else:
+                ns.imports.append(retval)
+        return ns
+
+    def iterparse(self, fp):
+        """Parse fp incrementally, yielding each Import and toplevel
+        Object as soon as it has been read. fp is a file-like object,
+        the whole source as a string or a bytes-like object, see
+        gml.lexer.scan_tokens(), or a list of its tokens.
+
+        Only the tokens of the statement being parsed are kept around,
+        so memory use is bounded by the largest toplevel object.
+        """
+        stats = self.stats
+        self._source = source_tokens(fp)
+        if stats is not None:
+            self._source = _timed_tokens(self._source, stats)
         while not self._eof:
+            if stats is not None:
+                t = timer()
+                tokenizing = stats.phases.get('tokenize', 0.0)
             retval = self._parse_statement()
+            del self._tokens[:self._pos]
+            self._pos = 0
+            if stats is not None:
+                # The time spent in the lexer is already counted
+                stats.add_time('parse', timer() - t - (
+                    stats.phases.get('tokenize', 0.0) - tokenizing))
             if retval is None:
                 continue
 
-            if isinstance(retval, Object):
-                ns.objects.append(retval)
-            elif isinstance(retval, Import):
-                ns.imports.append(retval)
-            else:
+            if not isinstance(retval, (Object, Import)):
                 raise Exception("Unexpected object: %s" % (retval, ))
-
-        return ns
+            yield retval
 
     # Parser below
 
-    def feed(self, token, value, start, end, raw):
-        token = Token(token, value, start, end)
-        if is_whitespace(token) or is_comment(token):
-            return
-        self._tokens.insert(0, token)
+    def feed(self, token):
+        self._tokens.append(token)
+
+    def _fill(self, n):
+        # Make sure there are at least n tokens after the cursor,
+        # returns False if the source runs out before that.
+        while len(self._tokens) - self._pos < n:
+            if self._source is None:
+                return False
+            token = next(self._source, None)
+            if token is None:
+                self._source = None
+                return False
+            self._tokens.append(token)
+        return True
 
     def _pop_token(self):
-        if self._tokens:
-            return self._tokens.pop()
+        pos = self._pos
+        if pos < len(self._tokens) or self._fill(1):
+            self._pos = pos + 1
+            return self._tokens[pos]
 
-    def _peek_token(self):
-        if self._tokens:
-            return self._tokens[-1]
+    def _peek_token(self, offset=0):
+        pos = self._pos + offset
+        if pos < len(self._tokens) or self._fill(offset + 1):
+            return self._tokens[pos]
 
-    def _peek_tokens(self, i=0):
-        return self._tokens[-i:]
+    def _peek_tokens(self, i=1):
+        self._fill(i)
+        return self._tokens[self._pos:self._pos + i]
 
     def _expect(self, value):
         token = self._pop_token()
@@ -178,7 +240,7 @@ class GMLParser(object):
             return
         if token.value == ";":
             pass
-        elif token.kind == tokenize.NAME:
+        elif token.kind == TOKEN_NAME:
             if token.value == 'import':
                 return self._parse_import()
             else:
@@ -199,7 +261,9 @@ class GMLParser(object):
         #print '_create_object', token
         obj = Object(token.value)
         if parent:
-            parent.children.append(obj)
+            parent.add_child(obj)
+        if self.positions is not None:
+            self.positions[obj] = token.start
         return obj
 
     def _parse_object(self, name_token, parent=None):
@@ -209,11 +273,10 @@ class GMLParser(object):
         token = self._pop_token()
         while token.value != '}':
             next = self._peek_token()
-            if next.value == ':':
-                if len(self._tokens) > 2 and self._tokens[-2].value == ':':
-                    self._parse_signal(obj, token)
-                else:
-                    self._parse_property(obj, token)
+            if next.value == '::':
+                self._parse_signal(obj, token)
+            elif next.value == ':':
+                self._parse_property(obj, token)
             elif next.value == '.':
                 token = self._parse_property_reference(token)
                 self._parse_property(obj, token)
@@ -233,7 +296,7 @@ class GMLParser(object):
         return obj
 
     def _parse_object_simple(self, token, parent=None):
-        if token.kind != tokenize.NAME:
+        if token.kind != TOKEN_NAME:
             return
 
         obj = self._create_object(token, parent)
@@ -250,18 +313,21 @@ class GMLParser(object):
             value.is_property = True
             prop_kind = TYPE_OBJECT
         else:
-            if value_token.kind == token.NUMBER:
+            if value_token.kind == TOKEN_NUMBER:
                 prop_kind = TYPE_NUMBER
-            elif value_token.kind == token.NAME:
+            elif value_token.kind == TOKEN_NAME:
                 if value_token.value in ['true', 'false']:
                     prop_kind = TYPE_BOOLEAN
                 else:
                     prop_kind = TYPE_IDENTIFIER
-            elif value_token.kind == token.STRING:
+            elif value_token.kind == TOKEN_STRING:
                 prop_kind = TYPE_STRING
             else:
-                raise NotImplementedError(token.tok_name[value_token.kind])
-        obj.properties.append(Property(prop_name, value, prop_kind))
+                raise NotImplementedError(token_names[value_token.kind])
+        prop = Property(prop_name, value, prop_kind)
+        obj.add_property(prop)
+        if self.positions is not None:
+            self.positions[prop] = name_token.start
 
     def _parse_property_reference(self, token):
         self._pop_token()
@@ -273,24 +339,24 @@ class GMLParser(object):
                 break
             tokens.append(self._pop_token())
         v = '.'.join(t.value for t in tokens)
-        return Token(token.kind, v, 0, 0)
+        return Token(token.kind, v, tokens[0].start, tokens[-1].end)
 
     def _parse_property_value(self):
+        # Dotted references and enums, flags combined with |
         tokens = []
         tokens.append(self._pop_token())
         while True:
             token = self._peek_token()
-            if token.value != '.':
+            if token.value not in ['.', '|']:
                 break
-            self._pop_token()
+            tokens.append(self._pop_token())
             tokens.append(self._pop_token())
 
-        return '.'.join(t.value for t in tokens)
+        return ''.join(t.value for t in tokens)
 
     def _parse_signal(self, obj, token):
         signal = token.value
-        self._expect(':')
-        self._expect(':')
+        self._expect('::')
         handler = self._pop_token()
-        obj.signals.append(Signal(signal, handler.value))
+        obj.add_signal(Signal(signal, handler.value))
 
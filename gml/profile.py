@@ -0,0 +1,151 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Profile - attribute the cost of constructing a document to its source
+
+The document is parsed once, remembering where each object and
+property is, and constructed a number of times with a Stats recording
+the time spent on each node. Properties converted when compiling are
+counted as well, since a document is compiled once per process.
+"""
+
+from .builder import GMLBuilder
+from .parser import GMLParser, Object
+from .stats import Stats
+
+
+class Entry(object):
+    """An object or a property of the profiled document, with its
+    seconds per construction. total includes the children, the
+    properties and their values.
+    """
+
+    __slots__ = ('node', 'position', 'label', 'self_time', 'total',
+                 'children')
+
+    def __init__(self, node, position, label, self_time, children):
+        self.node = node
+        self.position = position
+        self.label = label
+        self.self_time = self_time
+        self.children = children
+        self.total = self_time + sum([child.total for child in children])
+
+    @property
+    def location(self):
+        if self.position is None:
+            return '?'
+        line, column = self.position
+        return '%d:%d' % (line, column + 1)
+
+    def walk(self, depth=0):
+        yield depth, self
+        for child in self.children:
+            for item in child.walk(depth + 1):
+                yield item
+
+
+def _ignore(*args):
+    pass
+
+
+def _handlers(obj, names):
+    for signal in obj.signals:
+        names.add(signal.handler)
+    for prop in obj.properties:
+        if isinstance(prop.value, Object):
+            _handlers(prop.value, names)
+    for child in obj.children:
+        _handlers(child, names)
+    return names
+
+
+def _label(node):
+    if isinstance(node, Object):
+        for prop in node.properties:
+            if prop.name == 'id':
+                return '%s %s' % (node.name, prop.value)
+        return node.name
+    value = node.value
+    if isinstance(value, Object):
+        value = value.name
+    elif len(value) > 30:
+        value = value[:27] + '...'
+    return '%s: %s' % (node.name, value)
+
+
+def _entry(node, times, positions, repeat):
+    children = []
+    if isinstance(node, Object):
+        for prop in node.properties:
+            if prop.name != 'id':
+                children.append(_entry(prop, times, positions, repeat))
+        for child in node.children:
+            children.append(_entry(child, times, positions, repeat))
+    elif isinstance(node.value, Object):
+        children.append(_entry(node.value, times, positions, repeat))
+    return Entry(node, positions.get(node), _label(node),
+                 times.get(node, 0.0) / repeat, children)
+
+
+class Profile(object):
+    """Construct filename repeat times and attribute the time.
+
+    entries are the Entry of each toplevel object, phases the seconds
+    per construction spent in each phase, see gml.stats.
+    """
+
+    def __init__(self, filename, repeat=1):
+        self.filename = filename
+        self.repeat = repeat
+        positions = {}
+        with open(filename) as fp:
+            ns = GMLParser(positions=positions).parse(fp)
+
+        stats = Stats(nodes=True)
+        handlers = set()
+        for obj in ns.objects:
+            _handlers(obj, handlers)
+        for i in range(repeat):
+            builder = GMLBuilder(stats=stats)
+            for import_ in ns.imports:
+                builder._import(import_)
+            for name in handlers:
+                builder.signals.setdefault(name, _ignore)
+            builder._execute(builder._compile_objects(ns.objects))
+            builder._apply_fixups()
+
+        self.stats = stats
+        self.phases = dict((phase, seconds / repeat)
+                           for phase, seconds in stats.phases.items())
+        self.entries = [_entry(obj, stats.nodes, positions, repeat)
+                        for obj in ns.objects]
+        self.total = sum([entry.total for entry in self.entries])
+
+    def top(self, n):
+        """Returns the n objects with the largest total, the most
+        expensive first.
+        """
+        objects = []
+        for entry in self.entries:
+            for depth, item in entry.walk():
+                if isinstance(item.node, Object):
+                    objects.append(item)
+        objects.sort(key=lambda item: item.total, reverse=True)
+        return objects[:n]
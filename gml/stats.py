@@ -0,0 +1,124 @@
+# -*- Mode: Python -*-
+# Copyright (C) 2011  Johan Dahlin
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+#
+
+"""Stats - timings and counters of parsing and construction
+
+A Stats instance passed to GMLBuilder or GMLParser records where the
+time goes. Without one nothing is measured, the builder and the parser
+only check whether they have one.
+
+  phases      seconds spent in each phase: tokenize, parse, load
+              (cache files), compile, and for the instructions of the
+              compiled programs new, get, set, connect, add_child,
+              child_set (the packing set by add_child) and lazy;
+              fixup is the references and properties set once all
+              objects exist. Native builders
+              record translate and gtkbuilder, the time spent
+              writing the XML and in Gtk.Builder
+  counts      number of times each phase was entered, and of some
+              events such as memory_cache_hits
+  types       objects constructed and seconds spent in GObject.new
+              per type name
+  converters  values converted by each property parser
+  slowest     the objects which took the longest to construct, with
+              the time of the instructions creating, adding and
+              connecting them
+  nodes       only if asked for, the seconds spent on each parser
+              node: for objects as in slowest, for properties
+              converting and setting them when that is done
+              separately from creating the object
+"""
+
+import heapq
+import json
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Stats(object):
+    def __init__(self, n_slowest=10, nodes=False):
+        self.n_slowest = n_slowest
+        self.nodes = None
+        if nodes:
+            self.nodes = {}
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.counts = {}
+        self.types = {}
+        self.converters = {}
+        if self.nodes is not None:
+            self.nodes = {}
+        # A heap of (seconds, n, type name, id), the fastest one first
+        self._slowest = []
+        self._n_objects = 0
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def add_type(self, type_name, seconds):
+        entry = self.types.get(type_name)
+        if entry is None:
+            self.types[type_name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_object(self, type_name, obj_id, seconds):
+        self._n_objects += 1
+        item = (seconds, self._n_objects, type_name, obj_id)
+        if len(self._slowest) < self.n_slowest:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def add_node(self, node, seconds):
+        self.nodes[node] = self.nodes.get(node, 0.0) + seconds
+
+    def add_conversion(self, parser):
+        name = getattr(parser, '__name__', repr(parser))
+        self.converters[name] = self.converters.get(name, 0) + 1
+
+    @property
+    def slowest(self):
+        """(seconds, type name, id) of the slowest objects, slowest
+        first. id is None for objects without one.
+        """
+        return [(seconds, type_name, obj_id) for seconds, n, type_name, obj_id
+                in sorted(self._slowest, reverse=True)]
+
+    def as_dict(self):
+        return {
+            'phases': dict(self.phases),
+            'counts': dict(self.counts),
+            'types': dict((name, {'count': count, 'time': seconds})
+                          for name, (count, seconds) in self.types.items()),
+            'converters': dict(self.converters),
+            'slowest': [{'time': seconds, 'type': type_name, 'id': obj_id}
+                        for seconds, type_name, obj_id in self.slowest],
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
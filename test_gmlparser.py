@@ -1,15 +1,31 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
-from gml.config import use_pygtk
-from gml.builder import GMLBuilder
-
-if use_pygtk:
-    import gtk as Gtk
-else:
-    from gi.repository import Gtk
+from gml import cache, codegen, config
+from gml.backend import GLib, Gtk
+from gml.builder import GMLBuilder, GMLTemplate, type_cache
+from gml.compiler import GMLCompiler, ADD_CHILD, SET
+from gml.incremental import Document
+from gml.lexer import (generate_tokens, scan_tokens, TOKEN_NAME, TOKEN_OP,
+                       TOKEN_STRING)
+from gml.parser import GMLParser, Import, Object
+from gml.profile import Profile
+from gml.stats import Stats
 
 
 class GMLBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = config.cache_dir
+        config.cache_dir = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        config.cache_dir = self.cache_dir
+        shutil.rmtree(self.tmpdir)
+
     def testEmpty(self):
         p = GMLBuilder()
         p.add_from_string("")
@@ -87,6 +103,38 @@ class GMLBuilderTest(unittest.TestCase):
         sw = p.get_by_name("sw1")
         self.assertEquals(sw.props.hscrollbar_policy, Gtk.POLICY_AUTOMATIC)
 
+        # The value of another enum is not remembered either
+        source = """GtkScrolledWindow {
+            hscrollbar_policy: GtkShadowType.etched_out
+        }"""
+        for i in range(2):
+            p = GMLBuilder()
+            self.assertRaises(Exception, p.add_from_string, source)
+
+    def testPropertyEnumNames(self):
+        p = GMLBuilder()
+        p.add_from_string("""
+        GtkScrolledWindow { id: sw1; hscrollbar_policy: GTK_POLICY_AUTOMATIC }
+        GtkScrolledWindow { id: sw2; hscrollbar_policy: AUTOMATIC }
+        GtkScrolledWindow { id: sw3; hscrollbar_policy: Gtk.PolicyType.automatic }
+        """)
+        for name in ['sw1', 'sw2', 'sw3']:
+            sw = p.get_by_name(name)
+            self.assertEquals(sw.props.hscrollbar_policy,
+                              Gtk.POLICY_AUTOMATIC)
+
+    def testPropertyFlags(self):
+        p = GMLBuilder()
+        p.add_from_string("""
+        GtkButton { id: b1; events: button_press_mask }
+        GtkButton { id: b2; events: GDK_KEY_PRESS_MASK }
+        GtkButton { id: b3; events: button_press_mask|key_press_mask }
+        """)
+        events = [int(p.get_by_name(name).props.events)
+                  for name in ['b1', 'b2', 'b3']]
+        self.failUnless(events[0] and events[1])
+        self.assertEquals(events[0] | events[1], events[2])
+
     def testPropertyPacking(self):
         p = GMLBuilder()
         p.add_from_string("""GtkVBox {
@@ -140,6 +188,31 @@ class GMLBuilderTest(unittest.TestCase):
         self.assertEquals(b2.props.label, "Label")
         self.assertEquals(b3.props.label, "window1")
 
+    def testPropertyForwardReference(self):
+        p = GMLBuilder()
+        p.add_from_string("""
+        GtkButton { id: b1; label: b2.label; image: image1 }
+        GtkWindow {
+           title: b2.label
+           GtkButton { id: b2; label: "Label" }
+        }
+        GtkImage { id: image1; stock: "gtk-edit" }
+        GtkButton { id: b3; name: "b3"; label: b4.name }
+        GtkButton { id: b4; name: "b4"; label: b3.name }
+        """)
+
+        b1 = p.get_by_name("b1")
+        self.assertEquals(b1.props.label, "Label")
+        self.failUnless(b1.get_image() is p.get_by_name("image1"))
+        window = p.get_by_name("b2").get_parent()
+        self.assertEquals(window.props.title, "Label")
+        self.assertEquals(p.get_by_name("b3").props.label, "b4")
+        self.assertEquals(p.get_by_name("b4").props.label, "b3")
+
+        p = GMLBuilder()
+        self.assertRaises(Exception, p.add_from_string,
+                          'GtkButton { label: missing.label }')
+
     def testPropertyNestedReference(self):
         p = GMLBuilder()
         p.add_from_string("""
@@ -225,6 +298,437 @@ class GMLBuilderTest(unittest.TestCase):
 
         self.failUnless(self.called)
 
+    def testSameSource(self):
+        source = """GtkVBox {
+            GtkButton {
+               packing { expand: true }
+            }
+        }"""
+        for i in range(2):
+            p = GMLBuilder()
+            p.add_from_string(source)
+            p.add_from_string(source)
+            boxes = [o for o in p.objects if isinstance(o, Gtk.VBox)]
+            self.assertEquals(len(boxes), 2)
+            for box in boxes:
+                button = box.get_children()[0]
+                self.assertEquals(box.child_get_property(button, "expand"),
+                                  True)
+
+    def testTypeCache(self):
+        p = GMLBuilder()
+        p.add_from_string('GtkLabel { label: "a" }')
+        hits = type_cache.hits
+        p = GMLBuilder()
+        p.add_from_string('GtkLabel { label: "b" }')
+        self.assertEquals(type_cache.hits, hits + 2)
+
+    def testTypeCacheMissingProperty(self):
+        gtype = Gtk.VBox.__gtype__
+        self.assertEquals(type_cache.find_property(gtype, 'GtkButton'), None)
+        hits, misses = type_cache.hits, type_cache.misses
+        self.assertEquals(type_cache.find_property(gtype, 'GtkButton'), None)
+        self.assertEquals((type_cache.hits, type_cache.misses),
+                          (hits + 1, misses))
+        self.assertRaises(AttributeError, type_cache.get_property, gtype,
+                          'GtkButton')
+
+    def testTypeChildProperties(self):
+        # Read from the class, no container is created
+        child_properties = type_cache.get_type_child_properties(
+            Gtk.HBox.__gtype__)
+        pspec, parser = child_properties['padding']
+        self.assertEquals(pspec.name, 'padding')
+        self.failUnless(type_cache.get_child_properties(Gtk.HBox())
+                        is child_properties)
+
+    def testProgramCache(self):
+        source = 'GtkWindow { title: "Cached"; GtkButton { label: "a" } }'
+        p = GMLBuilder()
+        p.add_from_string(source)
+        hits = cache.program_cache.hits
+        p = GMLBuilder()
+        p.add_from_string(source)
+        self.assertEquals(cache.program_cache.hits, hits + 1)
+        self.assertEquals(len(p.objects), 2)
+
+    def testPropertyObjectChildren(self):
+        # The type of image is not a container, the object in it is
+        p = GMLBuilder()
+        p.add_from_string("""
+        GtkButton {
+          id: button
+          image: GtkHBox { }
+          image { GtkLabel { id: label } }
+        }""")
+        box = p.get_by_name("button").get_image()
+        self.assertEquals(box.get_children(), [p.get_by_name("label")])
+        self.assertRaises(TypeError, GMLBuilder().add_from_string,
+                          'GtkButton { image { GtkLabel { } } }')
+
+    def testBatchedProperties(self):
+        source = """
+        GtkVBox {
+          GtkButton {
+            id: button
+            image { pixel_size: 32; icon_name: "edit" }
+            packing { expand: false; padding: 2 }
+          }
+        }"""
+        p = GMLBuilder()
+        program = GMLCompiler(p).compile(GMLParser().parse(source).objects)
+        sets = [instruction for instruction in program.instructions
+                if instruction[0] == SET]
+        self.assertEquals([[name for name, value_slot, prop in properties]
+                           for op, slot, properties in sets],
+                          [['pixel_size', 'icon_name']])
+        packing = [instruction[4] for instruction in program.instructions
+                   if instruction[0] == ADD_CHILD]
+        self.assertEquals([[prop.name for prop in props]
+                           for props in packing],
+                          [['expand', 'padding']])
+
+        p.add_from_string(source)
+        button = p.get_by_name("button")
+        image = button.get_image()
+        self.assertEquals(image.props.pixel_size, 32)
+        self.assertEquals(image.props.icon_name, "edit")
+        box = button.get_parent()
+        self.assertEquals(box.child_get_property(button, 'expand'), False)
+        self.assertEquals(box.child_get_property(button, 'padding'), 2)
+
+    @unittest.skipUnless(config.backend == 'fake',
+                         "counts the emissions of the fake objects")
+    def testBatchedNotifications(self):
+        # The objects are created by the builder, so the emissions are
+        # counted like benchmarks/notify.py does
+        from gml import fake
+        emitted = []
+        emit = fake.Object.emit
+
+        def counting_emit(obj, signal, *args):
+            if signal in ['notify', 'child-notify']:
+                emitted.append((signal, args[0].name))
+            return emit(obj, signal, *args)
+        fake.Object.emit = counting_emit
+        try:
+            GMLBuilder().add_from_string("""
+            GtkVBox {
+              GtkButton {
+                image { pixel_size: 32; icon_name: "edit" }
+                packing { expand: false; padding: 2 }
+              }
+            }""")
+        finally:
+            fake.Object.emit = emit
+        # Adding the button sets expand, fill and padding, then the
+        # packing sets expand and padding again: each of them is only
+        # notified once.
+        self.assertEquals(sorted([name for signal, name in emitted
+                                  if signal == 'child-notify']),
+                          ['expand', 'fill', 'padding'])
+        self.assertEquals([name for signal, name in emitted
+                           if signal == 'notify' and name != 'parent'],
+                          ['pixel_size', 'icon_name'])
+
+    def testStats(self):
+        stats = Stats(n_slowest=2)
+        p = GMLBuilder(stats=stats)
+        p.add_from_string("""
+        GtkVBox {
+          id: box
+          GtkLabel { id: label; label: "Stats" }
+          GtkButton { label: "One"; packing { expand: false } }
+          GtkButton { label: label.label }
+        }""")
+        self.assertEquals(stats.types['GtkButton'][0], 2)
+        self.assertEquals(stats.counts['new'], 4)
+        self.assertEquals(stats.counts['child_set'], 1)
+        self.assertEquals(stats.converters['_parse_property_string'], 2)
+        self.assertEquals(len(stats.slowest), 2)
+        for phase in ['tokenize', 'parse', 'compile', 'new', 'add_child']:
+            self.failUnless(stats.phases[phase] >= 0, phase)
+        data = json.loads(stats.to_json())
+        self.assertEquals(data['types']['GtkVBox']['count'], 1)
+
+        # The tree and the program are cached now
+        stats.reset()
+        p = GMLBuilder(stats=stats)
+        p.add_from_string('GtkLabel { label: "Stats" }')
+        p = GMLBuilder(stats=stats)
+        p.add_from_string('GtkLabel { label: "Stats" }')
+        self.assertEquals(stats.counts['memory_cache_hits'], 1)
+        self.assertEquals(stats.counts['compile'], 1)
+
+    def testTemplate(self):
+        template = GMLTemplate.new_from_string("""
+        GtkVBox {
+          id: box;
+          GtkLabel { id: label; label: "Row" }
+          GtkButton { id: button; label: label.label }
+        }""")
+        first = template.instantiate()
+        second = template.instantiate()
+        label = first.get_by_name("label")
+        self.failUnless(label is not second.get_by_name("label"))
+        self.assertEquals(first.get_by_name("box").get_children()[0], label)
+        self.assertEquals(second.get_by_name("button").props.label, "Row")
+        self.assertEquals(len(first.objects), 3)
+        self.assertEquals(len(second.objects), 3)
+
+    def testLazy(self):
+        p = GMLBuilder(lazy=True)
+        p.add_from_string("""
+        GtkWindow { id: w1; GtkButton { id: b1; label: "Button" } }
+        GtkWindow { id: w2; GtkLabel { id: l2; label: b1.label } }
+        GtkImage { id: i1; pixel_size: 16 }
+        GtkButton { id: b3; lazy: false; image: i1 }
+        GtkWindow { }
+        """)
+        # b3 refers to i1, so it is constructed right away
+        self.assertEquals(len(p.objects), 3)
+        self.failUnless(p.get_by_name("b3").get_image() is p.get_by_name("i1"))
+        l2 = p.get_by_name("l2")
+        self.assertEquals(l2.props.label, "Button")
+        self.assertEquals(len(p.objects), 7)
+        self.failUnless(p.get_by_name("w1").get_child() is p.get_by_name("b1"))
+
+    def testLazyChild(self):
+        p = GMLBuilder()
+        p.add_from_string("""
+        GtkVBox {
+          id: box
+          GtkButton { id: b1; lazy: true; label: "Lazy"
+                      packing { expand: false } }
+        }
+        """)
+        self.failIf(p.get_by_name("box").get_children())
+        p.get_by_name("box").realize()
+        b1 = p.get_by_name("box").get_children()[0]
+        self.assertEquals(b1.props.label, "Lazy")
+        self.assertEquals(p.get_by_name("box").child_get_property(b1, "expand"),
+                          False)
+
+    def testAddFromFile(self):
+        filename = os.path.join(self.tmpdir, 'window.gml')
+        fp = open(filename, 'w')
+        fp.write('GtkWindow { id: w1; GtkButton { label: "1" } }\n'
+                 'GtkWindow { id: w2; title: w1.title }')
+        fp.close()
+        # Each toplevel object is compiled and constructed as soon as
+        # it is parsed
+        stats = Stats()
+        p = GMLBuilder(stats=stats)
+        p.add_from_file(filename)
+        self.assertEquals(stats.counts['compile'], 2)
+        self.assertEquals(len(p.objects), 3)
+        self.failIf(cache.load(filename) is None)
+
+        stats.reset()
+        p = GMLBuilder(stats=stats)
+        p.add_from_file(filename)
+        self.assertEquals(stats.counts['memory_cache_hits'], 1)
+        self.failIf('parse' in stats.phases)
+        self.assertEquals(len(p.objects), 3)
+
+    def testAddFromFiles(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filenames = []
+            for i, source in enumerate([
+                'GtkWindow { id: w1; GtkButton { id: b1; label: "1" } }',
+                'GtkButton { id: b2; label: b1.label }']):
+                filename = os.path.join(tmpdir, '%d.gml' % (i, ))
+                fp = open(filename, 'w')
+                fp.write(source)
+                fp.close()
+                filenames.append(filename)
+            loaded = []
+            load = cache.load
+
+            def counting_load(filename):
+                loaded.append(filename)
+                return load(filename)
+            cache.load = counting_load
+            try:
+                p = GMLBuilder()
+                p.add_from_files(filenames, workers=2)
+            finally:
+                cache.load = load
+            self.assertEquals(p.get_by_name("b2").props.label, "1")
+            # The missing cache files are only looked for once
+            self.assertEquals(loaded, filenames)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def testAddFromFileAsync(self):
+        fd, filename = tempfile.mkstemp(suffix='.gml')
+        fp = os.fdopen(fd, 'w')
+        fp.write('GtkButton { id: first; label: last.label }\n')
+        for i in range(50):
+            fp.write('GtkVBox { GtkLabel { label: "%d" } }\n' % (i, ))
+        fp.write('GtkButton { id: last; label: "Last" }\n')
+        fp.close()
+        progress = []
+        constructed = []
+        done = []
+
+        def on_progress(fraction):
+            progress.append(fraction)
+            constructed.append(len(p.objects))
+
+        def on_done(builder):
+            done.append(builder)
+            Gtk.main_quit()
+        try:
+            p = GMLBuilder()
+            p.add_from_file_async(filename, on_done, on_progress, budget=0)
+            self.assertEquals(p.objects, [])
+            Gtk.main()
+        finally:
+            os.unlink(filename)
+        self.assertEquals(done, [p])
+        self.failUnless(len(progress) > 1)
+        self.assertEquals(progress, sorted(progress))
+        self.assertEquals(progress[-1], 1.0)
+        # Reading the file takes slices of its own
+        self.failUnless(constructed.count(0) > 52)
+        self.assertEquals(len(p.objects), 102)
+        self.assertEquals(p.get_by_name("first").props.label, "Last")
+
+    def testAddFromFileAsyncFixups(self):
+        fd, filename = tempfile.mkstemp(suffix='.gml')
+        fp = os.fdopen(fd, 'w')
+        fp.write('GtkButton { id: first; image: GtkImage { }\n'
+                 '            image { icon_name: last.label } }\n')
+        for i in range(10):
+            fp.write('GtkLabel { label: "%d" }\n' % (i, ))
+        fp.write('GtkButton { id: last; label: "Last" }\n')
+        fp.close()
+
+        def add_other():
+            p.add_from_string('GtkLabel { id: other }')
+            return False
+        try:
+            p = GMLBuilder()
+            p.add_from_file_async(filename, lambda builder: Gtk.main_quit(),
+                                  budget=0)
+            # Added while the file is constructed, the references of
+            # the file are not set until it is complete
+            GLib.idle_add(add_other)
+            Gtk.main()
+        finally:
+            os.unlink(filename)
+        self.failUnless(p.get_by_name("other"))
+        self.assertEquals(
+            p.get_by_name("first").props.image.props.icon_name, "Last")
+
+    def testNative(self):
+        source = """
+        GtkButton { id: b1; label: b2.label; image: image1 }
+        GtkWindow {
+           title: "Title & more"
+           GtkVBox {
+             GtkButton {
+               id: b2
+               label: "Label"
+               clicked:: on_clicked
+               packing { expand: false; padding: 2 }
+             }
+             GtkButton { id: b3; image: GtkImage { }; image.pixel_size: 32 }
+             GtkMenuItem { id: item; GtkMenu { child_type: submenu } }
+           }
+        }
+        GtkScrolledWindow { id: sw; hscrollbar_policy: automatic }
+        GtkImage { id: image1; stock: "gtk-edit" }
+        """
+        clicked = []
+        p = GMLBuilder(native=True)
+        p.signals['on_clicked'] = clicked.append
+        p.add_from_string(source)
+        translation = cache.xml_cache.get(cache.digest(source))[1]
+        self.failUnless('<packing>' in translation.xml)
+
+        b1 = p.get_by_name("b1")
+        b2 = p.get_by_name("b2")
+        self.assertEquals(b1.props.label, "Label")
+        self.failUnless(b1.get_image() is p.get_by_name("image1"))
+        window = b2.get_parent().get_parent()
+        self.assertEquals(window.props.title, "Title & more")
+        self.assertEquals(b2.get_parent().child_get_property(b2, 'expand'),
+                          False)
+        self.assertEquals(p.get_by_name("b3").get_image().props.pixel_size,
+                          32)
+        self.failIf(p.get_by_name("item").get_submenu() is None)
+        self.assertEquals(p.get_by_name("sw").props.hscrollbar_policy,
+                          Gtk.PolicyType.AUTOMATIC)
+        b2.clicked()
+        self.assertEquals(clicked, [b2])
+        self.assertEquals(len(p.objects), 10)
+
+        # Objects modifying a property of their parent can not be
+        # translated, the program is executed instead
+        p = GMLBuilder(native=True)
+        source = 'GtkButton { id: b1; image { pixel_size: 32 } }'
+        p.add_from_string(source)
+        self.assertEquals(cache.xml_cache.get(cache.digest(source)),
+                          (cache.memory_cache.get(cache.digest(source)),
+                           None))
+        self.assertEquals(p.get_by_name("b1").get_image().props.pixel_size,
+                          32)
+
+    def testReload(self):
+        filename = os.path.join(self.tmpdir, 'reload.gml')
+        def write(source):
+            fp = open(filename, 'w')
+            fp.write(source)
+            fp.close()
+        write("""
+        GtkWindow {
+          id: w1
+          title: "Old"
+          GtkVBox {
+            GtkButton { id: b1; label: "1"; packing { expand: false } }
+            GtkButton { id: b2; label: "2"; clicked :: old }
+            GtkLabel { label: "3" }
+          }
+        }""")
+        calls = []
+        old = lambda button: calls.append('old')
+        p = GMLBuilder()
+        p.signals['old'] = old
+        p.signals['new'] = lambda button: calls.append('new')
+        p.add_from_file(filename)
+        w1 = p.get_by_name("w1")
+        box = w1.get_child()
+        b1 = p.get_by_name("b1")
+        b2 = p.get_by_name("b2")
+        # Connected by the application, it stays
+        b2.connect('clicked', old)
+
+        write("""
+        GtkWindow {
+          id: w1
+          GtkVBox {
+            GtkButton { id: b2; label: "Two"; clicked :: new }
+            GtkButton { id: b3; label: "Three" }
+            GtkButton { id: b1; label: "1"; packing { expand: true } }
+          }
+        }""")
+        p.reload_from_file(filename)
+        self.failUnless(p.get_by_name("w1") is w1)
+        self.failUnless(w1.get_child() is box)
+        self.failUnless(p.get_by_name("b1") is b1)
+        self.failUnless(p.get_by_name("b2") is b2)
+        self.assertEquals(w1.props.title, None)
+        self.assertEquals(b2.props.label, "Two")
+        b3 = p.get_by_name("b3")
+        self.assertEquals(box.get_children(), [b2, b3, b1])
+        self.assertEquals(box.child_get_property(b1, "expand"), True)
+        b2.emit('clicked')
+        self.assertEquals(calls, ['old', 'new'])
+        self.assertEquals(len(p.objects), 5)
+
     def testImport(self):
         p = GMLBuilder()
         p.add_from_string("import Gtk; GtkWindow; import Clutter")
@@ -252,5 +756,407 @@ class BoxTest(unittest.TestCase):
         label = children[1]
         self.failUnless(isinstance(label, Gtk.Label))
 
+
+class LineReader(object):
+    def __init__(self, source):
+        self.lines = source.splitlines(True)
+        self.read = 0
+
+    def readline(self):
+        if self.read == len(self.lines):
+            return ''
+        self.read += 1
+        return self.lines[self.read - 1]
+
+
+class GMLLexerTest(unittest.TestCase):
+    def tokenize(self, source):
+        return list(generate_tokens(LineReader(source).readline))
+
+    def testComments(self):
+        tokens = self.tokenize("# comment\nGtkWindow // comment\n")
+        self.assertEquals([t.value for t in tokens], ['GtkWindow'])
+        self.assertEquals(tokens[0].start, (2, 0))
+        self.assertEquals(tokens[0].end, (2, 9))
+
+    def testSignal(self):
+        tokens = self.tokenize("activate:: on_activate")
+        self.assertEquals([(t.kind, t.value) for t in tokens],
+                          [(TOKEN_NAME, 'activate'),
+                           (TOKEN_OP, '::'),
+                           (TOKEN_NAME, 'on_activate')])
+
+    def testString(self):
+        tokens = self.tokenize("""label: "a \\"b\\" // c" """)
+        self.assertEquals(tokens[-1].kind, TOKEN_STRING)
+        self.assertEquals(tokens[-1].value, '"a \\"b\\" // c"')
+
+    def testInvalid(self):
+        self.assertRaises(Exception, self.tokenize, "GtkWindow { @ }")
+
+    def testBuffer(self):
+        source = """# comment
+        GtkWindow { title: "a \\"b\\""
+          // comment
+          GtkButton { label: b1.label; width: -1.5 }
+        }
+        """
+        expected = [(t.kind, t.value, t.start, t.end)
+                    for t in self.tokenize(source)]
+        data = source.encode('utf-8')
+        fd, filename = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+        try:
+            with cache.mapped(filename) as mapped:
+                for buf in [source, data, bytearray(data), memoryview(data),
+                            mapped]:
+                    tokens = [(t.kind, t.value, t.start, t.end)
+                              for t in scan_tokens(buf)]
+                    self.assertEquals(tokens, expected)
+        finally:
+            os.unlink(filename)
+        self.assertRaises(Exception, list, scan_tokens(b"GtkWindow { @ }"))
+
+
+class GMLParserTest(unittest.TestCase):
+    def testParseBuffer(self):
+        source = b'import Gtk\nGtkWindow { GtkButton { label: "Label" } }'
+        ns = GMLParser().parse(source)
+        self.assertEquals(ns.imports[0].name, 'Gtk')
+        button = ns.objects[0].children[0]
+        self.assertEquals(button.properties[0].value, '"Label"')
+
+    def testIterparse(self):
+        fp = LineReader("""import Gtk
+        GtkWindow {
+          GtkButton { label: "Label" }
+        }
+        GtkDialog {
+        }""")
+        nodes = GMLParser().iterparse(fp)
+        import_ = next(nodes)
+        self.failUnless(isinstance(import_, Import))
+        self.assertEquals(import_.name, 'Gtk')
+        window = next(nodes)
+        self.failUnless(isinstance(window, Object))
+        self.assertEquals(window.name, 'GtkWindow')
+        self.assertEquals(window.children[0].name, 'GtkButton')
+        self.assertEquals(fp.read, 4)
+        dialog = next(nodes)
+        self.assertEquals(dialog.name, 'GtkDialog')
+        self.assertRaises(StopIteration, next, nodes)
+
+
+class GMLIncrementalTest(unittest.TestCase):
+    source = """import Gtk
+GtkWindow {
+  title: "Window"
+  GtkVBox {
+    GtkLabel { label: "Label" }
+    GtkButton { label: "Button"; image: GtkImage { stock: "gtk-ok" } }
+  }
+}
+GtkDialog { }
+"""
+
+    def assertParsed(self, doc):
+        ns = GMLParser().parse(LineReader(doc.source))
+        self.assertEquals(cache.dumps(doc.ns), cache.dumps(ns))
+
+    def testEdit(self):
+        doc = Document(self.source)
+        old = doc.ns
+        pos = self.source.index('"Button"') + 1
+        ns = doc.edit(pos, pos + 6, 'Ok')
+        self.assertParsed(doc)
+        box = ns.objects[0].children[0]
+        self.assertEquals(box.children[1].properties[0].value, '"Ok"')
+        # Only the path to the button is new
+        old_box = old.objects[0].children[0]
+        self.failIf(box is old_box)
+        self.failUnless(box.children[0] is old_box.children[0])
+        self.failUnless(ns.objects[1] is old.objects[1])
+        self.failUnless(ns.imports is old.imports)
+
+        pos = doc.source.index('gtk-ok')
+        doc.edit(pos, pos + 6, 'gtk-cancel')
+        self.assertParsed(doc)
+
+    def testEditStructure(self):
+        doc = Document(self.source)
+        pos = doc.source.index('GtkDialog')
+        doc.edit(pos, pos, 'GtkWindow { GtkLabel }\n')
+        self.assertParsed(doc)
+        self.assertEquals(len(doc.ns.objects), 3)
+        pos = doc.source.index('"Label" }') + 9
+        doc.edit(pos, pos, ' GtkEntry')
+        self.assertParsed(doc)
+        self.assertEquals(len(doc.ns.objects[0].children[0].children), 3)
+
+    def testEditInvalid(self):
+        doc = Document(self.source)
+        pos = self.source.index('GtkVBox {') + 8
+        self.assertRaises(Exception, doc.edit, pos, pos + 1, ':')
+        doc.edit(pos, pos + 1, '{')
+        self.assertParsed(doc)
+
+
+class GMLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = config.cache_dir
+        config.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'test.gml')
+        self.write('GtkWindow { title: "Title"; image: GtkImage { } }')
+
+    def tearDown(self):
+        config.cache_dir = self.cache_dir
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, source):
+        fp = open(self.filename, 'w')
+        fp.write(source)
+        fp.close()
+
+    def testLoad(self):
+        self.assertEquals(cache.load(self.filename), None)
+        ns = cache.compile_file(self.filename)
+        cached = cache.load(self.filename)
+        self.assertEquals(cache.dumps(cached), cache.dumps(ns))
+        self.assertEquals(cached.objects[0].properties[1].value.name,
+                          'GtkImage')
+
+    def testOutOfDate(self):
+        cache.compile_file(self.filename)
+        os.utime(self.filename, (0, 0))
+        self.failUnless(cache.load(self.filename) is not None)
+        self.write('GtkWindow { title: "Other" }')
+        self.assertEquals(cache.load(self.filename), None)
+
+    def testEvict(self):
+        max_size = config.cache_max_size
+        cache.compile_file(self.filename)
+        size = os.path.getsize(cache.cache_filename(self.filename))
+        config.cache_max_size = 3 * size
+        try:
+            for i in range(8):
+                filename = os.path.join(self.tmpdir, '%d.gml' % (i, ))
+                os.rename(self.filename, filename)
+                self.filename = filename
+                cache.compile_file(filename)
+        finally:
+            config.cache_max_size = max_size
+        sizes = [os.path.getsize(os.path.join(config.cache_dir, name))
+                 for name in os.listdir(config.cache_dir)]
+        self.failUnless(sum(sizes) <= 3 * size)
+
+    def testMemoryCache(self):
+        memory_cache = cache.MemoryCache(2)
+        self.assertEquals(memory_cache.get('a'), None)
+        memory_cache.put('a', 1)
+        memory_cache.put('b', 2)
+        self.assertEquals(memory_cache.get('a'), 1)
+        memory_cache.put('c', 3)
+        self.assertEquals(memory_cache.get('b'), None)
+        self.assertEquals(memory_cache.get('a'), 1)
+        self.assertEquals(memory_cache.get('c'), 3)
+        self.assertEquals((memory_cache.hits, memory_cache.misses), (3, 2))
+
+    def testParseFiles(self):
+        filenames = []
+        for i in range(4):
+            filename = os.path.join(self.tmpdir, '%d.gml' % (i, ))
+            fp = open(filename, 'w')
+            fp.write('GtkWindow { title: "%d"; GtkButton { } }' % (i, ))
+            fp.close()
+            filenames.append(filename)
+        pool_min_size = config.parse_pool_min_size
+        config.parse_pool_min_size = 0
+        try:
+            trees = cache.parse_files(filenames, workers=2)
+        finally:
+            config.parse_pool_min_size = pool_min_size
+        self.assertEquals([ns.objects[0].properties[0].value for ns in trees],
+                          ['"0"', '"1"', '"2"', '"3"'])
+        # Stored by the workers
+        for filename in filenames:
+            self.failIf(cache.load(filename) is None)
+        self.assertEquals([cache.dumps(ns) for ns in trees],
+                          [cache.dumps(ns)
+                           for ns in cache.parse_files(filenames, 1)])
+
+
+class GMLProfileTest(unittest.TestCase):
+    def testProfile(self):
+        fd, filename = tempfile.mkstemp(suffix='.gml')
+        os.write(fd, b"""GtkWindow {
+  id: window
+  GtkVBox {
+    GtkButton { label: "One"; clicked:: on_one }
+    GtkButton {
+      label: window.title
+      packing { expand: false }
+    }
+  }
+}
+""")
+        os.close(fd)
+        try:
+            profile = Profile(filename, repeat=2)
+        finally:
+            os.unlink(filename)
+
+        window = profile.entries[0]
+        self.assertEquals(window.label, 'GtkWindow window')
+        self.assertEquals(window.location, '1:1')
+        labels = [(depth, item.label, item.location)
+                  for depth, item in window.walk()]
+        self.assertEquals(labels, [
+            (0, 'GtkWindow window', '1:1'),
+            (1, 'GtkVBox', '3:3'),
+            (2, 'GtkButton', '4:5'),
+            (3, 'label: "One"', '4:17'),
+            (2, 'GtkButton', '5:5'),
+            (3, 'label: window.title', '6:7'),
+            (3, 'packing', '7:7'),
+            (4, 'expand: false', '7:17')])
+        self.failUnless(window.total >= window.self_time > 0)
+        self.assertEquals(profile.top(1), [window])
+        self.assertEquals(profile.stats.counts['new'], 8)
+
+
+class GMLCodegenTest(unittest.TestCase):
+    source = """
+        GtkButton { id: b1; label: b2.label; image: image1 }
+        GtkWindow {
+           id: window
+           title: "Title"
+           GtkVBox {
+             GtkButton {
+               id: b2
+               label: "Label"
+               clicked:: on_clicked
+               packing { expand: false; padding: 2 }
+             }
+           }
+        }
+        GtkImage { id: image1; stock: "gtk-edit" }
+        """
+
+    def testGenerate(self):
+        module = {}
+        exec(codegen.generate(GMLParser().parse(self.source)), module)
+        clicked = []
+        objects = {}
+        toplevels = module['build']({'on_clicked': clicked.append}, objects)
+
+        self.assertEquals(sorted(objects), ['b1', 'b2', 'image1', 'window'])
+        b1, window, image = toplevels
+        self.failUnless(b1 is objects['b1'])
+        self.failUnless(b1.get_image() is image)
+        self.assertEquals(b1.props.label, "Label")
+        self.assertEquals(window.props.title, "Title")
+        b2 = objects['b2']
+        box = b2.get_parent()
+        self.failUnless(box.get_parent() is window)
+        self.assertEquals(box.child_get_property(b2, 'expand'), False)
+        self.assertEquals(box.child_get_property(b2, 'padding'), 2)
+        b2.emit('clicked')
+        self.assertEquals(clicked, [b2])
+
+        # Every call constructs new objects
+        self.failIf(module['build']({'on_clicked': clicked.append})[0] is b1)
+
+    def testCompileFile(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'window.gml')
+            fp = open(filename, 'w')
+            fp.write(self.source)
+            fp.close()
+            output = codegen.compile_file(filename)
+            self.assertEquals(output, os.path.join(tmpdir, 'window.py'))
+            module = {}
+            exec(open(output).read(), module)
+            objects = {}
+            module['build']({'on_clicked': len}, objects)
+            self.assertEquals(objects['b1'].props.label, "Label")
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def testCompileFileNames(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name in ['gtk3-demo.gml', 'main.gml']:
+                fp = open(os.path.join(tmpdir, name), 'w')
+                fp.write(self.source)
+                fp.close()
+            output = codegen.compile_file(os.path.join(tmpdir,
+                                                       'gtk3-demo.gml'))
+            self.assertEquals(output, os.path.join(tmpdir, 'gtk3_demo.py'))
+            # Written before by gmltool, it can be written again
+            codegen.compile_file(os.path.join(tmpdir, 'gtk3-demo.gml'))
+
+            main = os.path.join(tmpdir, 'main.py')
+            fp = open(main, 'w')
+            fp.write('import gtk3_demo\n')
+            fp.close()
+            self.assertRaises(Exception, codegen.compile_dir, tmpdir)
+            self.assertEquals(open(main).read(), 'import gtk3_demo\n')
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class FakeBackendTest(unittest.TestCase):
+    def setUp(self):
+        from gml import fake
+        self.GObject = fake.GObject
+        self.Gtk = fake.Gtk
+
+    def testTypes(self):
+        GObject, Gtk = self.GObject, self.Gtk
+        gtype = GObject.type_from_name('GtkVBox')
+        self.failUnless(gtype.pytype is Gtk.VBox)
+        self.failUnless(GObject.type_is_a(gtype, Gtk.Container.__gtype__))
+        self.assertEquals(GObject.type_parent(gtype), Gtk.Box.__gtype__)
+        self.assertRaises(RuntimeError, GObject.type_from_name, 'GtkFoo')
+        pspec = Gtk.ScrolledWindow.props.hscrollbar_policy
+        self.failUnless(pspec.value_type is Gtk.PolicyType.__gtype__)
+        self.assertEquals(pspec.default_value, Gtk.POLICY_ALWAYS)
+
+    def testSignals(self):
+        Gtk = self.Gtk
+        button = Gtk.Button()
+        clicks = []
+        handler_id = button.connect('clicked', clicks.append)
+        button.clicked()
+        button.disconnect(handler_id)
+        button.clicked()
+        self.assertEquals(clicks, [button])
+
+        notified = []
+        button.connect('notify', lambda obj, pspec: notified.append(
+            pspec.name))
+        button.freeze_notify()
+        button.props.label = 'a'
+        button.props.label = 'b'
+        self.assertEquals(notified, [])
+        button.thaw_notify()
+        self.assertEquals(notified, ['label'])
+
+    def testChildProperties(self):
+        Gtk = self.Gtk
+        box = Gtk.VBox()
+        label = Gtk.Label()
+        Gtk.Buildable.add_child(box, Gtk.Builder(), label, None)
+        self.failUnless(label.get_parent() is box)
+        self.assertEquals(box.child_get_property(label, 'expand'), True)
+        box.child_set_property(label, 'expand', False)
+        self.assertEquals(box.child_get_property(label, 'expand'), False)
+        self.assertEquals(sorted([pspec.name for pspec in
+                                  box.list_child_properties()]),
+                          ['expand', 'fill', 'padding'])
+
 unittest.main()
 